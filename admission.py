@@ -0,0 +1,245 @@
+# admission.py
+"""
+Admission control for incoming receipts.
+
+At month end many users send receipts at once. Without limits every upload is
+downloaded and buffered, and OCR requests pile up behind the engines until
+everyone waits minutes. Three limits keep the wait bounded, and the user is
+told right away what is happening:
+
+* ``admit_upload`` wraps the upload handlers and runs before any bytes are
+  downloaded. A user with USER_PENDING_LIMIT updates already waiting is told to
+  send later. When the global upload rate (UPLOAD_RATE_PER_SECOND, bursts of
+  UPLOAD_BURST) is exceeded or the OCR line is full, the user gets a "busy"
+  reply and the upload is retried automatically every ADMISSION_RETRY_SECONDS,
+  up to ADMISSION_MAX_RETRIES times. It also keeps the user's updates in order,
+  so it replaces ordered_per_user on the handlers it wraps; a deferred upload
+  keeps its place in the user's line while it waits.
+* ``ocr_queue`` hands out the OCR_CONCURRENCY OCR slots to at most
+  OCR_QUEUE_LIMIT waiting requests, in priority order with aging (retries, then
+  single receipts, then albums; see ocr_priority). A receipt that has to wait
+  is told its position in line; when the line is full the user sees "busy,
+  retrying automatically" while the same retry policy applies.
+
+Counters in /metrics: admission_queued (and admission_queued_<class>),
+admission_deferred, admission_shed, admission_shed_user_limit; the gauge ocr_queue_waiting shows the current line.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import functools
+import itertools
+from contextlib import asynccontextmanager
+
+import health
+import ocr_priority
+from dispatch import OCR_CONCURRENCY, user_locks
+
+OCR_QUEUE_LIMIT = int(os.getenv("OCR_QUEUE_LIMIT", "20"))
+USER_PENDING_LIMIT = int(os.getenv("USER_PENDING_LIMIT", "3"))
+UPLOAD_RATE_PER_SECOND = float(os.getenv("UPLOAD_RATE_PER_SECOND", "2"))
+UPLOAD_BURST = int(os.getenv("UPLOAD_BURST", "30"))
+ADMISSION_RETRY_SECONDS = float(os.getenv("ADMISSION_RETRY_SECONDS", "10"))
+ADMISSION_MAX_RETRIES = int(os.getenv("ADMISSION_MAX_RETRIES", "6"))
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised when a receipt is shed after the automatic retries ran out."""
+
+
+class RateLimiter:
+    """Token bucket: ``rate`` admissions per second, up to ``burst`` at once."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        """Seconds until the next token is available"""
+        self._refill()
+        if self._tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class OcrQueue:
+    """
+    OCR slots with a bounded waiting line ordered by priority (see ocr_priority).
+
+    Waiting requests are kept in a heap keyed by their virtual-clock key, so
+    retries and single receipts go ahead of albums while older requests still
+    age their way to the front.
+    """
+
+    def __init__(self, capacity, limit, clock=time.monotonic):
+        self.capacity = capacity
+        self.limit = limit
+        self._running = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._virtual_clock = ocr_priority.VirtualClock(clock)
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def full(self):
+        return self._running >= self.capacity and len(self._waiters) >= self.limit
+
+    def _report(self):
+        health.set_gauge("ocr_queue_waiting", len(self._waiters))
+
+    def _release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                # The slot passes straight to the next request in line
+                waiter.set_result(None)
+                self._report()
+                return
+        self._running -= 1
+        self._report()
+
+    def _remove(self, waiter):
+        self._waiters = [entry for entry in self._waiters if entry[2] is not waiter]
+        heapq.heapify(self._waiters)
+        self._report()
+
+    async def _wait_turn(self, waiter):
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, job_class=ocr_priority.INTERACTIVE, cost=1, on_queued=None, on_busy=None):
+        """
+        Hold one OCR slot for the body of the ``async with``.
+
+        ``job_class`` and ``cost`` (in receipts) set the place in line.
+        ``on_queued(position)`` is awaited when the request has to wait, and
+        ``on_busy()`` once when the line is full and admission is being retried.
+        Raises Overloaded when the line stays full through every retry.
+        """
+        attempt = 0
+        while self.full():
+            if attempt >= ADMISSION_MAX_RETRIES:
+                health.incr("admission_shed")
+                raise Overloaded("OCR queue is full")
+            if attempt == 0:
+                health.incr("admission_deferred")
+                if on_busy:
+                    await on_busy()
+            attempt += 1
+            await asyncio.sleep(ADMISSION_RETRY_SECONDS)
+
+        key = self._virtual_clock.key(job_class, cost)
+        if self._running < self.capacity and not self._waiters:
+            self._running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (key, next(self._sequence), waiter))
+            self._report()
+            health.incr("admission_queued")
+            health.incr(f"admission_queued_{job_class}")
+            try:
+                if on_queued:
+                    await on_queued(sum(1 for entry in self._waiters if entry[0] <= key))
+            except Exception as e:
+                logger.warning(f"Queue position message failed: {e}")
+            await self._wait_turn(waiter)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+upload_limiter = RateLimiter(UPLOAD_RATE_PER_SECOND, UPLOAD_BURST)
+ocr_queue = OcrQueue(OCR_CONCURRENCY, OCR_QUEUE_LIMIT)
+_deferred_uploads = set()
+
+
+def admit_upload(callback):
+    """
+    Apply admission control to an upload handler before it downloads anything,
+    and run it in order with the user's other updates (like ordered_per_user).
+    """
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        return await _admit(callback, update, context)
+    return wrapper
+
+
+async def _admit(callback, update, context):
+    message = update.effective_message
+    user = update.effective_user
+    if user is None or message is None:
+        return await callback(update, context)
+    # Album parts are only collected here; the whole album is admitted at OCR time
+    if message.media_group_id:
+        async with user_locks.hold(user.id):
+            return await callback(update, context)
+
+    if user_locks.pending(user.id) >= USER_PENDING_LIMIT:
+        health.incr("admission_shed_user_limit")
+        await message.reply_text("✋ Still working on your earlier receipts. Send this one again once they are done.")
+        return
+
+    if not ocr_queue.full() and upload_limiter.try_acquire():
+        async with user_locks.hold(user.id):
+            return await callback(update, context)
+
+    health.incr("admission_deferred")
+    await message.reply_text("🚦 Lots of receipts right now. Yours will be picked up automatically, no need to resend.")
+    # Retried in the background so a waiting upload does not hold one of the
+    # bot's concurrent update slots; it takes its place in the user's line now,
+    # so the user's later updates still run after it
+    task = asyncio.create_task(_retry(callback, update, context))
+    _deferred_uploads.add(task)
+    task.add_done_callback(_deferred_uploads.discard)
+    # Let the task queue on the user's lock before this update counts as handled
+    await asyncio.sleep(0)
+
+
+async def _retry(callback, update, context):
+    message = update.effective_message
+    user = update.effective_user
+    try:
+        async with user_locks.hold(user.id):
+            for attempt in range(1, ADMISSION_MAX_RETRIES + 1):
+                await asyncio.sleep(max(ADMISSION_RETRY_SECONDS, upload_limiter.retry_after()))
+                if not ocr_queue.full() and upload_limiter.try_acquire():
+                    return await callback(update, context)
+            health.incr("admission_shed")
+            logger.warning(f"🚦 Upload from user {user.id} shed after {ADMISSION_MAX_RETRIES} retries")
+            await message.reply_text("🚦 Still too busy to read this receipt. Please send it again in a few minutes.")
+    except Exception as e:
+        logger.error(f"❌ Deferred upload from user {user.id} failed: {e}", exc_info=True)
+        try:
+            await message.reply_text("❌ Could not read this receipt. Please send it again.")
+        except Exception as reply_error:
+            logger.warning(f"Could not tell user {user.id} about the failed upload: {reply_error}")
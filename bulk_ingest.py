@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Offline bulk OCR ingester for backlog folders and archives.
+
+Walks a directory, .zip or .tar(.gz) archive of receipt screenshots, runs them
+through the same OCR + field extraction used by the Telegram bot in a pool of
+worker processes and bulk-loads the results into extracted_receipts with COPY.
+
+Progress is checkpointed after every batch so an interrupted run can be resumed:
+
+    python bulk_ingest.py /data/receipts --category PhonePe --checkpoint backfill.jsonl
+
+While the bot is serving users, pass --enqueue instead: every new image becomes
+an ocr_jobs row in the bulk priority class, and the ocr-worker processes run it
+in the gaps between retries, single receipts and albums (see ocr_priority).
+The local worker pool is for offline backfills with no ocr-worker running.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tarfile
+import zipfile
+import multiprocessing
+from io import BytesIO
+
+from database import init_db, insert_extracted_receipt, copy_extracted_receipts, get_existing_image_hashes
+from dedup import image_hash
+import ocr_priority
+import thread_budget
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+# ---------- Sources ----------
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_sources(source):
+    """Yield (key, handle) pairs; read_source(handle) returns the image bytes."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if is_image_name(name):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, source), path
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image_name(info.filename):
+                    yield f"{os.path.basename(source)}::{info.filename}", (archive, info.filename)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and is_image_name(member.name):
+                    yield f"{os.path.basename(source)}::{member.name}", (archive, member)
+    elif os.path.isfile(source) and is_image_name(source):
+        yield os.path.basename(source), source
+    else:
+        raise ValueError(f"Unsupported source: {source}")
+
+
+def read_source(handle):
+    if isinstance(handle, str):
+        with open(handle, 'rb') as f:
+            return f.read()
+    archive, member = handle
+    if isinstance(archive, zipfile.ZipFile):
+        return archive.read(member)
+    return archive.extractfile(member).read()
+
+
+# ---------- Checkpointing ----------
+def load_checkpoint(path, retry_failed=False):
+    done = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            # Queued jobs are tracked in ocr_jobs from then on
+            if retry_failed and entry.get("status") not in ("ok", "queued"):
+                continue
+            done.add(entry["key"])
+    return done
+
+
+def append_checkpoint(path, entries):
+    if not path:
+        return
+    with open(path, 'a', encoding='utf-8') as f:
+        for key, status in entries:
+            f.write(json.dumps({"key": key, "status": status}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ---------- OCR workers ----------
+def init_worker():
+    """Each worker process builds its own OCR engine; receipt_ocr does not import the bot."""
+    global receipt_ocr
+    import receipt_ocr
+
+
+def ocr_one(job):
+    key, image_bytes, digest, category, min_chars = job
+    try:
+        text = receipt_ocr.extract_text_from_image(BytesIO(image_bytes))
+        if not text or len(text.strip()) < min_chars:
+            return key, None, "no_text"
+        fields = receipt_ocr.extract_fields(text, category)
+        fields["image_hash"] = digest
+        return key, fields, "ok"
+    except Exception as e:
+        return key, None, f"error: {e}"
+
+
+# ---------- Loading ----------
+def store_results(results, user_id, category, use_copy=True):
+    records = [(user_id, category, fields) for _, fields, status in results if status == "ok"]
+    if not records:
+        return True
+    if use_copy:
+        return copy_extracted_receipts(records) is not None
+    return all(insert_extracted_receipt(uid, cat, fields) for uid, cat, fields in records)
+
+
+def run(args):
+    done = load_checkpoint(args.checkpoint, args.retry_failed)
+    if done:
+        logger.info(f"Resuming: {len(done)} files already processed")
+    if args.enqueue:
+        return run_enqueue(args, done)
+
+    # Each spawned worker sizes its native thread pools for its share of the cores
+    os.environ["THREAD_BUDGET_PROCESSES"] = str(max(1, thread_budget.env_int("THREAD_BUDGET_PROCESSES", 1)) * args.workers)
+    ctx = multiprocessing.get_context("spawn")
+    totals = {"ok": 0, "no_text": 0, "duplicate": 0, "error": 0}
+    started = time.time()
+
+    with ctx.Pool(processes=args.workers, initializer=init_worker) as pool:
+        for source in args.sources:
+            batch = []
+            for key, handle in iter_sources(source):
+                if key in done:
+                    continue
+                image_bytes = read_source(handle)
+                batch.append((key, image_bytes, image_hash(image_bytes), args.category, args.min_chars))
+                if len(batch) >= args.batch_size:
+                    process_batch(pool, batch, args, totals)
+                    batch = []
+            if batch:
+                process_batch(pool, batch, args, totals)
+
+    elapsed = time.time() - started
+    processed = sum(totals.values())
+    logger.info("=" * 70)
+    logger.info(f"✅ Done: {processed} files in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} files/s)")
+    logger.info(f"   saved={totals['ok']} duplicates={totals['duplicate']} no_text={totals['no_text']} errors={totals['error']}")
+    return 0 if totals["error"] == 0 else 1
+
+
+def run_enqueue(args, done):
+    """Queue every new image as a bulk OCR job for the ocr-worker processes."""
+    from job_queue import init_job_queue
+
+    init_job_queue()
+    totals = {"queued": 0, "duplicate": 0, "error": 0}
+    for source in args.sources:
+        batch = []
+        for key, handle in iter_sources(source):
+            if key in done:
+                continue
+            image_bytes = read_source(handle)
+            batch.append((key, image_bytes, image_hash(image_bytes), args.category, args.min_chars))
+            if len(batch) >= args.batch_size:
+                enqueue_batch(batch, args, totals)
+                batch = []
+        if batch:
+            enqueue_batch(batch, args, totals)
+
+    logger.info("=" * 70)
+    logger.info(f"✅ Queued {totals['queued']} receipts as bulk OCR jobs — duplicates={totals['duplicate']} errors={totals['error']}")
+    return 0 if totals["error"] == 0 else 1
+
+
+def enqueue_batch(batch, args, totals):
+    from job_queue import enqueue_ocr_job
+
+    jobs, entries = split_duplicates(batch)
+    for key, image_bytes, digest, category, min_chars in jobs:
+        # No chat to reply to; the worker only stores the receipt
+        if enqueue_ocr_job(args.user_id, None, None, category, image_bytes, job_class=ocr_priority.BULK):
+            entries.append((key, "queued"))
+        else:
+            entries.append((key, "error: enqueue failed"))
+
+    for key, status in entries:
+        bucket = status if status in ("queued", "duplicate") else "error"
+        totals[bucket] += 1
+    append_checkpoint(args.checkpoint, entries)
+    logger.info(f"📥 Batch of {len(batch)} queued — queued={totals['queued']} duplicates={totals['duplicate']} errors={totals['error']}")
+
+
+def split_duplicates(batch, dry_run=False):
+    """Jobs to OCR, and (key, "duplicate") results for images already stored (same bytes)"""
+    existing = set() if dry_run else get_existing_image_hashes({job[2] for job in batch})
+    jobs = []
+    results = []
+    for job in batch:
+        if job[2] in existing:
+            results.append((job[0], "duplicate"))
+        else:
+            existing.add(job[2])
+            jobs.append(job)
+    return jobs, results
+
+
+def process_batch(pool, batch, args, totals):
+    # Images already stored (same bytes) are skipped before OCR
+    jobs, duplicates = split_duplicates(batch, args.dry_run)
+    results = [(key, None, status) for key, status in duplicates]
+    if jobs:
+        results += pool.map(ocr_one, jobs, chunksize=max(1, len(jobs) // (args.workers * 4)))
+
+    if args.dry_run:
+        for key, fields, status in results:
+            logger.info(f"{key}: {status} {fields or ''}")
+    elif not store_results(results, args.user_id, args.category, use_copy=not args.no_copy):
+        raise RuntimeError("Database load failed; checkpoint not advanced for this batch")
+
+    entries = []
+    for key, fields, status in results:
+        bucket = status if status in ("ok", "no_text", "duplicate") else "error"
+        totals[bucket] += 1
+        if bucket == "error":
+            logger.warning(f"⚠️ {key}: {status}")
+        entries.append((key, status))
+    if not args.dry_run:
+        append_checkpoint(args.checkpoint, entries)
+
+    logger.info(f"📦 Batch of {len(batch)} done — saved={totals['ok']} duplicates={totals['duplicate']} no_text={totals['no_text']} errors={totals['error']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk OCR ingestion of receipt images into extracted_receipts")
+    parser.add_argument("sources", nargs="+", help="Directories, .zip/.tar archives or image files")
+    parser.add_argument("--category", default="Others", help="Category stored for every receipt (e.g. PhonePe, gstbill_Paytm)")
+    parser.add_argument("--user-id", type=int, default=0, help="user_id stored for every receipt")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="OCR worker processes")
+    parser.add_argument("--batch-size", type=int, default=200, help="Files per OCR/load/checkpoint batch")
+    parser.add_argument("--checkpoint", default="bulk_ingest.checkpoint.jsonl", help="Checkpoint file used to resume runs")
+    parser.add_argument("--retry-failed", action="store_true", help="Reprocess files that previously failed or had no text")
+    parser.add_argument("--min-chars", type=int, default=10, help="Minimum OCR text length to accept a receipt")
+    parser.add_argument("--no-copy", action="store_true", help="Insert row by row instead of COPY")
+    parser.add_argument("--dry-run", action="store_true", help="Run OCR and print fields without writing to the database")
+    parser.add_argument("--enqueue", action="store_true", help="Queue bulk-priority OCR jobs for the ocr-worker processes instead of running OCR here")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.enqueue and args.dry_run:
+        sys.exit("--enqueue and --dry-run cannot be combined")
+    if not args.dry_run:
+        init_db()
+    try:
+        sys.exit(run(args))
+    except KeyboardInterrupt:
+        logger.info("Interrupted; rerun the same command to resume from the checkpoint")
+        sys.exit(130)
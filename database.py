@@ -1,9 +1,18 @@
 # database.py
 import os
+import io
+import csv
 import logging
+import threading
+import time
+import select
+from concurrent.futures import Future
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+from dedup import normalize_transaction_id
+
 # Load environment variables
 load_dotenv()
 
@@ -111,6 +120,72 @@ def init_db():
                 ADD COLUMN status VARCHAR(10) DEFAULT 'pending';
             ''')
             logging.info("✅ Added status column to users table")
+
+        # Duplicate detection columns for extracted_receipts
+        cur.execute('''
+            ALTER TABLE extracted_receipts
+            ADD COLUMN IF NOT EXISTS transaction_id_norm TEXT,
+            ADD COLUMN IF NOT EXISTS image_hash CHAR(64);
+        ''')
+        cur.execute('''
+            UPDATE extracted_receipts
+            SET transaction_id_norm = NULLIF(UPPER(regexp_replace(transaction_id, '[^A-Za-z0-9]', '', 'g')), '')
+            WHERE transaction_id_norm IS NULL
+              AND transaction_id IS NOT NULL
+              AND UPPER(regexp_replace(transaction_id, '[^A-Za-z0-9]', '', 'g')) NOT IN ('NOTFOUND', 'UNKNOWN', 'NONE');
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_extracted_receipts_image_hash
+            ON extracted_receipts (image_hash);
+        ''')
+        cur.execute("SAVEPOINT txn_norm_index;")
+        try:
+            cur.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_extracted_receipts_txn_norm
+                ON extracted_receipts (transaction_id_norm);
+            ''')
+        except psycopg2.IntegrityError:
+            cur.execute("ROLLBACK TO SAVEPOINT txn_norm_index;")
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_extracted_receipts_txn_norm
+                ON extracted_receipts (transaction_id_norm);
+            ''')
+            logging.warning("⚠️ Existing duplicate transaction IDs found; created a non-unique index. Remove duplicates and restart to enforce uniqueness.")
+
+        init_status_rollup(cur)
+
+        # Tell every process caching the email allow-list that it changed
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION notify_email_list_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('email_list_changed', '');
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_email_list_changed ON email;
+            CREATE TRIGGER trg_email_list_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON email
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_email_list_changed();
+        ''')
+
+        # Admin user listing: keyset pages per status, newest first
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_users_status_created
+            ON users (status, created_at DESC, id DESC);
+        ''')
+        # Substring search on username/email; pg_trgm may not be installable everywhere
+        cur.execute("SAVEPOINT users_search_index;")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_search_trgm
+                ON users USING gin ((username || ' ' || email) gin_trgm_ops);
+            ''')
+            cur.execute("RELEASE SAVEPOINT users_search_index;")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT users_search_index;")
+            logging.warning(f"⚠️ pg_trgm unavailable, user search will scan the users table: {e}")
             
         conn.commit()
         cur.close()
@@ -118,6 +193,89 @@ def init_db():
         logging.info("✅ Database initialized successfully.")
     except Exception as e:
         logging.error(f"❌ Error initializing database: {e}")
+        return False
+
+    add_signature_image_column()
+    return True
+
+def init_status_rollup(cur):
+    """
+    Hourly per-status receipt counters, maintained by triggers on
+    extracted_receipts so every write path (single insert, bulk/COPY load,
+    save_voucher completing a receipt) keeps them exact. Summaries read
+    O(hours) rollup rows instead of scanning receipts. The triggers are
+    installed, and the counters rebuilt, only when pg_trigger shows them
+    missing, so a normal start takes no table lock.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS receipt_status_hourly (
+            hour TIMESTAMP NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, status)
+        );
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_extracted_receipts_status_created
+        ON extracted_receipts (status, created_at DESC);
+    ''')
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION receipt_status_rollup() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE receipt_status_hourly SET count = count - 1
+                WHERE hour = date_trunc('hour', OLD.created_at)
+                  AND status = LOWER(COALESCE(OLD.status, 'pending'));
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO receipt_status_hourly (hour, status, count)
+                VALUES (date_trunc('hour', NEW.created_at), LOWER(COALESCE(NEW.status, 'pending')), 1)
+                ON CONFLICT (hour, status) DO UPDATE SET count = receipt_status_hourly.count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    ''')
+
+    # Concurrent starts (bot, workers, gunicorn master) install the triggers once
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('receipt_status_rollup'));")
+    cur.execute('''
+        SELECT COUNT(*) FROM pg_trigger
+        WHERE tgrelid = 'extracted_receipts'::regclass
+          AND tgname IN ('trg_receipt_status_rollup_write', 'trg_receipt_status_rollup_update');
+    ''')
+    if cur.fetchone()[0] == 2:
+        return
+
+    # Installing: block writes until the triggers and the rebuilt counters agree
+    cur.execute("LOCK TABLE extracted_receipts IN SHARE ROW EXCLUSIVE MODE;")
+    # Status queries compare with lowercase literals so they can use the status index
+    cur.execute("UPDATE extracted_receipts SET status = LOWER(status) WHERE status <> LOWER(status);")
+    if cur.rowcount:
+        logging.info(f"✅ Normalized the status case of {cur.rowcount} receipts")
+    cur.execute('''
+        DROP TRIGGER IF EXISTS trg_receipt_status_rollup_write ON extracted_receipts;
+        CREATE TRIGGER trg_receipt_status_rollup_write
+        AFTER INSERT OR DELETE ON extracted_receipts
+        FOR EACH ROW EXECUTE FUNCTION receipt_status_rollup();
+
+        DROP TRIGGER IF EXISTS trg_receipt_status_rollup_update ON extracted_receipts;
+        CREATE TRIGGER trg_receipt_status_rollup_update
+        AFTER UPDATE OF status, created_at ON extracted_receipts
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+        EXECUTE FUNCTION receipt_status_rollup();
+    ''')
+
+    # Counters kept while a trigger was missing cannot be trusted; rebuild them
+    cur.execute("DELETE FROM receipt_status_hourly;")
+    cur.execute('''
+        INSERT INTO receipt_status_hourly (hour, status, count)
+        SELECT date_trunc('hour', created_at), LOWER(COALESCE(status, 'pending')), COUNT(*)
+        FROM extracted_receipts
+        GROUP BY 1, 2;
+    ''')
+    logging.info(f"✅ Installed receipt status triggers and backfilled {cur.rowcount} hourly rows")
 
 def add_signature_image_column():
     """Add signature_image column to users table if it doesn't exist"""
@@ -139,51 +297,210 @@ def add_signature_image_column():
             ''')
             logging.info("✅ Added signature_image column to users table")
             
+        # Content hash of the normalized signature; names the cacheable /signature/<hash>.png asset
+        cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS signature_hash VARCHAR(64);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_signature_hash ON users (signature_hash);")
+            
         conn.commit()
         cur.close()
         conn.close()
     except Exception as e:
         logging.error(f"❌ Error adding signature_image column: {e}")
 
-# Call this function after init_db to ensure column exists
-add_signature_image_column()
-
 def insert_extracted_receipt(user_id, category, fields):
-    """Insert extracted receipt data and return the record ID"""
+    """Insert extracted receipt data and return the record ID (the existing one for a duplicate transaction)"""
+    record_ids = insert_extracted_receipts_bulk([(user_id, category, fields)])
+    return record_ids[0] if record_ids else None
+
+def receipt_row(user_id, category, fields):
+    """Column values of one extracted_receipts row, in RECEIPT_COLUMNS order"""
+    return (
+        user_id,
+        category,
+        fields.get("Amount"),
+        fields.get("Date & Time"),
+        fields.get("Transaction ID"),
+        fields.get("Person Name"),
+        fields.get("UPI ID"),
+        fields.get("status", "pending"),
+        normalize_transaction_id(fields.get("Transaction ID")),
+        fields.get("image_hash")
+    )
+
+RECEIPT_COLUMNS = "user_id, category, amount, datetime, transaction_id, person_name, upi_id, status, transaction_id_norm, image_hash"
+
+def insert_extracted_receipts_bulk(records, use_copy=False):
+    """
+    Insert many (user_id, category, fields) records inside one transaction.
+
+    IDs are reserved from the table sequence up front, so the returned list is
+    in the same order as ``records`` for both the multi-row INSERT and the
+    COPY FROM STDIN path. Records whose normalized transaction ID already
+    exists (in the table or earlier in the batch) are not written again; their
+    slot holds the ID of the existing row. Both paths skip rows another writer
+    stored in the meantime (COPY loads a staging table that is then inserted
+    with ON CONFLICT DO NOTHING).
+
+    Returns:
+        list: Record IDs in input order, or None if the batch failed
+    """
+    if not records:
+        return []
     try:
         conn = psycopg2.connect(**DATABASE_CONFIG)
         cur = conn.cursor()
-        
-        # ✅ FIXED: Add RETURNING id to get the inserted record ID
-        cur.execute('''
-            INSERT INTO extracted_receipts (
-                user_id, category, amount, datetime, transaction_id, person_name, upi_id, status
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id;
-        ''', (
-            user_id,
-            category,
-            fields.get("Amount"),
-            fields.get("Date & Time"),
-            fields.get("Transaction ID"),
-            fields.get("Person Name"),
-            fields.get("UPI ID"),
-            fields.get("status", "pending")  # Default to 'pending'
-        ))
-        
-        # ✅ FIXED: Get the returned record ID
-        record_id = cur.fetchone()[0]
-        
+
+        norms = [normalize_transaction_id(fields.get("Transaction ID")) for _, _, fields in records]
+        known = {}
+        wanted = list({norm for norm in norms if norm})
+        if wanted:
+            cur.execute('''
+                SELECT transaction_id_norm, id
+                FROM extracted_receipts
+                WHERE transaction_id_norm = ANY(%s);
+            ''', (wanted,))
+            known = dict(cur.fetchall())
+
+        new_indexes = []
+        for index, norm in enumerate(norms):
+            if norm and norm in known:
+                continue
+            if norm:
+                known[norm] = None  # claimed by this batch
+            new_indexes.append(index)
+
+        record_ids = [None] * len(records)
+        lost = set()
+        if new_indexes:
+            cur.execute('''
+                SELECT nextval(pg_get_serial_sequence('extracted_receipts', 'id'))
+                FROM generate_series(1, %s);
+            ''', (len(new_indexes),))
+            reserved = sorted(row[0] for row in cur.fetchall())
+            rows = []
+            for record_id, index in zip(reserved, new_indexes):
+                record_ids[index] = record_id
+                if norms[index]:
+                    known[norms[index]] = record_id
+                rows.append((record_id,) + receipt_row(*records[index]))
+
+            if use_copy:
+                # COPY has no ON CONFLICT, so it goes through a staging table
+                cur.execute("CREATE TEMP TABLE receipt_copy (LIKE extracted_receipts) ON COMMIT DROP;")
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cur.copy_expert(f'''
+                    COPY receipt_copy (id, {RECEIPT_COLUMNS})
+                    FROM STDIN WITH (FORMAT csv)
+                ''', buffer)
+                cur.execute(f'''
+                    INSERT INTO extracted_receipts (id, {RECEIPT_COLUMNS})
+                    SELECT id, {RECEIPT_COLUMNS} FROM receipt_copy
+                    ON CONFLICT DO NOTHING
+                    RETURNING id;
+                ''')
+                written = cur.fetchall()
+            else:
+                written = execute_values(cur, f'''
+                    INSERT INTO extracted_receipts (id, {RECEIPT_COLUMNS})
+                    VALUES %s
+                    ON CONFLICT DO NOTHING
+                    RETURNING id;
+                ''', rows, page_size=1000, fetch=True)
+            lost = set(reserved) - {row[0] for row in written}
+            if lost:
+                # Another writer stored the same transaction concurrently
+                lost_norms = [norms[i] for i in new_indexes if record_ids[i] in lost]
+                cur.execute('''
+                    SELECT transaction_id_norm, id
+                    FROM extracted_receipts
+                    WHERE transaction_id_norm = ANY(%s);
+                ''', (lost_norms,))
+                known.update(cur.fetchall())
+
+        for index, norm in enumerate(norms):
+            if record_ids[index] is None or record_ids[index] in lost:
+                record_ids[index] = known.get(norm)
+
         conn.commit()
         cur.close()
         conn.close()
-        
-        logging.info(f"📝 Receipt inserted into database with ID: {record_id}")
-        return record_id  # ✅ FIXED: Return the record ID
-        
+
+        written_count = len(new_indexes) - len(lost)
+        logging.info(f"📝 {written_count} receipts {'copied' if use_copy else 'inserted'} into database ({len(records) - written_count} duplicates skipped)")
+        return record_ids
+
     except Exception as e:
-        logging.error(f"❌ Failed to insert receipt: {e}")
-        return None  # Return None if insertion fails
+        logging.error(f"❌ Failed to insert receipt batch of {len(records)}: {e}")
+        return None
+
+def insert_extracted_receipts(user_id, category, fields_list):
+    """Insert many receipts of one user/category and return their IDs in order"""
+    return insert_extracted_receipts_bulk([(user_id, category, fields) for fields in fields_list])
+
+def copy_extracted_receipts(records):
+    """Bulk-load (user_id, category, fields) records with COPY FROM STDIN in one transaction"""
+    record_ids = insert_extracted_receipts_bulk(records, use_copy=True)
+    return len(record_ids) if record_ids is not None else None
+
+class ReceiptWriteBuffer:
+    """
+    Write-behind buffer for extracted_receipts.
+
+    ``submit`` queues a receipt and returns a ``concurrent.futures.Future`` that
+    resolves to its record ID (or None on failure, like insert_extracted_receipt).
+    Queued receipts are written with one bulk insert when ``max_batch`` is reached
+    or every ``flush_interval`` seconds, whichever comes first.
+    """
+
+    def __init__(self, flush_interval=0.5, max_batch=100):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def submit(self, user_id, category, fields):
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("ReceiptWriteBuffer is closed")
+            self._pending.append(((user_id, category, fields), future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="receipt-writer", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._wakeup.set()
+        return future
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        record_ids = insert_extracted_receipts_bulk([record for record, _ in batch])
+        for index, (_, future) in enumerate(batch):
+            future.set_result(record_ids[index] if record_ids else None)
+
+    def close(self):
+        with self._lock:
+            self._stopped = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"❌ Receipt write-behind flush failed: {e}")
 
 def insert_or_update_brochure(data):
     try:
@@ -240,8 +557,170 @@ def get_receipt_by_transaction_id(transaction_id):
         logging.error(f"❌ Failed to get receipt by transaction_id {transaction_id}: {e}")
         return None
 
+def _receipt_lookup(where_clause, value):
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute(f'''
+            SELECT id, transaction_id, category, image_hash
+            FROM extracted_receipts
+            WHERE {where_clause} = %s
+            ORDER BY created_at
+            LIMIT 1;
+        ''', (value,))
+
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+
+        if row:
+            return {
+                'id': row[0],
+                'transaction_id': row[1],
+                'category': row[2],
+                'image_hash': row[3]
+            }
+        return None
+
+    except Exception as e:
+        logging.error(f"❌ Failed to look up receipt by {where_clause}: {e}")
+        return None
+
+def get_receipt_by_transaction_norm(transaction_id_norm):
+    """Get the stored receipt for a normalized transaction ID (see dedup.normalize_transaction_id)"""
+    return _receipt_lookup("transaction_id_norm", transaction_id_norm)
+
+def get_receipt_by_image_hash(image_hash):
+    """Get the first receipt stored from an image with this SHA-256"""
+    return _receipt_lookup("image_hash", image_hash)
+
+def get_existing_image_hashes(image_hashes):
+    """Return the subset of image hashes that are already stored"""
+    if not image_hashes:
+        return set()
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT DISTINCT image_hash
+            FROM extracted_receipts
+            WHERE image_hash = ANY(%s);
+        ''', (list(image_hashes),))
+
+        existing = {row[0] for row in cur.fetchall()}
+        cur.close()
+        conn.close()
+        return existing
+
+    except Exception as e:
+        logging.error(f"❌ Failed to check image hashes: {e}")
+        return set()
+
+def get_status_counts(since):
+    """
+    Receipt counts per status from the hourly rollup, for whole hours starting
+    with the hour that contains ``since`` (same window as get_pending_receipts)
+    """
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT status, SUM(count)
+            FROM receipt_status_hourly
+            WHERE hour >= date_trunc('hour', %s::timestamptz::timestamp)
+            GROUP BY status;
+        ''', (since,))
+        counts = {status: int(total) for status, total in cur.fetchall()}
+
+        cur.close()
+        conn.close()
+        return counts
+
+    except Exception as e:
+        logging.error(f"❌ Failed to get status counts: {e}")
+        return None
+
+def get_status_counts_last_hours(hours):
+    """Per-hour, per-status counts for the last ``hours`` hours, newest first"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT hour, status, count
+            FROM receipt_status_hourly
+            WHERE hour > date_trunc('hour', LOCALTIMESTAMP) - make_interval(hours => %s)
+              AND count <> 0
+            ORDER BY hour DESC, status;
+        ''', (hours,))
+        rows = cur.fetchall()
+
+        cur.close()
+        conn.close()
+        return [{'hour': row[0], 'status': row[1], 'count': row[2]} for row in rows]
+
+    except Exception as e:
+        logging.error(f"❌ Failed to get hourly status counts: {e}")
+        return []
+
+def get_pending_receipts(since, limit=10):
+    """Newest pending receipts (transaction_id, person_name) created since the start of the hour of ``since``"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT transaction_id, person_name
+            FROM extracted_receipts
+            WHERE status = 'pending' AND created_at >= date_trunc('hour', %s::timestamptz::timestamp)
+            ORDER BY created_at DESC
+            LIMIT %s;
+        ''', (since, limit))
+        rows = cur.fetchall()
+
+        cur.close()
+        conn.close()
+        return rows
+
+    except Exception as e:
+        logging.error(f"❌ Failed to get pending receipts: {e}")
+        return []
+
 # User Management Functions
-def register_user(username, email, password, esignature, signature_image=None, status="pending"):
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "10"))
+USER_STATUSES = ('pending', 'accepted', 'rejected')
+
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def _cached_user_query(key, loader):
+    """
+    Short-lived cache for admin listing queries. Writes in this process
+    invalidate it immediately; other processes see changes within USER_CACHE_TTL.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    value = loader()
+    if value is not None:
+        with _user_cache_lock:
+            if len(_user_cache) >= 512:
+                _user_cache.clear()
+            _user_cache[key] = (now + USER_CACHE_TTL, value)
+    return value
+
+def invalidate_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
+def register_user(username, email, password, esignature, signature_image=None, status="pending", signature_hash=None):
     """
     Register a new user with optional signature image and status
     
@@ -251,6 +730,7 @@ def register_user(username, email, password, esignature, signature_image=None, s
         password (str): Hashed password
         esignature (str): Processed signature text (placeholder for drawn signatures)
         signature_image (bytes, optional): Actual signature image data
+        signature_hash (str, optional): Hash of the normalized signature image
         status (str): User status ('pending', 'accepted', 'rejected')
     
     Returns:
@@ -263,10 +743,10 @@ def register_user(username, email, password, esignature, signature_image=None, s
         # Insert user with signature image if provided
         if signature_image:
             cur.execute('''
-                INSERT INTO users (username, email, password, esignature, signature_image, status)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                INSERT INTO users (username, email, password, esignature, signature_image, signature_hash, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
                 RETURNING id;
-            ''', (username, email, password, esignature, signature_image, status))
+            ''', (username, email, password, esignature, signature_image, signature_hash, status))
         else:
             cur.execute('''
                 INSERT INTO users (username, email, password, esignature, status)
@@ -279,6 +759,7 @@ def register_user(username, email, password, esignature, signature_image=None, s
         cur.close()
         conn.close()
         
+        invalidate_user_cache()
         logging.info(f"✅ User {username} ({email}) registered successfully with ID: {user_id} and status: {status}")
         return user_id
         
@@ -451,6 +932,111 @@ def get_rejected_users():
         logging.error(f"❌ Failed to get rejected users: {e}")
         return []
 
+def get_user_status_counts():
+    """Number of users per status from a single aggregate"""
+    def load():
+        try:
+            conn = psycopg2.connect(**DATABASE_CONFIG)
+            cur = conn.cursor()
+
+            cur.execute('''
+                SELECT COUNT(*) FILTER (WHERE status = 'pending'),
+                       COUNT(*) FILTER (WHERE status = 'accepted'),
+                       COUNT(*) FILTER (WHERE status = 'rejected')
+                FROM users;
+            ''')
+            row = cur.fetchone()
+            cur.close()
+            conn.close()
+
+            return dict(zip(USER_STATUSES, row))
+
+        except Exception as e:
+            logging.error(f"❌ Failed to count users by status: {e}")
+            return None
+
+    return _cached_user_query(('counts',), load) or dict.fromkeys(USER_STATUSES, 0)
+
+def get_user_sections(afters=None, limit=50, search=None):
+    """
+    One page of users per status, newest first, plus the number of users in
+    each status, from a single query.
+
+    Keyset pagination: ``afters[status]`` is the (created_at, id) of the last
+    row of that section's previous page, so every page is an index range scan
+    no matter how deep. ``search`` filters pages and counts alike by a
+    case-insensitive substring of username or email.
+
+    Returns:
+        dict: {status: {'users': [...], 'next': (created_at, id) or None, 'count': int}}
+    """
+    afters = afters or {}
+
+    def load():
+        try:
+            conn = psycopg2.connect(**DATABASE_CONFIG)
+            cur = conn.cursor()
+
+            params = {'limit': limit + 1, 'pattern': None}
+            if search:
+                params['pattern'] = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            sections = []
+            for index, status in enumerate(USER_STATUSES):
+                after = afters.get(status) or (None, None)
+                params.update({f'status_{index}': status, f'created_{index}': after[0], f'id_{index}': after[1]})
+                sections.append(f"(%(status_{index})s, %(created_{index})s::timestamp, %(id_{index})s::integer)")
+            matches = "(%(pattern)s::text IS NULL OR (u.username || ' ' || u.email) ILIKE %(pattern)s)"
+
+            cur.execute(f'''
+                SELECT s.status, c.total, p.id, p.username, p.email, p.esignature, p.created_at
+                FROM (VALUES {', '.join(sections)}) AS s (status, after_created, after_id)
+                CROSS JOIN LATERAL (
+                    SELECT COUNT(*) AS total
+                    FROM users u
+                    WHERE u.status = s.status AND {matches}
+                ) c
+                LEFT JOIN LATERAL (
+                    SELECT u.id, u.username, u.email, u.esignature, u.created_at
+                    FROM users u
+                    WHERE u.status = s.status
+                      AND (s.after_created IS NULL OR (u.created_at, u.id) < (s.after_created, s.after_id))
+                      AND {matches}
+                    ORDER BY u.created_at DESC, u.id DESC
+                    LIMIT %(limit)s
+                ) p ON TRUE
+                ORDER BY s.status, p.created_at DESC, p.id DESC;
+            ''', params)
+
+            rows = cur.fetchall()
+            cur.close()
+            conn.close()
+
+            result = {status: {'users': [], 'next': None, 'count': 0} for status in USER_STATUSES}
+            for status, total, user_id, username, email, esignature, created_at in rows:
+                section = result[status]
+                section['count'] = total
+                if user_id is not None:
+                    section['users'].append({
+                        'id': user_id,
+                        'username': username,
+                        'email': email,
+                        'esignature': esignature,
+                        'created_at': created_at
+                    })
+            for section in result.values():
+                if len(section['users']) > limit:
+                    del section['users'][limit:]
+                    last = section['users'][-1]
+                    section['next'] = (last['created_at'], last['id'])
+            return result
+
+        except Exception as e:
+            logging.error(f"❌ Failed to get user sections: {e}")
+            return None
+
+    key = ('sections', tuple(afters.get(status) for status in USER_STATUSES), limit, search)
+    return _cached_user_query(key, load) or {status: {'users': [], 'next': None, 'count': 0} for status in USER_STATUSES}
+
 def update_user_status(user_id, status):
     """Update user status to accepted or rejected"""
     try:
@@ -467,6 +1053,7 @@ def update_user_status(user_id, status):
         cur.close()
         conn.close()
         
+        invalidate_user_cache()
         logging.info(f"✅ User {user_id} status updated to {status}")
         return True
         
@@ -474,6 +1061,73 @@ def update_user_status(user_id, status):
         logging.error(f"❌ Failed to update user {user_id} status: {e}")
         return False
 
+def update_user_password(user_id, password_hash):
+    """Replace a user's stored password hash"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+        
+        cur.execute('''
+            UPDATE users
+            SET password = %s
+            WHERE id = %s;
+        ''', (password_hash, user_id))
+        
+        conn.commit()
+        cur.close()
+        conn.close()
+        
+        logging.info(f"✅ Password hash upgraded for user {user_id}")
+        return True
+        
+    except Exception as e:
+        logging.error(f"❌ Failed to update password for user {user_id}: {e}")
+        return False
+
+def get_signature_image(signature_hash):
+    """Normalized signature PNG stored under ``signature_hash``"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+        
+        cur.execute('''
+            SELECT signature_image
+            FROM users
+            WHERE signature_hash = %s AND signature_image IS NOT NULL
+            LIMIT 1;
+        ''', (signature_hash,))
+        
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        return bytes(row[0]) if row else None
+        
+    except Exception as e:
+        logging.error(f"❌ Failed to get signature {signature_hash}: {e}")
+        return None
+
+def update_user_signature(user_id, signature_image, signature_hash):
+    """Replace a user's signature image with its normalized version"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+        
+        cur.execute('''
+            UPDATE users
+            SET signature_image = %s, signature_hash = %s
+            WHERE id = %s;
+        ''', (psycopg2.Binary(signature_image), signature_hash, user_id))
+        
+        conn.commit()
+        cur.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logging.error(f"❌ Failed to update signature for user {user_id}: {e}")
+        return False
+
 def get_user_by_id(user_id):
     """Get user by ID"""
     try:
@@ -580,6 +1234,7 @@ def add_email(email_address, description=""):
         cur.close()
         conn.close()
         
+        email_allow_list.refresh()
         logging.info(f"✅ Email {email_address} added successfully with ID: {email_id}")
         return email_id
         
@@ -635,6 +1290,7 @@ def update_email(email_id, email_address, description=""):
         cur.close()
         conn.close()
         
+        email_allow_list.refresh()
         logging.info(f"✅ Email ID {email_id} updated successfully")
         return True
         
@@ -657,6 +1313,7 @@ def delete_email(email_id):
         cur.close()
         conn.close()
         
+        email_allow_list.refresh()
         logging.info(f"✅ Email ID {email_id} deleted successfully")
         return True
         
@@ -664,23 +1321,97 @@ def delete_email(email_id):
         logging.error(f"❌ Failed to delete email ID {email_id}: {e}")
         return False
 
+EMAIL_LIST_CHANNEL = "email_list_changed"
+# Seconds without a notification after which the LISTEN connection is probed
+EMAIL_LIST_PROBE_SECONDS = int(os.getenv("EMAIL_LIST_PROBE_SECONDS", "60"))
+
+class EmailAllowList:
+    """
+    In-process copy of the email allow-list.
+
+    The set is loaded once and reloaded lazily after it is marked stale:
+    immediately by add/update/delete_email in this process, and through a
+    LISTEN connection (fed by the trg_email_list_changed trigger) for writes
+    made by other processes. While the listener is disconnected every lookup
+    reloads, so a missed notification can never leave the cache wrong. The
+    listener probes its connection after EMAIL_LIST_PROBE_SECONDS of silence
+    and uses TCP keepalives, so a dead socket is noticed and replaced.
+    """
+
+    def __init__(self):
+        self._emails = None
+        self._stale = True
+        self._listening = False
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def contains(self, email_address):
+        self._ensure_listener()
+        if self._stale or self._emails is None or not self._listening:
+            self._reload()
+        emails = self._emails
+        return emails is not None and email_address in emails
+
+    def refresh(self):
+        self._stale = True
+
+    def _reload(self):
+        with self._lock:
+            if not self._stale and self._emails is not None and self._listening:
+                return
+            # Cleared before querying so a notification arriving meanwhile triggers another reload
+            self._stale = False
+            try:
+                conn = psycopg2.connect(**DATABASE_CONFIG)
+                cur = conn.cursor()
+                cur.execute("SELECT email_address FROM email;")
+                self._emails = frozenset(row[0] for row in cur.fetchall())
+                cur.close()
+                conn.close()
+            except Exception as e:
+                self._stale = True
+                logging.error(f"❌ Failed to load email allow-list: {e}")
+
+    def _ensure_listener(self):
+        if self._listener is None or not self._listener.is_alive():
+            with self._lock:
+                if self._listener is None or not self._listener.is_alive():
+                    self._listener = threading.Thread(target=self._listen, name="email-list-listener", daemon=True)
+                    self._listener.start()
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                # Keepalives let the kernel notice a peer that vanished without closing the socket
+                conn = psycopg2.connect(**DATABASE_CONFIG, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {EMAIL_LIST_CHANNEL};")
+                # Notifications may have been missed while disconnected; start from a fresh copy
+                with self._lock:
+                    self._emails = None
+                    self._stale = True
+                self._listening = True
+                while True:
+                    if select.select([conn], [], [], EMAIL_LIST_PROBE_SECONDS) != ([], [], []):
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self._stale = True
+                    else:
+                        # Quiet for a while: make sure the connection is still alive
+                        cur.execute("SELECT 1;")
+            except Exception as e:
+                logging.error(f"❌ Email allow-list listener failed: {e}")
+            finally:
+                self._listening = False
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(5)
+
+email_allow_list = EmailAllowList()
+
 def email_exists_in_list(email_address):
-    """Check if an email exists in the email list"""
-    try:
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        cur = conn.cursor()
-        
-        cur.execute('''
-            SELECT COUNT(*) FROM email
-            WHERE email_address = %s;
-        ''', (email_address,))
-        
-        count = cur.fetchone()[0]
-        cur.close()
-        conn.close()
-        
-        return count > 0
-        
-    except Exception as e:
-        logging.error(f"❌ Failed to check email existence {email_address}: {e}")
-        return False
+    """Check if an email exists in the email list (served from the in-process allow-list cache)"""
+    return email_allow_list.contains(email_address)
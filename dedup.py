@@ -0,0 +1,97 @@
+# dedup.py
+"""
+Duplicate receipt detection.
+
+Receipts are identified by their normalized transaction ID (unique index in
+extracted_receipts) and by the SHA-256 of the uploaded image bytes. Recently
+seen keys are kept in small in-process LRU indexes so resubmissions are caught
+without a database round trip; misses fall back to an indexed lookup.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+RECENT_RECEIPTS_SIZE = int(os.getenv("DEDUP_RECENT_SIZE", "10000"))
+
+PLACEHOLDER_IDS = {"NOTFOUND", "UNKNOWN", "NONE"}
+
+
+def normalize_transaction_id(transaction_id):
+    """Canonical form used for duplicate detection; None when there is no usable ID."""
+    if not transaction_id:
+        return None
+    norm = re.sub(r'[^A-Za-z0-9]', '', str(transaction_id)).upper()
+    if not norm or norm in PLACEHOLDER_IDS:
+        return None
+    return norm
+
+
+def image_hash(image_bytes):
+    return hashlib.sha256(bytes(image_bytes)).hexdigest()
+
+
+class RecentIndex:
+    """Thread-safe bounded LRU mapping of key -> receipt info."""
+
+    def __init__(self, maxsize=RECENT_RECEIPTS_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def add(self, key, value):
+        if not key:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+recent_transactions = RecentIndex()
+recent_images = RecentIndex()
+
+
+def find_duplicate_image(digest):
+    """Return {'id', 'transaction_id', 'category'} of an already stored receipt with this image."""
+    receipt = recent_images.get(digest)
+    if receipt:
+        return receipt
+    from database import get_receipt_by_image_hash
+    receipt = get_receipt_by_image_hash(digest)
+    if receipt:
+        remember_receipt(receipt, digest)
+    return receipt
+
+
+def find_duplicate_transaction(transaction_id):
+    """Return the stored receipt with the same normalized transaction ID, if any."""
+    norm = normalize_transaction_id(transaction_id)
+    if not norm:
+        return None
+    receipt = recent_transactions.get(norm)
+    if receipt:
+        return receipt
+    from database import get_receipt_by_transaction_norm
+    receipt = get_receipt_by_transaction_norm(norm)
+    if receipt:
+        remember_receipt(receipt)
+    return receipt
+
+
+def remember_receipt(receipt, digest=None):
+    recent_transactions.add(normalize_transaction_id(receipt.get('transaction_id')), receipt)
+    recent_images.add(digest or receipt.get('image_hash'), receipt)
@@ -0,0 +1,124 @@
+# dispatch.py
+"""
+Concurrent update dispatching for the Telegram bot.
+
+The application processes up to BOT_CONCURRENT_UPDATES updates at once, so
+different users no longer wait on each other. Two guards keep that safe:
+
+* ``ordered_per_user`` serializes the handlers of one user. asyncio.Lock wakes
+  waiters first-in-first-out and PTB starts update tasks in arrival order, so a
+  user's photo, category tap and subtype tap run strictly one after the other
+  and never race on ``user_state``. Upload handlers get the same guarantee
+  from ``admission.admit_upload``, which takes the user's lock itself.
+* OCR_CONCURRENCY receipts are in OCR at the same time across all users; it
+  matches the size of the OCR engine pool. The slots themselves are handed
+  out by ``admission.ocr_queue``.
+"""
+
+import os
+import time
+import asyncio
+import functools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+OCR_CONCURRENCY = max(1, int(os.getenv("OCR_CONCURRENCY", "1")))
+PENDING_UPLOAD_TTL = float(os.getenv("PENDING_UPLOAD_TTL", "1800"))
+PENDING_UPLOAD_MAX_USERS = int(os.getenv("PENDING_UPLOAD_MAX_USERS", "1000"))
+
+
+class KeyedLocks:
+    """One asyncio.Lock per key, dropped again when nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks = {}
+        self._holders = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key]
+                del self._locks[key]
+
+    def pending(self, key):
+        """Updates of ``key`` currently being handled or waiting for the lock"""
+        return self._holders.get(key, 0)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class PendingUploads:
+    """
+    Per-user uploads waiting for a category choice, bounded in age and count.
+
+    Entries older than ``ttl`` seconds are dropped, and beyond ``maxsize`` users
+    the least recently stored upload is evicted, so images of users who never
+    finish the dialog do not accumulate for the life of the process.
+    """
+
+    def __init__(self, ttl=PENDING_UPLOAD_TTL, maxsize=PENDING_UPLOAD_MAX_USERS, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._items = OrderedDict()
+
+    def _expire(self):
+        deadline = self._clock() - self.ttl
+        while self._items:
+            key, (stored_at, _) = next(iter(self._items.items()))
+            if stored_at > deadline:
+                break
+            del self._items[key]
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = (self._clock(), value)
+        self._expire()
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __getitem__(self, key):
+        self._expire()
+        return self._items[key][1]
+
+    def __contains__(self, key):
+        self._expire()
+        return key in self._items
+
+    def __len__(self):
+        self._expire()
+        return len(self._items)
+
+    def get(self, key, default=None):
+        self._expire()
+        item = self._items.get(key)
+        return item[1] if item else default
+
+    def pop(self, key, default=None):
+        item = self._items.pop(key, None)
+        return item[1] if item else default
+
+
+user_locks = KeyedLocks()
+
+
+def ordered_per_user(callback):
+    """Run a handler while holding the lock of the update's user."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        user = update.effective_user
+        if user is None:
+            return await callback(update, context)
+        async with user_locks.hold(user.id):
+            return await callback(update, context)
+    return wrapper
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Telegram Bot API, for offline end-to-end and load tests.
+
+Implements the part of the Bot API the bot uses: getMe, deleteWebhook,
+getUpdates (long polling), getFile plus file download, sendMessage,
+editMessageText and answerCallbackQuery. Point the bot at it with
+
+    TELEGRAM_API_URL=http://127.0.0.1:8090 TELEGRAM_BOT_TOKEN=123456:FAKE python main.py
+
+Any token is accepted. The bot sees updates that were injected with
+``FakeBotApi.push_update`` (loadtest.py does this) or POSTed as JSON to
+/fake/updates. Photos are registered with ``add_file`` or PUT to
+/fake/files/<file_id>. Everything the bot sends or edits is recorded per chat,
+and ``wait_for`` blocks until a matching message appears.
+
+editMessageText behaves like Telegram where it matters for regressions: editing
+an unknown message, or editing a message to the text and keyboard it already
+has, is answered with 400 Bad Request.
+
+    python fake_bot_api.py --port 8090
+"""
+
+import json
+import time
+import logging
+import argparse
+import itertools
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Receipt Bot (fake)", "username": "fake_receipt_bot"}
+INT_PARAMS = ("chat_id", "message_id", "offset", "limit", "timeout")
+JSON_PARAMS = ("reply_markup", "allowed_updates")
+
+logger = logging.getLogger(__name__)
+
+
+class ApiError(Exception):
+    def __init__(self, code, description):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+def decode_params(params):
+    """Form-encoded Bot API parameters arrive as strings; restore ints and JSON objects"""
+    decoded = dict(params)
+    for name in INT_PARAMS:
+        if isinstance(decoded.get(name), str):
+            decoded[name] = int(decoded[name])
+    for name in JSON_PARAMS:
+        if isinstance(decoded.get(name), str):
+            decoded[name] = json.loads(decoded[name])
+    return decoded
+
+
+def callback_data(markup):
+    """All callback_data values of an inline keyboard"""
+    if not markup:
+        return []
+    return [button.get("callback_data") for row in markup.get("inline_keyboard", []) for button in row]
+
+
+class FakeBotApi:
+    def __init__(self, host="127.0.0.1", port=0):
+        self._cond = threading.Condition()
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self.files = {}
+        self.messages = {}
+        self.chat_events = {}
+        self.calls = {}
+
+        api = self
+
+        class Handler(_Handler):
+            fake = api
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self._cond:
+            self._cond.notify_all()
+
+    # ---------- Driver side ----------
+    def add_file(self, file_id, data):
+        self.files[file_id] = bytes(data)
+
+    def push_update(self, update):
+        """Queue an update for the bot's next getUpdates; returns its update_id"""
+        with self._cond:
+            update = dict(update, update_id=next(self._update_ids))
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update["update_id"]
+
+    def wait_for(self, chat_id, predicate, timeout, after=0):
+        """
+        First message event of ``chat_id`` from index ``after`` on that matches
+        ``predicate``; returns (index, event) or (None, None) on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                events = self.chat_events.get(chat_id, [])
+                for index in range(after, len(events)):
+                    if predicate(events[index]):
+                        return index, events[index]
+                after = max(after, len(events))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None
+                self._cond.wait(remaining)
+
+    # ---------- Bot API side ----------
+    def call(self, method, params):
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            raise ApiError(404, "Not Found: method not found")
+        return handler(decode_params(params))
+
+    def api_getMe(self, params):
+        return BOT_USER
+
+    def api_deleteWebhook(self, params):
+        return True
+
+    def api_answerCallbackQuery(self, params):
+        return True
+
+    def api_getUpdates(self, params):
+        offset = params.get("offset", 0)
+        limit = params.get("limit", 100)
+        deadline = time.monotonic() + params.get("timeout", 0)
+        with self._cond:
+            # Like Telegram, asking for an offset confirms every earlier update
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._updates[:limit]
+
+    def api_getFile(self, params):
+        file_id = params.get("file_id")
+        if file_id not in self.files:
+            raise ApiError(400, "Bad Request: wrong file_id or the file is temporarily unavailable")
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id[-16:],
+            "file_size": len(self.files[file_id]),
+            "file_path": f"photos/{file_id}.jpg",
+        }
+
+    def api_sendMessage(self, params):
+        message_id = next(self._message_ids)
+        return self._record("sendMessage", params["chat_id"], message_id, params.get("text", ""), params.get("reply_markup"))
+
+    def api_editMessageText(self, params):
+        chat_id, message_id = params.get("chat_id"), params.get("message_id")
+        current = self.messages.get((chat_id, message_id))
+        if current is None:
+            raise ApiError(400, "Bad Request: message to edit not found")
+        text, markup = params.get("text", ""), params.get("reply_markup")
+        if current["text"] == text and current.get("reply_markup") == markup:
+            raise ApiError(400, "Bad Request: message is not modified: specified new message content and reply markup are exactly the same as a current content and reply markup of the message")
+        return self._record("editMessageText", chat_id, message_id, text, markup)
+
+    def _record(self, method, chat_id, message_id, text, markup):
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+            "text": text,
+        }
+        # Telegram only echoes inline keyboards back
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        event = {"at": time.monotonic(), "method": method, "message_id": message_id, "text": text, "reply_markup": markup}
+        with self._cond:
+            self.messages[(chat_id, message_id)] = message
+            self.chat_events.setdefault(chat_id, []).append(event)
+            self._cond.notify_all()
+        return message
+
+    def file_bytes(self, file_path):
+        file_id = file_path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        return self.files.get(file_id)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path.startswith("/fake/files/"):
+            self.fake.add_file(path[len("/fake/files/"):], body)
+            return self._reply(200, {"ok": True, "result": True})
+        self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _params(self, body):
+        params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+        if body:
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("application/json"):
+                params.update(json.loads(body))
+            elif content_type.startswith("application/x-www-form-urlencoded"):
+                params.update({key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()})
+            else:
+                raise ApiError(400, f"Bad Request: unsupported content type {content_type}")
+        return params
+
+    def _dispatch(self):
+        path = urlparse(self.path).path
+        # Always consume the body so the keep-alive connection stays in sync
+        body = self._body()
+        try:
+            if path.startswith("/file/bot"):
+                data = self.fake.file_bytes(path.split("/", 3)[-1])
+                if data is None:
+                    return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                return self._send(200, data, "application/octet-stream")
+            if path == "/fake/updates":
+                return self._reply(200, {"ok": True, "result": self.fake.push_update(self._params(body))})
+            if path.startswith("/bot"):
+                method = path.rsplit("/", 1)[-1]
+                return self._reply(200, {"ok": True, "result": self.fake.call(method, self._params(body))})
+            self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+        except ApiError as e:
+            self._reply(e.code, {"ok": False, "error_code": e.code, "description": e.description})
+        except Exception as e:
+            logger.error(f"❌ Fake Bot API error on {path}: {e}", exc_info=True)
+            self._reply(500, {"ok": False, "error_code": 500, "description": str(e)})
+
+    def _reply(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local fake Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    api = FakeBotApi(args.host, args.port).start()
+    logger.info(f"✅ Fake Bot API on {api.url} (inject updates with POST /fake/updates)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
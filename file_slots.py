@@ -0,0 +1,54 @@
+# file_slots.py
+"""
+A counting semaphore shared by unrelated processes, made of lock files.
+
+Each of the ``count`` slots is a file in ``directory``; holding a slot means
+holding an exclusive ``flock`` on its file. The kernel drops the lock when the
+holder's file is closed, including when the process is killed, so a slot is
+never lost the way a shared semaphore is when gunicorn SIGKILLs a timed-out
+worker in the middle of a request.
+"""
+
+import os
+import time
+import fcntl
+import itertools
+
+POLL_SECONDS = 0.02
+
+
+class FileSlots:
+    def __init__(self, directory, count):
+        self.directory = directory
+        self.count = max(1, count)
+        self._start = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, index):
+        return os.path.join(self.directory, f"slot-{index}.lock")
+
+    def try_acquire(self):
+        """Take a free slot; returns its token (pass it to ``release``) or None"""
+        # Start at a different slot each time so waiters do not all probe slot 0 first
+        first = next(self._start)
+        for offset in range(self.count):
+            fd = os.open(self._path((first + offset) % self.count), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def acquire(self, timeout):
+        """Wait up to ``timeout`` seconds for a slot; returns its token or None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            token = self.try_acquire()
+            if token is not None or time.monotonic() >= deadline:
+                return token
+            time.sleep(POLL_SECONDS)
+
+    def release(self, token):
+        # Closing the descriptor drops the lock
+        os.close(token)
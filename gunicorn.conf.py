@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+# Production serving settings for wsgi:application (the voucher web app).
+# Every value can be overridden through the environment.
+import os
+import multiprocessing
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+
+# Workers scale with cores; each worker also runs a few threads for I/O-bound requests
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Inherited by the workers, which size their bcrypt pools by it (passwords.py)
+os.environ["WEB_WORKERS"] = str(workers)
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+# Request timeouts
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# Recycle workers periodically so leaks in PDF/image handling stay bounded
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "200"))
+
+# Uploaded receipts and signature images can be large
+limit_request_field_size = 16384
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+proc_name = "voucher-web"
+
+
+def on_starting(server):
+    """Create/migrate tables once in the master before any worker is forked."""
+    import database
+    import voucher
+    database.init_db()
+    voucher.init_db()
@@ -0,0 +1,124 @@
+# health.py
+"""
+Process health registry: startup phase timings, readiness of components
+(OCR engine, database, ...) and a tiny HTTP status endpoint.
+
+    GET /healthz  liveness  - 200 while the process is serving
+    GET /readyz   readiness - 200 once every registered component is ready, else 503
+    GET /metrics  JSON snapshot of phases, components, counters and gauges
+"""
+
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PROCESS_STARTED = time.time()
+
+_lock = threading.Lock()
+startup_phases = {}
+components = {}
+counters = {}
+gauges = {}
+info = {}
+
+
+@contextmanager
+def phase(name):
+    """Time a startup phase and record its duration."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        record_phase(name, elapsed)
+        logger.info(f"⏱️ Startup phase '{name}' took {elapsed * 1000:.0f} ms")
+
+
+def record_phase(name, seconds):
+    with _lock:
+        startup_phases[name] = round(seconds, 4)
+
+
+def set_component_state(name, state, detail=""):
+    with _lock:
+        components[name] = {"state": state, "detail": detail, "since": time.time()}
+
+
+def component_state(name):
+    with _lock:
+        return components.get(name, {}).get("state")
+
+
+def is_ready():
+    with _lock:
+        return all(c["state"] == "ready" for c in components.values())
+
+
+def set_info(name, value):
+    """Static facts about the process (configuration, budgets) reported in /metrics."""
+    with _lock:
+        info[name] = value
+
+
+def incr(name, amount=1):
+    with _lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    with _lock:
+        gauges[name] = value
+
+
+def snapshot():
+    with _lock:
+        return {
+            "uptime_seconds": round(time.time() - PROCESS_STARTED, 1),
+            "ready": all(c["state"] == "ready" for c in components.values()),
+            "startup_phases": dict(startup_phases),
+            "components": {name: dict(info) for name, info in components.items()},
+            "counters": dict(counters),
+            "gauges": dict(gauges),
+            "info": dict(info),
+        }
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._reply(200, {"status": "alive", "uptime_seconds": round(time.time() - PROCESS_STARTED, 1)})
+        elif self.path == "/readyz":
+            data = snapshot()
+            self._reply(200 if data["ready"] else 503, {"ready": data["ready"], "components": data["components"]})
+        elif self.path == "/metrics":
+            self._reply(200, snapshot())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_status_server(host="0.0.0.0", port=8081):
+    """Serve /healthz, /readyz and /metrics from a daemon thread."""
+    try:
+        server = ThreadingHTTPServer((host, port), _StatusHandler)
+        threading.Thread(target=server.serve_forever, name="status-server", daemon=True).start()
+        logger.info(f"✅ Status endpoint listening on {host}:{port}")
+        return server
+    except OSError as e:
+        logger.error(f"❌ Status endpoint failed on port {port}: {e}")
+        return None
@@ -0,0 +1,188 @@
+# image_pipeline.py
+"""
+Receipt image preprocessing for OCR.
+
+The image is decoded straight from the downloaded bytes with cv2.imdecode and
+stays in one BGR layout until it reaches PaddleOCR (which expects BGR). The
+resize and denoise outputs go into two per-thread scratch buffers that are
+reused for every receipt the thread handles, and the contrast / sharpen /
+brightness passes run in place on them with saturating OpenCV arithmetic:
+
+    contrast   out = 1.8 * img - 0.8 * mean(gray)        (PIL ImageEnhance.Contrast)
+    sharpen    out = 2.0 * img - smooth(img)             (PIL ImageEnhance.Sharpness)
+    brightness out = 1.1 * img                           (PIL ImageEnhance.Brightness)
+
+Before that, ``localize_receipt`` looks for the receipt outline (largest
+convex quadrilateral) on a small grayscale copy and, when it finds one, warps
+just the receipt to a flat, upright rectangle, so the table, hand or
+background around a photographed receipt is never upscaled, denoised or OCRed.
+Full-frame screenshots have no such outline and pass through unchanged.
+
+``prepare_for_ocr`` returns a view of the calling thread's buffer. It stays
+valid until that thread prepares its next image, so run OCR on it first.
+"""
+
+import os
+import logging
+import threading
+
+import numpy as np
+
+import thread_budget
+
+TARGET_SIZE = 1800
+
+RECEIPT_LOCALIZATION = os.getenv("RECEIPT_LOCALIZATION", "1") == "1"
+LOCALIZE_SIZE = 512
+# A detected outline must cover this share of the frame to be trusted, and
+# below the upper bound to be worth cropping
+MIN_RECEIPT_AREA = 0.2
+MAX_RECEIPT_AREA = 0.9
+
+CONTRAST = 1.8
+SHARPNESS = 2.0
+BRIGHTNESS = 1.1
+
+# PIL's SMOOTH kernel, used by ImageEnhance.Sharpness as the blurred reference
+SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+
+logger = logging.getLogger(__name__)
+
+_scratch = threading.local()
+
+
+def scratch_buffer(name, shape):
+    """A contiguous uint8 array of ``shape`` backed by a per-thread buffer that only grows."""
+    size = int(np.prod(shape))
+    flat = getattr(_scratch, name, None)
+    if flat is None or flat.size < size:
+        flat = np.empty(size, dtype=np.uint8)
+        setattr(_scratch, name, flat)
+    return flat[:size].reshape(shape)
+
+
+def decode_bgr(image_bytes):
+    """Decode image bytes to an upright BGR array (cv2.IMREAD_COLOR applies the EXIF orientation)"""
+    import cv2
+    data = np.frombuffer(image_bytes, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if image is not None:
+        return image
+
+    # Formats OpenCV cannot read (e.g. some GIF/ICO uploads) go through PIL once
+    from io import BytesIO
+    from PIL import Image, ImageOps
+    with Image.open(BytesIO(bytes(image_bytes))) as pil_image:
+        rgb = np.asarray(ImageOps.exif_transpose(pil_image).convert("RGB"))
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def order_corners(points):
+    """Corners as top-left, top-right, bottom-right, bottom-left"""
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)],
+    ], dtype=np.float32)
+
+
+def find_receipt_outline(image):
+    """Corners of the receipt in ``image`` coordinates, or None when no clear outline is found"""
+    import cv2
+    height, width = image.shape[:2]
+    scale = LOCALIZE_SIZE / max(height, width)
+    if scale < 1:
+        small = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        scale, small = 1.0, image
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(gray, 50, 150)
+    edges = cv2.dilate(edges, None, iterations=2)
+
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    frame_area = small.shape[0] * small.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        area = cv2.contourArea(contour)
+        if area < MIN_RECEIPT_AREA * frame_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            if area > MAX_RECEIPT_AREA * frame_area:
+                return None
+            return order_corners(approx) / scale
+    return None
+
+
+def localize_receipt(image):
+    """Crop and deskew the receipt out of a photo; returns ``image`` itself when nothing is found"""
+    import cv2
+    corners = find_receipt_outline(image)
+    if corners is None:
+        return image
+
+    top_left, top_right, bottom_right, bottom_left = corners
+    width = int(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))
+    height = int(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))
+    if width < 32 or height < 32:
+        return image
+
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    cropped = scratch_buffer("localized", (height, width, 3))
+    cv2.warpPerspective(image, matrix, (width, height), dst=cropped, flags=cv2.INTER_LINEAR,
+                        borderMode=cv2.BORDER_REPLICATE)
+    logger.info(f"📐 Receipt localized: {image.shape[1]}x{image.shape[0]} -> {width}x{height}")
+    return cropped
+
+
+def target_shape(height, width):
+    # Same rule as before: the longer side becomes TARGET_SIZE unless both sides already reach it
+    if height >= TARGET_SIZE and width >= TARGET_SIZE:
+        return height, width
+    scale = TARGET_SIZE / max(height, width)
+    return int(height * scale), int(width * scale)
+
+
+def enhance_in_place(image, scratch):
+    """Contrast, sharpen and brighten ``image`` in place; ``scratch`` must have the same shape"""
+    import cv2
+    blue, green, red, _ = cv2.mean(image)
+    gray_mean = int(0.114 * blue + 0.587 * green + 0.299 * red + 0.5)
+    cv2.addWeighted(image, CONTRAST, image, 0, -(CONTRAST - 1) * gray_mean, dst=image)
+
+    cv2.filter2D(image, -1, SMOOTH_KERNEL, dst=scratch)
+    cv2.addWeighted(image, SHARPNESS, scratch, 1 - SHARPNESS, 0, dst=image)
+
+    cv2.convertScaleAbs(image, dst=image, alpha=BRIGHTNESS)
+    return image
+
+
+def prepare_for_ocr(image_bytes):
+    """Decode, resize, denoise and enhance a receipt; returns a BGR view of this thread's buffer"""
+    import cv2
+    thread_budget.configure_opencv()
+    image = decode_bgr(image_bytes)
+    if RECEIPT_LOCALIZATION:
+        image = localize_receipt(image)
+    height, width = image.shape[:2]
+    new_height, new_width = target_shape(height, width)
+
+    if (new_height, new_width) != (height, width):
+        resized = scratch_buffer("resized", (new_height, new_width, 3))
+        cv2.resize(image, (new_width, new_height), dst=resized, interpolation=cv2.INTER_CUBIC)
+    else:
+        resized = image
+    del image
+
+    denoised = scratch_buffer("denoised", resized.shape)
+    cv2.fastNlMeansDenoisingColored(resized, denoised, 10, 10, 7, 15)
+
+    # The resize buffer is free again and serves as the sharpen scratch
+    scratch = scratch_buffer("resized", denoised.shape)
+    return enhance_in_place(denoised, scratch)
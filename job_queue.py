@@ -0,0 +1,242 @@
+# job_queue.py
+"""
+Durable OCR job queue in Postgres.
+
+The bot-ingest role enqueues downloaded receipt images; any number of OCR
+worker processes claim them with ``FOR UPDATE SKIP LOCKED`` so each job is
+processed exactly once, and a NOTIFY wakes idle workers immediately.
+Jobs left 'running' by a crashed worker are requeued by the scheduler role.
+
+Jobs are claimed in ``run_key`` order: the virtual-clock key of their priority
+class (see ocr_priority), computed when the job is enqueued. Requeued jobs keep
+their key, so they are picked up again ahead of newer work.
+"""
+
+import json
+import time
+import select
+import logging
+import psycopg2
+
+import ocr_priority
+from database import DATABASE_CONFIG
+
+MAX_ATTEMPTS = 3
+NOTIFY_CHANNEL = "ocr_jobs"
+
+
+def init_job_queue():
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_jobs (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT,
+                chat_id BIGINT,
+                message_id BIGINT NULL,
+                category VARCHAR(50),
+                image BYTEA,
+                priority SMALLINT DEFAULT 0,
+                status VARCHAR(20) DEFAULT 'queued',
+                attempts INT DEFAULT 0,
+                worker TEXT NULL,
+                result JSONB NULL,
+                error TEXT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP NULL,
+                finished_at TIMESTAMP NULL
+            );
+        ''')
+        cur.execute("ALTER TABLE ocr_jobs ADD COLUMN IF NOT EXISTS run_key TIMESTAMP;")
+        cur.execute("UPDATE ocr_jobs SET run_key = created_at WHERE run_key IS NULL AND status = 'queued';")
+        cur.execute("DROP INDEX IF EXISTS idx_ocr_jobs_queued;")
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ocr_jobs_run_key
+            ON ocr_jobs (run_key, id)
+            WHERE status = 'queued';
+        ''')
+        # Latest key per class, read when the next job of that class is enqueued
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ocr_jobs_class_key
+            ON ocr_jobs (priority, run_key DESC)
+            WHERE status = 'queued';
+        ''')
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        logging.info("✅ OCR job queue initialized.")
+        return True
+    except Exception as e:
+        logging.error(f"❌ Error initializing OCR job queue: {e}")
+        return False
+
+
+def enqueue_ocr_job(user_id, chat_id, message_id, category, image_bytes, job_class=ocr_priority.INTERACTIVE):
+    """Queue one receipt image for OCR in the given priority class and return the job ID"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        rank = ocr_priority.CLASS_RANK[job_class]
+        step = ocr_priority.class_step(job_class, ocr_priority.job_cost(category))
+        cur.execute('''
+            INSERT INTO ocr_jobs (user_id, chat_id, message_id, category, image, priority, run_key)
+            VALUES (%s, %s, %s, %s, %s, %s,
+                    GREATEST(
+                        LOCALTIMESTAMP,
+                        (SELECT MAX(run_key) FROM ocr_jobs WHERE status = 'queued' AND priority = %s)
+                    ) + make_interval(secs => %s))
+            RETURNING id;
+        ''', (user_id, chat_id, message_id, category, psycopg2.Binary(bytes(image_bytes)), rank, rank, step))
+        job_id = cur.fetchone()[0]
+        cur.execute(f"NOTIFY {NOTIFY_CHANNEL};")
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        logging.info(f"📥 OCR job {job_id} queued for user {user_id} ({category}, {job_class})")
+        return job_id
+
+    except Exception as e:
+        logging.error(f"❌ Failed to enqueue OCR job for user {user_id}: {e}")
+        return None
+
+
+def claim_ocr_jobs(worker, limit=1):
+    """Atomically claim up to ``limit`` queued jobs for this worker"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE ocr_jobs
+            SET status = 'running', worker = %s, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM ocr_jobs
+                WHERE status = 'queued'
+                ORDER BY run_key, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, chat_id, message_id, category, image, attempts;
+        ''', (worker, limit))
+        rows = cur.fetchall()
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return [{
+            'id': row[0],
+            'user_id': row[1],
+            'chat_id': row[2],
+            'message_id': row[3],
+            'category': row[4],
+            'image': bytes(row[5]),
+            'attempts': row[6]
+        } for row in rows]
+
+    except Exception as e:
+        logging.error(f"❌ Failed to claim OCR jobs: {e}")
+        return []
+
+
+def complete_ocr_job(job_id, result):
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE ocr_jobs
+            SET status = 'done', result = %s, image = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s;
+        ''', (json.dumps(result), job_id))
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Failed to complete OCR job {job_id}: {e}")
+        return False
+
+
+def fail_ocr_job(job_id, error):
+    """Requeue the job unless it has used up its attempts"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE ocr_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+                error = %s,
+                finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            RETURNING status;
+        ''', (MAX_ATTEMPTS, str(error), job_id))
+        status = cur.fetchone()[0]
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        return status
+
+    except Exception as e:
+        logging.error(f"❌ Failed to record failure of OCR job {job_id}: {e}")
+        return None
+
+
+def requeue_stale_jobs(timeout_seconds=300):
+    """Put jobs back in the queue whose worker died while running them"""
+    try:
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE ocr_jobs
+            SET status = 'queued', worker = NULL
+            WHERE status = 'running'
+              AND started_at < CURRENT_TIMESTAMP - make_interval(secs => %s);
+        ''', (timeout_seconds,))
+        count = cur.rowcount
+        if count:
+            cur.execute(f"NOTIFY {NOTIFY_CHANNEL};")
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if count:
+            logging.warning(f"⚠️ Requeued {count} stale OCR jobs")
+        return count
+
+    except Exception as e:
+        logging.error(f"❌ Failed to requeue stale OCR jobs: {e}")
+        return 0
+
+
+class JobNotifier:
+    """LISTEN connection used by idle workers to wait for new jobs"""
+
+    def __init__(self):
+        self.conn = None
+
+    def wait(self, timeout):
+        try:
+            if self.conn is None or self.conn.closed:
+                self.conn = psycopg2.connect(**DATABASE_CONFIG)
+                self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                self.conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL};")
+            if select.select([self.conn], [], [], timeout) != ([], [], []):
+                self.conn.poll()
+                self.conn.notifies.clear()
+        except Exception as e:
+            logging.error(f"❌ Job notification wait failed: {e}")
+            self.conn = None
+            time.sleep(timeout)
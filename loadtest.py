@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the bot against a local fake Telegram Bot API.
+
+Starts fake_bot_api.FakeBotApi and the bot (``python main.py``, polling)
+pointed at it via TELEGRAM_API_URL, then simulates --users field staff who
+each send --receipts photos and tap UPI -> PhonePe on the keyboards, like in
+the real chat. Throughput and latency distributions are reported for:
+
+    keyboard   photo sent -> "Choose the receipt type" keyboard    (handle_image)
+    first      PhonePe tapped -> first progress edit
+    result     PhonePe tapped -> final result                      (process_receipt)
+    total      photo sent -> final result
+
+Nothing leaves the machine. Receipts are rendered locally with unique
+transaction IDs (or read from --images, see bulk_ingest for the formats), and
+the bot uses the database configured in .env. Point DB_NAME at a scratch
+database, because every saved receipt is inserted there.
+
+    python loadtest.py --users 20 --receipts 3
+    python loadtest.py --users 50 --ramp 30 --images /data/receipts --json report.json --fail-p95 30
+    python loadtest.py --no-bot --api-port 8090    # bot already running against fake_bot_api.py
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_bot_api import FakeBotApi, callback_data
+from post_fake_update import callback_update, message_update
+
+BASE_USER_ID = 900000000
+LOAD_TEST_TOKEN = "123456:LOAD-TEST"
+MEASURES = ("keyboard", "first", "result", "total")
+# Edits that report progress rather than the outcome of a receipt
+PROGRESS_PREFIXES = ("✔️", "⏳", "🚦 Busy")
+OUTCOMES = (("✅", "saved"), ("♻️", "duplicate"), ("⚠️", "no_text"), ("🚦", "shed"), ("❌", "failed"))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# ---------- Receipt images ----------
+def render_receipt(index):
+    """A PhonePe-style screenshot with a unique amount and transaction ID"""
+    import cv2
+    import numpy as np
+
+    amount = random.randint(100, 99999)
+    lines = [
+        "PhonePe",
+        "Transaction Successful",
+        time.strftime("%d %b %Y %I:%M %p"),
+        f"Paid to LOAD TEST {index}",
+        f"Rs. {amount:,}.00",
+        "Transaction ID",
+        f"T{time.strftime('%y%m%d%H%M')}{index:012d}",
+        f"UTR: {random.randint(10 ** 11, 10 ** 12 - 1)}",
+    ]
+    image = np.full((1600, 720, 3), 255, dtype=np.uint8)
+    for row, line in enumerate(lines):
+        cv2.putText(image, line, (40, 160 + row * 150), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2, cv2.LINE_AA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("could not encode synthetic receipt")
+    return encoded.tobytes()
+
+
+def load_images(source, limit):
+    from bulk_ingest import iter_sources, read_source
+    images = []
+    for _, handle in iter_sources(source):
+        if len(images) >= limit:
+            break
+        images.append(bytes(read_source(handle)))
+    if not images:
+        raise SystemExit(f"No images found in {source}")
+    return images
+
+
+# ---------- Bot process ----------
+def start_bot(api_url, status_port, log_path):
+    env = dict(
+        os.environ,
+        TELEGRAM_API_URL=api_url,
+        TELEGRAM_BOT_TOKEN=LOAD_TEST_TOKEN,
+        BOT_MODE="polling",
+        VOUCHER_SERVER_MODE="external",
+        STATUS_PORT=str(status_port),
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    log = open(log_path, "w")
+    logger.info(f"🚀 Starting bot (log: {log_path})")
+    return subprocess.Popen([sys.executable, os.path.join(here, "main.py")], cwd=here, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def fetch_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except OSError:
+        return None, None
+
+
+def wait_until_ready(bot, api, status_port, timeout):
+    """The bot is ready once /readyz answers 200 and it polls the fake API"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if bot is not None and bot.poll() is not None:
+            raise SystemExit(f"Bot exited with code {bot.returncode} before it was ready")
+        status, _ = fetch_json(f"http://127.0.0.1:{status_port}/readyz")
+        if (status == 200 or bot is None) and api.calls.get("getUpdates"):
+            return
+        time.sleep(1)
+    raise SystemExit(f"Bot not ready after {timeout:.0f}s")
+
+
+# ---------- Scenario ----------
+def outcome_of(text):
+    for prefix, outcome in OUTCOMES:
+        if text.startswith(prefix):
+            return outcome
+    return "other"
+
+
+def run_receipt(api, user_id, file_id, image, args):
+    """One photo through upi -> PhonePe; returns the timings and outcome"""
+    result = {"user_id": user_id, "outcome": "timeout", "progress_edits": 0}
+    api.add_file(file_id, image)
+    after = len(api.chat_events.get(user_id, []))
+    sent = time.monotonic()
+    api.push_update(message_update(user_id, photo_file_id=file_id))
+
+    def upload_answered(event):
+        buttons = callback_data(event["reply_markup"])
+        return "upi" in buttons or "retry_image_upload" in buttons or event["text"].startswith(("🚦 Still", "✋", "♻️"))
+
+    index, keyboard = api.wait_for(user_id, upload_answered, args.timeout, after)
+    if keyboard is None:
+        return result
+    if "upi" not in callback_data(keyboard["reply_markup"]):
+        result["outcome"] = "shed" if keyboard["text"].startswith("✋") else outcome_of(keyboard["text"])
+        if "retry_image_upload" in callback_data(keyboard["reply_markup"]):
+            result["outcome"] = "failed"
+        return result
+    result["keyboard"] = keyboard["at"] - sent
+    message_id = keyboard["message_id"]
+
+    time.sleep(args.think)
+    api.push_update(callback_update(user_id, "upi", message_id))
+    index, subtype = api.wait_for(
+        user_id, lambda e: e["message_id"] == message_id and "PhonePe" in callback_data(e["reply_markup"]),
+        args.timeout, index + 1
+    )
+    if subtype is None:
+        return result
+
+    time.sleep(args.think)
+    tapped = time.monotonic()
+    api.push_update(callback_update(user_id, "PhonePe", message_id))
+    edits = []
+    while True:
+        index, edit = api.wait_for(user_id, lambda e: e["message_id"] == message_id, args.timeout, index + 1)
+        if edit is None:
+            return result
+        edits.append(edit)
+        if not edit["text"].startswith(PROGRESS_PREFIXES):
+            break
+
+    result["first"] = edits[0]["at"] - tapped
+    result["result"] = edit["at"] - tapped
+    result["total"] = edit["at"] - sent
+    result["progress_edits"] = len(edits) - 1
+    if len(edits) > 1:
+        result["min_edit_gap"] = min(later["at"] - earlier["at"] for earlier, later in zip(edits, edits[1:]))
+    result["outcome"] = outcome_of(edit["text"])
+    return result
+
+
+def run_user(api, user_index, images, args):
+    user_id = BASE_USER_ID + user_index
+    if args.ramp:
+        time.sleep(args.ramp * user_index / max(1, args.users))
+    results = []
+    for n in range(args.receipts):
+        image = images[(user_index * args.receipts + n) % len(images)]
+        results.append(run_receipt(api, user_id, f"load-{user_id}-{n}-{random.getrandbits(32):08x}", image, args))
+        time.sleep(args.think)
+    return results
+
+
+# ---------- Report ----------
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(results, elapsed, api, metrics):
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    latencies = {}
+    for measure in MEASURES:
+        values = [result[measure] for result in results if measure in result]
+        if values:
+            latencies[measure] = {
+                "count": len(values),
+                "p50": percentile(values, 0.5),
+                "p90": percentile(values, 0.9),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": max(values),
+                "mean": statistics.mean(values),
+            }
+    gaps = [result["min_edit_gap"] for result in results if "min_edit_gap" in result]
+    return {
+        "receipts": len(results),
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": outcomes.get("saved", 0) / elapsed if elapsed else 0.0,
+        "outcomes": outcomes,
+        "latency_seconds": latencies,
+        "progress_edits_mean": statistics.mean(result["progress_edits"] for result in results) if results else 0,
+        "min_edit_gap_seconds": min(gaps) if gaps else None,
+        "bot_api_calls": dict(api.calls),
+        "bot_counters": (metrics or {}).get("counters", {}),
+    }
+
+
+def print_report(report):
+    print(f"\nReceipts: {report['receipts']} in {report['elapsed_seconds']:.1f}s "
+          f"-> {report['throughput_per_second']:.2f} saved/s")
+    print("Outcomes: " + ", ".join(f"{name} {count}" for name, count in sorted(report["outcomes"].items())))
+    print(f"\n{'seconds':<10} {'n':>5} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+    for measure, stats in report["latency_seconds"].items():
+        print(f"{measure:<10} {stats['count']:>5} {stats['p50']:>7.2f} {stats['p90']:>7.2f} "
+              f"{stats['p95']:>7.2f} {stats['p99']:>7.2f} {stats['max']:>7.2f}")
+    gap = report["min_edit_gap_seconds"]
+    print(f"\nProgress edits per receipt: {report['progress_edits_mean']:.1f}"
+          + (f", closest edits {gap:.2f}s apart" if gap is not None else ""))
+    print("Bot API calls: " + ", ".join(f"{name} {count}" for name, count in sorted(report["bot_api_calls"].items())))
+    admission = {name: count for name, count in report["bot_counters"].items() if name.startswith("admission")}
+    if admission:
+        print("Admission: " + ", ".join(f"{name} {count}" for name, count in sorted(admission.items())))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the bot against a local fake Telegram Bot API")
+    parser.add_argument("--users", type=int, default=10, help="simulated users sending at the same time")
+    parser.add_argument("--receipts", type=int, default=3, help="receipts per user")
+    parser.add_argument("--think", type=float, default=0.5, help="seconds a user takes per tap")
+    parser.add_argument("--ramp", type=float, default=0, help="spread user start times over this many seconds")
+    parser.add_argument("--images", help="directory, .zip or .tar(.gz) of receipts instead of synthetic ones")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for each bot reply")
+    parser.add_argument("--api-port", type=int, default=0, help="port of the fake Bot API (0 = any free port)")
+    parser.add_argument("--status-port", type=int, default=8091, help="STATUS_PORT of the bot under test")
+    parser.add_argument("--ready-timeout", type=float, default=600, help="seconds to wait for OCR warm-up")
+    parser.add_argument("--no-bot", action="store_true", help="do not start the bot; drive one already running")
+    parser.add_argument("--bot-log", default="loadtest_bot.log")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--fail-p95", type=float, help="exit 1 when the p95 'result' latency exceeds this many seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    total = args.users * args.receipts
+    if args.images:
+        images = load_images(args.images, total)
+        if len(images) < total:
+            logger.warning("⚠️ Fewer images than receipts; repeated images will be answered as duplicates")
+    else:
+        images = [render_receipt(index) for index in range(total)]
+
+    api = FakeBotApi(port=args.api_port).start()
+    logger.info(f"✅ Fake Bot API on {api.url}")
+    bot = None if args.no_bot else start_bot(api.url, args.status_port, args.bot_log)
+    try:
+        wait_until_ready(bot, api, args.status_port, args.ready_timeout)
+        logger.info(f"🏁 Running {args.users} users x {args.receipts} receipts")
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            per_user = list(pool.map(lambda index: run_user(api, index, images, args), range(args.users)))
+        elapsed = time.monotonic() - started
+        _, metrics = fetch_json(f"http://127.0.0.1:{args.status_port}/metrics")
+    finally:
+        if bot is not None:
+            bot.terminate()
+            try:
+                bot.wait(30)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+        api.stop()
+
+    report = summarize([result for results in per_user for result in results], elapsed, api, metrics)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    p95 = report["latency_seconds"].get("result", {}).get("p95")
+    if args.fail_p95 is not None and (p95 is None or p95 > args.fail_p95):
+        print(f"💥 p95 result latency {p95 if p95 is not None else 'n/a'} exceeds {args.fail_p95}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,21 @@
 
 import os
 import time
-import re
+import asyncio
 import logging
 import requests
 import uuid
 import base64
 import threading
-import numpy as np
 from io import BytesIO
 from dotenv import load_dotenv
 
+# Thread limits for BLAS/OpenMP are read once by the native runtimes, so they
+# are set from the environment (.env included) before receipt_ocr imports numpy
+load_dotenv()
+import thread_budget
+thread_budget.configure()
+
 from telegram import (
     Update,
     InlineKeyboardMarkup,
@@ -27,25 +32,39 @@ from telegram.ext import (
     filters,
 )
 
-from word2number import w2n
-
-# OCR Libraries
-from PIL import Image, ImageEnhance, ImageFilter
-from paddleocr import PaddleOCR
-import cv2
-
-# Flask apps
-from flask import Flask
-from voucher import voucher_app, run_voucher_app, get_last_24h_status
+import health
+health.set_info("thread_budget", thread_budget.current())
+from dispatch import OCR_CONCURRENCY, PendingUploads, ordered_per_user, user_locks
+from admission import Overloaded, admit_upload, ocr_queue
+import ocr_priority
+from progress import ProgressReporter
+
+# OCR and parsing live outside the bot so OCR child processes need not import it
+from receipt_ocr import (
+    OCR_EXECUTION,
+    ocr_ready,
+    receipt_writer,
+    start_ocr_warmup,
+    stop_ocr_workers,
+    read_album_image,
+    extract_fields,
+    build_voucher_link,
+    duplicate_message,
+    read_and_store_receipt,
+)
 
 # DB operations
-from database import init_db, insert_extracted_receipt, insert_or_update_brochure, register_user, get_user_by_email
+from database import init_db, insert_extracted_receipts, insert_or_update_brochure, register_user, get_user_by_email
+
+from dedup import image_hash, find_duplicate_image, find_duplicate_transaction, remember_receipt
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
-# Load environment
-load_dotenv()
+health.record_phase("imports", time.time() - health.PROCESS_STARTED)
+
+# Environment (.env was loaded above, before the thread budget)
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
 
 # Logging
 logging.basicConfig(
@@ -58,27 +77,50 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # State management
-user_images = {}
+# Uploads waiting for the user's category tap; abandoned ones expire instead of piling up
+user_images = PendingUploads()
+user_batches = PendingUploads()
 user_state = {}
 CHAT_IDS = [-1003283341507]
 
-# Initialize PaddleOCR with optimized settings
-logger.info("Initializing PaddleOCR...")
-try:
-    ocr_engine = PaddleOCR(
-        use_angle_cls=True,
-        lang='en',
-        show_log=False,
-        use_gpu=False,
-        det_db_thresh=0.2,
-        det_db_box_thresh=0.3,
-        rec_batch_num=8,
-        drop_score=0.3
-    )
-    logger.info("✅ PaddleOCR initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize PaddleOCR: {e}")
-    raise
+# Album / bulk upload handling
+media_groups = {}
+MEDIA_GROUP_WAIT_SECONDS = 1.5
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "4"))
+
+STATUS_PORT = int(os.getenv("STATUS_PORT", "8081"))
+# "embedded" runs the Flask dev server in a bot thread; "external" when wsgi.py serves the web app
+VOUCHER_SERVER_MODE = os.getenv("VOUCHER_SERVER_MODE", "embedded")
+
+# Update ingestion: "polling" (getUpdates) or "webhook" (Telegram POSTs updates to us)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+OCR_WARMUP_WAIT_SECONDS = 120
+
+
+async def wait_for_ocr(edit):
+    """Tell the user the engine is still warming up and wait for it."""
+    if ocr_ready.is_set() or health.component_state("ocr") == "failed":
+        return
+    await edit("⏳ OCR engine is warming up, your receipt will be read in a moment...")
+    await asyncio.to_thread(ocr_ready.wait, OCR_WARMUP_WAIT_SECONDS)
+
+
+def queue_notices(edit):
+    """Messages shown while a receipt waits for an OCR slot (see admission.ocr_queue)."""
+    async def on_queued(position):
+        await edit(f"⏳ Many receipts right now. Yours is #{position} in line and will be read shortly...")
+
+    async def on_busy():
+        await edit("🚦 Busy right now, retrying automatically. No need to resend.")
+
+    return {"on_queued": on_queued, "on_busy": on_busy}
 
 
 # ---------- Keyboards ----------
@@ -112,15 +154,32 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📸 Send a receipt image (UPI, Voucher, or GST Bill):", reply_markup=reply_markup)
 
 
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = health.snapshot()
+    lines = ["✅ Ready" if data["ready"] else "⏳ Warming up"]
+    for name, info in data["components"].items():
+        lines.append(f"• {name}: {info['state']}")
+    await update.message.reply_text("\n".join(lines))
+
+
 async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.media_group_id:
+        queue_media_group_item(update.message, context, update.message.photo[-1].file_id)
+        return
     try:
         await update.message.reply_text("🖼️ Image received. Processing...", reply_markup=ReplyKeyboardRemove())
+        if not ocr_ready.is_set():
+            await update.message.reply_text("⏳ OCR engine is warming up — pick the receipt type and it will be read as soon as it is ready.")
         user_id = update.message.from_user.id
         photo = update.message.photo[-1]
         file_id = photo.file_id
         context.user_data["last_file_id"] = file_id
         file = await context.bot.get_file(file_id)
         file_bytes = await file.download_as_bytearray()
+        duplicate = await asyncio.to_thread(find_duplicate_image, image_hash(file_bytes))
+        if duplicate:
+            await update.message.reply_text(duplicate_message(duplicate))
+            return
         user_images[user_id] = file_bytes
         user_state[user_id] = {"stage": "main_category"}
         await update.message.reply_text("🔘 Choose the receipt type:", reply_markup=main_category_keyboard())
@@ -129,257 +188,160 @@ async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Tap Retry:", reply_markup=retry_keyboard("retry_image_upload"))
 
 
-# ---------- OCR & Parsing ----------
-def preprocess_image_advanced(image):
-    """Multi-stage preprocessing for better OCR."""
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Full-resolution image or PDF uploads sent as files."""
+    message = update.message
+    if message.media_group_id:
+        queue_media_group_item(message, context, message.document.file_id, message.document.mime_type)
+        return
     try:
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        
-        height, width = img_cv.shape[:2]
-        if height < 1800 or width < 1800:
-            scale = 1800 / max(height, width)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            img_cv = cv2.resize(img_cv, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
-        
-        img_cv = cv2.fastNlMeansDenoisingColored(img_cv, None, 10, 10, 7, 15)
-        image = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-        
-        image = ImageEnhance.Contrast(image).enhance(1.8)
-        image = ImageEnhance.Sharpness(image).enhance(2.0)
-        image = ImageEnhance.Brightness(image).enhance(1.1)
-        
-        return image
+        await message.reply_text("📎 File received. Processing...", reply_markup=ReplyKeyboardRemove())
+        user_id = message.from_user.id
+        file = await context.bot.get_file(message.document.file_id)
+        file_bytes = await file.download_as_bytearray()
+        images = expand_upload(file_bytes, message.document.mime_type)
+
+        if not images:
+            await message.reply_text("⚠️ No receipt image found in this file. Send a JPEG, PNG or PDF.")
+            return
+
+        if len(images) == 1:
+            duplicate = await asyncio.to_thread(find_duplicate_image, image_hash(images[0]))
+            if duplicate:
+                await message.reply_text(duplicate_message(duplicate))
+                return
+            context.user_data["last_file_id"] = message.document.file_id
+            user_images[user_id] = images[0]
+            user_state[user_id] = {"stage": "main_category"}
+            await message.reply_text("🔘 Choose the receipt type:", reply_markup=main_category_keyboard())
+        else:
+            user_batches[user_id] = images
+            user_state[user_id] = {"stage": "main_category", "batch": True}
+            await message.reply_text(f"📚 {len(images)} receipts found. Choose the receipt type:", reply_markup=main_category_keyboard())
     except Exception as e:
-        logger.error(f"Preprocessing error: {e}")
-        if image.mode != 'RGB':
-            return image.convert('RGB')
-        return image
+        logger.error(f"Document error: {e}")
+        await message.reply_text("❌ Could not read this file. Please send it again.")
+
 
+def queue_media_group_item(message, context, file_id, mime_type=None):
+    """Collect album items; the batch is flushed once Telegram stops sending parts."""
+    group_id = message.media_group_id
+    group = media_groups.get(group_id)
+    if group is None:
+        group = media_groups[group_id] = {
+            "user_id": message.from_user.id,
+            "chat_id": message.chat_id,
+            "items": [],
+            "task": None,
+        }
+    group["items"].append((file_id, mime_type))
 
-def extract_text_from_image(image_stream):
-    """Extract text using PaddleOCR."""
+    if group["task"]:
+        group["task"].cancel()
+    group["task"] = asyncio.create_task(flush_media_group(group_id, context))
+
+
+async def flush_media_group(group_id, context):
     try:
-        image = Image.open(image_stream)
-        image = preprocess_image_advanced(image)
-        img_array = np.array(image)
-        
-        logger.info(f"Processing image shape: {img_array.shape}")
-        
-        result = ocr_engine.ocr(img_array, cls=True)
-        
-        if not result or not result[0]:
-            logger.warning("PaddleOCR returned no results")
-            return ""
-        
-        text_blocks = []
-        for line in result[0]:
-            if line and len(line) >= 2:
-                box = line[0]
-                text = line[1][0]
-                confidence = line[1][1]
-                
-                if confidence > 0.3:
-                    y_coord = box[0][1]
-                    text_blocks.append((y_coord, text, confidence))
-        
-        text_blocks.sort(key=lambda x: x[0])
-        full_text = "\n".join([block[1] for block in text_blocks])
-        
-        logger.info(f"✅ Extracted {len(text_blocks)} blocks, {len(full_text)} chars")
-        
-        return full_text
-    
-    except Exception as e:
-        logger.error(f"❌ OCR Error: {e}", exc_info=True)
-        return ""
-
-
-def extract_limited_fields(text, category):
-    """Extract key fields."""
-    amount = extract_amount(text)
-    datetime = extract_datetime(text)
-    transaction_id = extract_transaction_id(text)
-    person_name = extract_person_name(text)
-    upi_id = extract_upi_id(text)
-
-    logger.info(f"Amount: {amount} | DateTime: {datetime} | TxnID: {transaction_id}")
-
-    return "\n".join([
-        f"• Amount: {amount}",
-        f"• Date & Time: {datetime}",
-        f"• Transaction ID: {transaction_id}",
-        f"• Person Name: {person_name}",
-        f"• UPI ID: {upi_id}"
-    ])
+        await asyncio.sleep(MEDIA_GROUP_WAIT_SECONDS)
+    except asyncio.CancelledError:
+        return
 
+    group = media_groups.pop(group_id, None)
+    if not group:
+        return
 
-def is_valid_amount(amount_str):
+    user_id = group["user_id"]
+    chat_id = group["chat_id"]
     try:
-        clean = amount_str.replace(',', '').replace(' ', '').strip()
-        value = float(clean)
-        return 10 <= value <= 100000000
-    except:
-        return False
-
-def extract_amount(text):
-    """Enhanced amount extraction."""
-    text = text or ""
-    
-    # 1. ₹ symbol
-    matches = re.findall(r'₹\s*([0-9,]+(?:\.[0-9]{1,2})?)', text)
-    for match in matches:
-        val = match.replace(',', '').replace(' ', '')
-        if is_valid_amount(val):
-            try:
-                fv = float(val)
-                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}".rstrip('0').rstrip('.')
-            except:
-                continue
-    
-    # 2. Worded amount
-    m = re.search(r'Rupees\s+([A-Za-z\s\-]+?)\s+Only', text, re.IGNORECASE)
-    if m:
-        try:
-            num = w2n.word_to_num(m.group(1).strip().lower())
-            return f"₹{int(num)}" if float(num).is_integer() else f"₹{float(num):.2f}"
-        except:
-            pass
-    
-    # 3. Comma-formatted
-    matches = re.findall(r'\b(\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?)\b', text)
-    for match in matches:
-        val = match.replace(',', '')
-        if is_valid_amount(val):
-            try:
-                fv = float(val)
-                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}".rstrip('0').rstrip('.')
-            except:
-                continue
-    
-    # 4. After keywords
-    m = re.search(r'(?:Amount|Total|INR|Rs\.?|Value|Paid|Payment)\s*[:\-]?\s*([0-9,]+(?:\.[0-9]{1,2})?)', text, re.IGNORECASE)
-    if m:
-        val = m.group(1).replace(',', '')
-        if is_valid_amount(val):
-            try:
-                fv = float(val)
-                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}".rstrip('0').rstrip('.')
-            except:
-                pass
-    
-    # 5. Standalone numbers
-    matches = re.findall(r'\b([0-9]{3,7}(?:\.[0-9]{1,2})?)\b', text)
-    for val in matches:
-        if not re.match(r'^(19|20)\d{2}$', val) and is_valid_amount(val):
-            try:
-                fv = float(val)
-                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}"
-            except:
+        await context.bot.send_message(chat_id, f"🖼️ {len(group['items'])} files received. Downloading...")
+
+        async def download(file_id):
+            file = await context.bot.get_file(file_id)
+            return await file.download_as_bytearray()
+
+        downloads = await asyncio.gather(
+            *(download(file_id) for file_id, _ in group["items"]),
+            return_exceptions=True
+        )
+
+        images = []
+        for (file_id, mime_type), result in zip(group["items"], downloads):
+            if isinstance(result, Exception):
+                logger.error(f"Album download failed for {file_id}: {result}")
                 continue
-    
-    return "Not Found"
-
-def extract_transaction_id(text):
-    """Enhanced transaction ID extraction."""
-    text = text or ""
-    
-    # PhonePe T-ID
-    m = re.search(r'\b(T\d{18,25})\b', text)
-    if m:
-        return m.group(1)
-    
-    # Paytm UPI Ref with space
-    m = re.search(r'UPI\s*Ref\.?\s*No[:\s\-]*(\d{6,8}\s+\d{5,6})', text, re.IGNORECASE)
-    if m:
-        return m.group(1).replace(' ', '')
-    
-    # Paytm UPI Ref no space
-    m = re.search(r'UPI\s*Ref\.?\s*No[:\s\-]*(\d{12,13})', text, re.IGNORECASE)
-    if m:
-        return m.group(1)
-    
-    # Generic Transaction ID
-    m = re.search(r'Transaction\s*ID\s*[:\-\s]*([A-Z0-9\-]{6,60})', text, re.IGNORECASE)
-    if m:
-        return m.group(1).strip()
-    
-    # UTR
-    m = re.search(r'UTR[:\s]+(\d{10,15})', text, re.IGNORECASE)
-    if m:
-        return m.group(1)
-    
-    # T-prefix fallback
-    m = re.search(r'\b(T\d{15,30})\b', text)
-    if m:
-        return m.group(1)
-    
-    # Long number
-    matches = re.findall(r'\b(\d{12,15})\b', text)
-    for match in matches:
-        if not match.startswith(('91', '90', '80', '70', '60')):
-            return match
-    
-    return "Not Found"
-
-
-def clean_name(name):
-    if not name:
-        return ""
-    name = re.sub(r'\s+', ' ', name).strip()
-    name = name.strip(':.')
-    name = re.sub(r'[^A-Za-z0-9 &\.\-]', '', name)
-    return name.strip()
-
-
-def extract_person_name(text):
-    text = text or ""
-    
-    m = re.search(r'Paid\s+to\s*[:\-\s]*([A-Z][A-Za-z\s\.\-&]{2,50})', text, re.IGNORECASE)
-    if m:
-        name = clean_name(m.group(1))
-        if name and len(name) > 2:
-            return name
-    
-    m = re.search(r'\bTo\s*[:\-\s]*([A-Z][A-Za-z\s\.\-&]{2,50})', text, re.IGNORECASE)
-    if m:
-        name = clean_name(m.group(1))
-        if name and len(name) > 2 and name.lower() not in ['transaction', 'payment', 'successful']:
-            return name
-    
-    m = re.search(r'(?:Verified|Banking)\s+Name\s*[:\-\s]*([A-Za-z][A-Za-z\s\.\-&]{2,50})', text, re.IGNORECASE)
-    if m:
-        name = clean_name(m.group(1))
-        if name and len(name) > 2:
-            return name
-    
-    return "Not Found"
-
-
-def extract_upi_id(text):
-    m = re.search(r'\b([A-Za-z0-9._\-]+@[A-Za-z0-9._\-]+)\b', text)
-    if m:
-        return m.group(1).lower()
-    return "Not Found"
-
-
-def extract_datetime(text):
-    m = re.search(r'(\d{1,2}:\d{2})\s*(?:am|pm)?\s+on\s+(\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4})', text, re.IGNORECASE)
-    if m:
-        return f"{m.group(1)} on {m.group(2)}"
-    
-    m = re.search(r'(\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4})\s*,?\s+(\d{1,2}:\d{2}\s*[APap][Mm])', text)
-    if m:
-        return f"{m.group(2)} on {m.group(1)}"
-    
-    m = re.search(r'\d{1,2}/\d{1,2}/\d{4}[ \t]+\d{1,2}:\d{2}', text)
-    if m:
-        return m.group(0).strip()
-    
-    return "Not Found"
+            images.extend(expand_upload(result, mime_type))
+
+        if not images:
+            await context.bot.send_message(chat_id, "❌ Could not download the album. Please send it again.")
+            return
+
+        async with user_locks.hold(user_id):
+            user_batches[user_id] = images
+            user_state[user_id] = {"stage": "main_category", "batch": True}
+        await context.bot.send_message(
+            chat_id,
+            f"📚 {len(images)} receipts ready. Choose the receipt type for all of them:",
+            reply_markup=main_category_keyboard()
+        )
+    except Exception as e:
+        logger.error(f"❌ Album error: {e}", exc_info=True)
+        await context.bot.send_message(chat_id, "❌ Album processing failed. Please send it again.")
+
+
+def expand_upload(file_bytes, mime_type=None):
+    """Return the receipt images contained in an upload (PDF pages yield their embedded images)."""
+    if mime_type == "application/pdf" or bytes(file_bytes[:5]) == b"%PDF-":
+        return extract_pdf_images(file_bytes)
+    return [file_bytes]
+
+
+def extract_pdf_images(pdf_bytes):
+    from PyPDF2 import PdfReader
+
+    images = []
+    try:
+        reader = PdfReader(BytesIO(pdf_bytes))
+        for page in reader.pages:
+            for page_image in page.images:
+                images.append(page_image.data)
+    except Exception as e:
+        logger.error(f"❌ PDF image extraction failed: {e}")
+    logger.info(f"Extracted {len(images)} images from PDF")
+    return images
+
+
+
+
+async def extract_text_from_images(image_bytes_list, job_class, category, edit):
+    """
+    Batched OCR: every image holds its own OCR slot (admission.ocr_queue) while
+    it is read, so an album takes as many slots as it reads images at once and
+    cannot crowd out other users beyond its priority. At most the fan-out width
+    (OCR_CONCURRENCY workers, or PREPROCESS_WORKERS in-process) is in line at a
+    time, so a large album does not fill the queue by itself.
+    Raises Overloaded like ocr_queue.slot.
+    """
+    width = OCR_CONCURRENCY if OCR_EXECUTION == "process" else PREPROCESS_WORKERS
+    fan_out = asyncio.Semaphore(max(1, width))
+    notices = queue_notices(edit)
+    cost = ocr_priority.job_cost(category)
+
+    async def read(index, image_bytes):
+        async with fan_out:
+            # Only the first image reports the album's place in line
+            async with ocr_queue.slot(job_class, cost, **(notices if index == 0 else {})):
+                return await asyncio.to_thread(read_album_image, image_bytes)
+
+    tasks = [asyncio.create_task(read(index, image)) for index, image in enumerate(image_bytes_list)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
 
 
 # ---------- Callback handler ----------
@@ -406,20 +368,27 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if data == "retry_upi_menu":
-        if user_id in user_images:
-            user_state[user_id] = {"stage": "upi_subtype"}
+        if user_id in user_images or user_id in user_batches:
+            # Keep the batch flag so an album or PDF still goes to process_batch
+            batch = user_state.get(user_id, {}).get("batch", user_id not in user_images)
+            user_state[user_id] = {"stage": "upi_subtype", "batch": batch}
             await query.edit_message_text("💡 Choose UPI type:", reply_markup=upi_subtype_keyboard())
         else:
             await query.edit_message_text("Tap Retry:", reply_markup=retry_keyboard("retry_image_upload"))
         return
 
+    if data.startswith("retry_batch_"):
+        category = data.replace("retry_batch_", "")
+        await process_batch(query, user_id, category, retry=True)
+        return
+
     if data.startswith("retry_process_"):
         category = data.replace("retry_process_", "")
-        await process_receipt(query, user_id, category)
+        await process_receipt(query, user_id, category, retry=True)
         return
 
     if data in ("upi", "voucher", "gstbill", "PhonePe", "Paytm", "GooglePay", "Others"):
-        if user_id not in user_images:
+        if user_id not in user_images and user_id not in user_batches:
             await query.edit_message_text("Tap Retry:", reply_markup=retry_keyboard("retry_image_upload"))
             return
 
@@ -442,87 +411,266 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data["last_category"] = data
             user_state[user_id]["stage"] = "final"
 
-            if user_state[user_id].get("category") == "gstbill":
-                await process_receipt(query, user_id, category="gstbill_" + data)
+            category = "gstbill_" + data if user_state[user_id].get("category") == "gstbill" else data
+            if user_state[user_id].get("batch"):
+                await process_batch(query, user_id, category)
             else:
-                await process_receipt(query, user_id, category=data)
+                await process_receipt(query, user_id, category)
             return
 
     await query.edit_message_text("Tap Retry:", reply_markup=retry_keyboard("retry_image_upload"))
 
 
-async def process_receipt(query, user_id, category):
+
+RECEIPT_STAGES = [
+    ("downloaded", "Receipt received", "⏳ Preparing the image..."),
+    ("preprocessed", "Image prepared", "⏳ Reading the text..."),
+    ("text_found", "Text found", "⏳ Reading the details..."),
+    ("parsed", "Details read", "💾 Saving..."),
+]
+
+
+def receipt_progress(progress):
+    """``on_stage`` callback that shows completed receipt stages through ``progress``."""
+    done = {}
+
+    def on_stage(stage, detail=None):
+        done[stage] = detail
+        lines = []
+        next_step = ""
+        for name, label, waiting in RECEIPT_STAGES:
+            if name not in done:
+                break
+            lines.append(f"✔️ {label}")
+            next_step = waiting
+        fields = done.get("parsed")
+        if fields:
+            lines.append(f"\n💰 Amount: {fields.get('Amount', 'Not Found')}")
+            lines.append(f"🔖 Transaction ID: {fields.get('Transaction ID', 'Not Found')}")
+        progress.update("\n".join(lines + ["", next_step]))
+
+    return on_stage
+
+
+async def process_receipt(query, user_id, category, retry=False):
+    # The upload may have expired (PENDING_UPLOAD_TTL) or been evicted since the photo was sent
+    image = user_images.get(user_id)
+    if image is None:
+        await query.edit_message_text("Tap Retry:", reply_markup=retry_keyboard("retry_image_upload"))
+        return
+
+    job_class = ocr_priority.job_class(retry=retry)
+    progress = ProgressReporter(query.edit_message_text)
     try:
-        image_stream = BytesIO(user_images[user_id])
-        text = extract_text_from_image(image_stream)
-        
-        if not text or len(text.strip()) < 10:
-            logger.warning(f"Insufficient text: {len(text)} chars")
-            await query.edit_message_text("⚠️ Could not extract text. Tap Retry:", reply_markup=retry_keyboard(f"retry_process_{category}"))
+        if OCR_EXECUTION == "queue":
+            await enqueue_receipt(query, user_id, category, image, job_class)
             return
 
-        formatted = extract_limited_fields(text, category)
-        fields = {}
-        for line in formatted.splitlines():
-            if line.startswith("• "):
-                try:
-                    key, val = line[2:].split(":", 1)
-                    fields[key.strip()] = val.strip()
-                except ValueError:
-                    continue
-
-        record_id = insert_extracted_receipt(user_id, category, fields)
-        if record_id:
-            transaction_id = fields.get('Transaction ID', 'unknown')
-            type_param = category if not category.startswith("gstbill") else "gstbill"
-            link = f"http://192.168.1.41:5000/voucher?transaction_id={transaction_id}&type={type_param}"
-            
-            success_msg = "✅ Data Saved!"
-            # for key, value in fields.items():
-                # success_msg += f"• {key}: {value}\n"
-            success_msg += f"\n\n fill voucher:🌐 {link}"
-            
-            await query.edit_message_text(success_msg)
-            
-            if user_id in user_images:
-                del user_images[user_id]
+        on_stage = receipt_progress(progress)
+        on_stage("downloaded")
+        await wait_for_ocr(progress.show)
+        async with ocr_queue.slot(job_class, ocr_priority.job_cost(category), **queue_notices(progress.show)):
+            message, retry = await asyncio.to_thread(read_and_store_receipt, user_id, category, image, on_stage)
+
+        if retry:
+            await progress.finish(message, reply_markup=retry_keyboard(retry))
         else:
-            await query.edit_message_text("❌ Database error. Tap Retry:", reply_markup=retry_keyboard(f"retry_process_{category}"))
+            await progress.finish(message)
+            user_images.pop(user_id, None)
             
+    except Overloaded:
+        await progress.finish("🚦 Too many receipts right now. Tap Retry in a few minutes:", reply_markup=retry_keyboard(f"retry_process_{category}"))
     except Exception as e:
         logger.error(f"❌ Processing error: {e}", exc_info=True)
-        await query.edit_message_text("❌ Failed. Tap Retry:", reply_markup=retry_keyboard(f"retry_process_{category}"))
+        await progress.finish("❌ Failed. Tap Retry:", reply_markup=retry_keyboard(f"retry_process_{category}"))
+
+
+async def enqueue_receipt(query, user_id, category, image, job_class):
+    """Queue mode: an OCR worker reads the receipt and edits this message with the result."""
+    from job_queue import enqueue_ocr_job
+
+    job_id = await asyncio.to_thread(
+        enqueue_ocr_job, user_id, query.message.chat_id, query.message.message_id, category, image, job_class
+    )
+    if job_id:
+        await query.edit_message_text("📥 Receipt queued. The voucher link will appear here shortly...")
+    else:
+        await query.edit_message_text("❌ Could not queue the receipt. Tap Retry:", reply_markup=retry_keyboard(f"retry_process_{category}"))
+
+
+async def process_batch(query, user_id, category, retry=False):
+    """OCR every receipt of an album/PDF upload and store them with a single insert."""
+    images = user_batches.get(user_id)
+    if not images:
+        await query.edit_message_text("Tap Retry:", reply_markup=retry_keyboard("retry_image_upload"))
+        return
+
+    try:
+        job_class = ocr_priority.job_class(retry=retry, batch=True)
+        if OCR_EXECUTION == "queue":
+            await enqueue_batch(query, user_id, category, images, job_class)
+            return
+
+        await wait_for_ocr(query.edit_message_text)
+        await query.edit_message_text(f"⏳ Reading {len(images)} receipts...")
+
+        # Resubmitted images are answered from the existing record without OCR
+        digests = [image_hash(image) for image in images]
+        duplicates = {}
+        seen = {}
+        for index, digest in enumerate(digests, start=1):
+            if digest in seen:
+                duplicates[index] = seen[digest]
+                continue
+            seen[digest] = None
+            receipt = await asyncio.to_thread(find_duplicate_image, digest)
+            if receipt:
+                duplicates[index] = receipt
+        pending = [(index, image) for index, image in enumerate(images, start=1) if index not in duplicates]
+
+        texts = []
+        if pending:
+            texts = await extract_text_from_images([image for _, image in pending], job_class, category, query.edit_message_text)
+
+        parsed = []
+        failed = []
+        for (index, _), text in zip(pending, texts):
+            if not text or len(text.strip()) < 10:
+                failed.append(index)
+                continue
+            fields = extract_fields(text, category)
+            receipt = await asyncio.to_thread(find_duplicate_transaction, fields.get('Transaction ID'))
+            if receipt:
+                duplicates[index] = receipt
+                continue
+            fields["image_hash"] = digests[index - 1]
+            parsed.append((index, fields))
+
+        if not parsed and not duplicates:
+            await query.edit_message_text("⚠️ Could not extract text from any receipt. Tap Retry:", reply_markup=retry_keyboard(f"retry_batch_{category}"))
+            return
+
+        record_ids = await asyncio.to_thread(insert_extracted_receipts, user_id, category, [fields for _, fields in parsed]) if parsed else []
+        if record_ids is None:
+            await query.edit_message_text("❌ Database error. Tap Retry:", reply_markup=retry_keyboard(f"retry_batch_{category}"))
+            return
+
+        links = {}
+        for (index, fields), record_id in zip(parsed, record_ids):
+            transaction_id = fields.get('Transaction ID', 'unknown')
+            remember_receipt({'id': record_id, 'transaction_id': transaction_id, 'category': category, 'image_hash': fields["image_hash"]})
+            links[index] = f"{fields.get('Amount', 'Not Found')} — 🌐 {build_voucher_link(transaction_id, category)}"
+        for index, receipt in duplicates.items():
+            if receipt:
+                links[index] = f"♻️ already submitted — 🌐 {build_voucher_link(receipt.get('transaction_id') or 'unknown', receipt.get('category') or category)}"
+            else:
+                links[index] = "♻️ same image as an earlier receipt in this album"
+
+        lines = [f"✅ {len(parsed)} of {len(images)} receipts saved!", ""]
+        for index in sorted(links):
+            lines.append(f"{index}. {links[index]}")
+        if failed:
+            lines.append("")
+            lines.append(f"⚠️ No text found in receipt(s): {', '.join(str(i) for i in failed)}")
+
+        await query.edit_message_text("\n".join(lines))
+        user_batches.pop(user_id, None)
+
+    except Overloaded:
+        await query.edit_message_text("🚦 Too many receipts right now. Tap Retry in a few minutes:", reply_markup=retry_keyboard(f"retry_batch_{category}"))
+    except Exception as e:
+        logger.error(f"❌ Batch processing error: {e}", exc_info=True)
+        await query.edit_message_text("❌ Failed. Tap Retry:", reply_markup=retry_keyboard(f"retry_batch_{category}"))
+
+
+async def enqueue_batch(query, user_id, category, images, job_class):
+    """Queue mode: every album receipt becomes its own job and gets its own reply."""
+    from job_queue import enqueue_ocr_job
+
+    queued = 0
+    for image in images:
+        if await asyncio.to_thread(enqueue_ocr_job, user_id, query.message.chat_id, None, category, image, job_class):
+            queued += 1
+    if queued:
+        await query.edit_message_text(f"📥 {queued} of {len(images)} receipts queued. Each voucher link will be sent as it is ready.")
+        user_batches.pop(user_id, None)
+    else:
+        await query.edit_message_text("❌ Could not queue the receipts. Tap Retry:", reply_markup=retry_keyboard(f"retry_batch_{category}"))
+
+
+# ---------- Telegram Bot API over HTTP (used outside the bot's event loop) ----------
+def telegram_api(method, payload):
+    url = f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/{method}"
+    response = requests.post(url, json=payload, timeout=30)
+    if response.status_code != 200:
+        logger.error(f"❌ Telegram {method} failed: {response.text}")
+    return response
+
+
+def retry_markup_json(callback_data):
+    return {"inline_keyboard": [[{"text": "🔄 Retry", "callback_data": callback_data}]]}
 
 
 # ---------- Telegram Daily Status ----------
 def send_daily_status():
+    from voucher import get_last_24h_status
     try:
         status_text = get_last_24h_status()
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
         for chat_id in CHAT_IDS:
-            payload = {"chat_id": chat_id, "text": status_text}
-            requests.post(url, json=payload)
+            telegram_api("sendMessage", {"chat_id": chat_id, "text": status_text})
             logger.info(f"✅ Status sent to {chat_id}")
     except Exception as e:
         logger.error(f"❌ Status send failed: {e}")
 
 
+# ---------- Startup ----------
+def start_database_init():
+    def run():
+        health.set_component_state("database", "starting")
+        with health.phase("database_init"):
+            ok = init_db()
+        health.set_component_state("database", "ready" if ok else "failed")
+
+    threading.Thread(target=run, name="database-init", daemon=True).start()
+
+
 # ---------- Voucher Server ----------
 def start_voucher_server():
+    def serve():
+        # Flask and the voucher module are imported in the server thread, off the startup path
+        from voucher import run_voucher_app
+        run_voucher_app(host='0.0.0.0', port=5000, use_reloader=False)
+
     try:
-        thread = threading.Thread(
-            target=run_voucher_app,
-            kwargs={'host': '0.0.0.0', 'port': 5000, 'use_reloader': False},
-            daemon=True
-        )
+        thread = threading.Thread(target=serve, daemon=True)
         thread.start()
         logger.info("✅ Voucher server started on port 5000")
     except Exception as e:
         logger.error(f"❌ Voucher server failed: {e}")
 
 
-# ---------- Main ----------
-if __name__ == "__main__":
+# ---------- Bot ----------
+def build_bot_application():
+    app_telegram = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .build()
+    )
+    # Updates run concurrently across users but strictly in order per user
+    app_telegram.add_handler(CommandHandler("start", ordered_per_user(start)))
+    app_telegram.add_handler(CommandHandler("status", status))
+    app_telegram.add_handler(MessageHandler(filters.PHOTO, admit_upload(handle_image)))
+    app_telegram.add_handler(MessageHandler(filters.Document.IMAGE | filters.Document.PDF, admit_upload(handle_document)))
+    app_telegram.add_handler(CallbackQueryHandler(ordered_per_user(handle_callback)))
+    app_telegram.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), ordered_per_user(start)))
+    return app_telegram
+
+
+def run_bot(embedded_web=True, with_scheduler=True):
+    """Run the Telegram bot; the all-in-one mode also hosts the web app and the scheduler."""
     try:
         logger.info("=" * 70)
         logger.info("🚀 Starting OCR Receipt Bot")
@@ -533,32 +681,75 @@ if __name__ == "__main__":
             logger.error("❌ TELEGRAM_BOT_TOKEN not found in environment!")
             exit(1)
         
-        logger.info("Initializing database...")
-        init_db()
+        # Slow dependencies come up in the background; /readyz and /status report progress
+        health.start_status_server(port=STATUS_PORT)
+        if OCR_EXECUTION in ("inline", "process"):
+            start_ocr_warmup()
+        else:
+            ocr_ready.set()
+        start_database_init()
         
-        logger.info("Starting voucher server...")
-        start_voucher_server()
+        if embedded_web and VOUCHER_SERVER_MODE == "embedded":
+            with health.phase("voucher_server"):
+                logger.info("Starting voucher server...")
+                start_voucher_server()
+        else:
+            logger.info("Voucher server is served externally (wsgi.py)")
         
-        logger.info("Setting up scheduler...")
-        scheduler = BackgroundScheduler(timezone="Asia/Kolkata")
-        scheduler.add_job(send_daily_status, "cron", hour=0, minute=0)
-        scheduler.start()
-        logger.info("✅ Scheduler started")
+        if with_scheduler:
+            with health.phase("scheduler"):
+                logger.info("Setting up scheduler...")
+                scheduler = BackgroundScheduler(timezone="Asia/Kolkata")
+                scheduler.add_job(send_daily_status, "cron", hour=0, minute=0)
+                scheduler.start()
+                logger.info("✅ Scheduler started")
         
-        logger.info("Building Telegram bot...")
-        app_telegram = ApplicationBuilder().token(BOT_TOKEN).build()
-        app_telegram.add_handler(CommandHandler("start", start))
-        app_telegram.add_handler(MessageHandler(filters.PHOTO, handle_image))
-        app_telegram.add_handler(CallbackQueryHandler(handle_callback))
-        app_telegram.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), start))
+        with health.phase("bot_build"):
+            logger.info("Building Telegram bot...")
+            app_telegram = build_bot_application()
         
-        logger.info("✅ Bot ready! Starting polling...")
+        health.record_phase("time_to_polling", time.time() - health.PROCESS_STARTED)
+        logger.info(f"✅ Bot ready in {time.time() - health.PROCESS_STARTED:.2f}s! Starting {BOT_MODE}...")
         logger.info("=" * 70)
         
-        app_telegram.run_polling()
+        if BOT_MODE == "webhook":
+            run_webhook(app_telegram)
+        else:
+            app_telegram.run_polling()
         
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
         logger.error(f"❌ Fatal error: {e}", exc_info=True)
-        exit(1)
\ No newline at end of file
+        exit(1)
+    finally:
+        receipt_writer.close()
+        stop_ocr_workers()
+
+
+def run_webhook(app_telegram):
+    """
+    Serve updates on http://WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH.
+
+    Run exactly one bot process per WEBHOOK_URL: the dialog state (user_images,
+    user_batches, user_state, media_groups, user_locks) lives in process
+    memory, so a user's follow-up updates must reach the process that saw the
+    upload. Requests without the WEBHOOK_SECRET header are rejected.
+    post_fake_update.py drives it locally.
+    """
+    if not WEBHOOK_URL:
+        logger.error("❌ BOT_MODE=webhook requires WEBHOOK_URL (the public base URL Telegram posts to)")
+        exit(1)
+    app_telegram.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+
+
+# ---------- Main ----------
+if __name__ == "__main__":
+    run_bot()
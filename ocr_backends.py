@@ -0,0 +1,120 @@
+# ocr_backends.py
+"""
+OCR inference backends.
+
+Every backend is a PaddleOCR pipeline (detector, angle classifier, recognizer)
+with a different inference runtime or model set underneath, so the rest of the
+code (orientation.ocr_upright, ocr_result_to_text) is the same for all of them.
+OCR_BACKEND selects one:
+
+    paddle          Paddle Inference, default CPU kernels (previous behaviour)
+    paddle-mkldnn   Paddle Inference with oneDNN (MKLDNN) kernels
+    onnx            ONNX Runtime with det/rec/cls models exported by paddle2onnx
+    paddle-int8     Paddle Inference + MKLDNN with int8-quantized (PaddleSlim) models
+    onnx-int8       ONNX Runtime with int8-quantized ONNX models
+
+Model locations come from the environment; a backend whose models are missing
+fails at build time with a clear error instead of silently falling back:
+
+    OCR_ONNX_DET_MODEL / OCR_ONNX_REC_MODEL / OCR_ONNX_CLS_MODEL                 .onnx files
+    OCR_INT8_DET_MODEL_DIR / OCR_INT8_REC_MODEL_DIR / OCR_INT8_CLS_MODEL_DIR     inference model dirs
+    OCR_ONNX_INT8_DET_MODEL / OCR_ONNX_INT8_REC_MODEL / OCR_ONNX_INT8_CLS_MODEL  .onnx files
+
+Compare the backends on real receipts with ocr_benchmark.py before switching.
+"""
+
+import os
+import logging
+
+import thread_budget
+
+OCR_BACKEND = os.getenv("OCR_BACKEND", "paddle")
+
+logger = logging.getLogger(__name__)
+
+
+def model_paths(prefix, suffix="_MODEL"):
+    """det/rec/cls model locations from ``<prefix>_<PART><suffix>``; all three must exist"""
+    paths = {}
+    for part in ("det", "rec", "cls"):
+        name = f"{prefix}_{part.upper()}{suffix}"
+        path = os.getenv(name)
+        if not path or not os.path.exists(path):
+            raise ValueError(f"{name} must point to an existing {part} model for this OCR backend")
+        paths[f"{part}_model_dir"] = path
+    return paths
+
+
+def cpu_threads():
+    # Intra-op threads per engine from the process thread budget (OCR_CPU_THREADS overrides it)
+    return thread_budget.current()["paddle_cpu_threads"]
+
+
+def mkldnn_settings():
+    # PaddleOCR fixes the oneDNN shape cache at 10 entries; it has no argument for it
+    return {"enable_mkldnn": True, "cpu_threads": cpu_threads()}
+
+
+def paddle_settings():
+    return {"enable_mkldnn": False, "cpu_threads": cpu_threads()}
+
+
+def onnx_settings():
+    return {"use_onnx": True, "cpu_threads": cpu_threads(), **model_paths("OCR_ONNX")}
+
+
+def paddle_int8_settings():
+    return {**mkldnn_settings(), **model_paths("OCR_INT8", "_MODEL_DIR")}
+
+
+def onnx_int8_settings():
+    return {"use_onnx": True, "cpu_threads": cpu_threads(), **model_paths("OCR_ONNX_INT8")}
+
+
+BACKENDS = {
+    "paddle": paddle_settings,
+    "paddle-mkldnn": mkldnn_settings,
+    "onnx": onnx_settings,
+    "paddle-int8": paddle_int8_settings,
+    "onnx-int8": onnx_int8_settings,
+}
+
+
+def backend_settings(base_settings, backend=None):
+    """PaddleOCR keyword arguments for ``backend`` on top of the shared ``base_settings``"""
+    backend = backend or OCR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown OCR_BACKEND '{backend}', choose from: {', '.join(BACKENDS)}")
+    return {**base_settings, **BACKENDS[backend]()}
+
+
+def build_engine(base_settings, backend=None):
+    """Build a PaddleOCR engine running on the selected backend"""
+    from paddleocr import PaddleOCR
+    backend = backend or OCR_BACKEND
+    settings = backend_settings(base_settings, backend)
+    logger.info(f"Initializing PaddleOCR ({backend} backend)...")
+    engine = PaddleOCR(**settings)
+    if settings.get("use_onnx"):
+        limit_onnx_threads(engine, settings)
+    engine.backend_name = backend
+    return engine
+
+
+def limit_onnx_threads(engine, settings):
+    """
+    PaddleOCR opens its ONNX Runtime sessions with default options, which ignore
+    cpu_threads and use one thread per core. Reopen them within the thread budget.
+    """
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = cpu_threads()
+    options.inter_op_num_threads = 1
+    for stage, model in (("text_detector", "det_model_dir"), ("text_recognizer", "rec_model_dir"), ("text_classifier", "cls_model_dir")):
+        # The classifier only exists with use_angle_cls
+        predictor = getattr(engine, stage, None)
+        if predictor is None:
+            continue
+        session = ort.InferenceSession(settings[model], sess_options=options, providers=["CPUExecutionProvider"])
+        predictor.predictor = session
+        predictor.input_tensor = session.get_inputs()[0]
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Accuracy-vs-latency benchmark of the OCR backends (see ocr_backends.py).
+
+Every image of the corpus is preprocessed once, then OCRed by each backend
+with the same code path the bot uses (orientation.ocr_upright + extract_fields).
+Latency covers OCR inference only, after one warm-up image per backend.
+
+    python ocr_benchmark.py /data/receipts --backends paddle,paddle-mkldnn,onnx --labels labels.jsonl
+
+The labels file is optional JSONL with one object per image:
+
+    {"file": "phonepe/0001.jpg", "category": "PhonePe", "amount": "1,250", "transaction_id": "T2405..."}
+
+Without labels, every backend is scored against the first one listed.
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+from bulk_ingest import iter_sources, read_source
+from dedup import normalize_transaction_id
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_labels(path):
+    if not path:
+        return {}
+    with open(path) as f:
+        return {entry["file"]: entry for entry in map(json.loads, filter(str.strip, f))}
+
+
+def normalize_amount(value):
+    try:
+        return round(float(str(value).replace(',', '').replace('₹', '').strip()), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_corpus(source, limit):
+    import image_pipeline
+    corpus = []
+    for key, handle in iter_sources(source):
+        if limit and len(corpus) >= limit:
+            break
+        try:
+            # prepare_for_ocr returns a reused buffer; keep a private copy per image
+            corpus.append((key, image_pipeline.prepare_for_ocr(read_source(handle)).copy()))
+        except Exception as e:
+            logger.warning(f"Skipping {key}: {e}")
+    return corpus
+
+
+def run_backend(backend, corpus, category, labels):
+    import receipt_ocr
+    import ocr_backends
+    from orientation import ocr_upright
+
+    started = time.perf_counter()
+    engine = ocr_backends.build_engine(receipt_ocr.OCR_SETTINGS, backend)
+    ocr_upright(engine, corpus[0][1])
+    load_seconds = time.perf_counter() - started
+
+    latencies = []
+    fields_by_key = {}
+    for key, image in corpus:
+        started = time.perf_counter()
+        result = ocr_upright(engine, image)
+        latencies.append((time.perf_counter() - started) * 1000)
+        text = receipt_ocr.ocr_result_to_text(result)
+        fields_by_key[key] = receipt_ocr.extract_fields(text, labels.get(key, {}).get("category", category))
+    return load_seconds, latencies, fields_by_key
+
+
+def score(fields_by_key, expected_by_key):
+    """Share of images whose amount / transaction ID match the expected values"""
+    amounts = txns = total = 0
+    for key, expected in expected_by_key.items():
+        fields = fields_by_key.get(key)
+        if fields is None:
+            continue
+        total += 1
+        if normalize_amount(fields.get("Amount")) == normalize_amount(expected.get("amount")):
+            amounts += 1
+        if normalize_transaction_id(fields.get("Transaction ID")) == normalize_transaction_id(expected.get("transaction_id")):
+            txns += 1
+    if not total:
+        return None, None
+    return amounts / total, txns / total
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Compare OCR backends on a receipt corpus")
+    parser.add_argument("corpus", help="directory, .zip or .tar(.gz) of receipt images")
+    parser.add_argument("--backends", default="paddle,paddle-mkldnn", help="comma-separated OCR_BACKEND names")
+    parser.add_argument("--labels", help="JSONL with expected amount/transaction_id per file")
+    parser.add_argument("--category", default="PhonePe", help="category used for field extraction")
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N images")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    corpus = load_corpus(args.corpus, args.limit)
+    if not corpus:
+        print("No images found")
+        return 1
+    print(f"Corpus: {len(corpus)} images")
+
+    reference = None
+    rows = []
+    for backend in [name.strip() for name in args.backends.split(",") if name.strip()]:
+        try:
+            load_seconds, latencies, fields_by_key = run_backend(backend, corpus, args.category, labels)
+        except Exception as e:
+            print(f"❌ {backend}: {e}")
+            continue
+
+        if labels:
+            expected = labels
+        else:
+            if reference is None:
+                reference = {key: {"amount": f.get("Amount"), "transaction_id": f.get("Transaction ID")}
+                             for key, f in fields_by_key.items()}
+            expected = reference
+        amount_acc, txn_acc = score(fields_by_key, expected)
+        rows.append((backend, load_seconds, latencies, amount_acc, txn_acc))
+
+    def pct(value):
+        return "   n/a" if value is None else f"{value * 100:5.1f}%"
+
+    print(f"\n{'backend':<15} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'amount':>7} {'txn id':>7}")
+    for backend, load_seconds, latencies, amount_acc, txn_acc in rows:
+        print(f"{backend:<15} {load_seconds:>7.1f} {percentile(latencies, 0.5):>8.0f} {percentile(latencies, 0.95):>8.0f} "
+              f"{statistics.mean(latencies):>8.0f} {pct(amount_acc):>7} {pct(txn_acc):>7}")
+    if not labels and rows:
+        print(f"\nAccuracy is agreement with '{rows[0][0]}' (no --labels given)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,78 @@
+# ocr_priority.py
+"""
+Priority classes for OCR work, with aging.
+
+Every OCR request belongs to a class:
+
+    retry        the user tapped Retry on a failed receipt
+    interactive  a single receipt sent in Telegram
+    batch        an album or multi-page PDF sent in Telegram
+    bulk         backfills queued by bulk_ingest.py --enqueue (job_class=BULK)
+
+Requests are ordered by a virtual-clock key (weighted fair queueing): each
+class is credited OCR_PRIORITY_UNIT_SECONDS / weight of OCR time per receipt,
+and a request's key is when its class would finish it at that rate. When
+several classes have work, each gets OCR time in proportion to its weight
+(OCR_WEIGHT_RETRY 8, OCR_WEIGHT_INTERACTIVE 4, OCR_WEIGHT_BATCH 2,
+OCR_WEIGHT_BULK 1). A large backlog therefore gets keys spread far into the
+future, so new interactive receipts slot in ahead of most of it. Keys never
+change after they are assigned, so every waiting request ages: once the clock
+passes its key, it is ahead of anything that arrives later, and nothing starves.
+
+GST bills have more text than UPI screenshots and count as OCR_GSTBILL_COST
+receipts each.
+"""
+
+import os
+import time
+
+RETRY = "retry"
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BULK = "bulk"
+
+# Stored in ocr_jobs.priority; higher runs sooner when keys tie
+CLASS_RANK = {BULK: 0, BATCH: 1, INTERACTIVE: 2, RETRY: 3}
+RANK_CLASS = {rank: name for name, rank in CLASS_RANK.items()}
+
+CLASS_WEIGHTS = {
+    RETRY: float(os.getenv("OCR_WEIGHT_RETRY", "8")),
+    INTERACTIVE: float(os.getenv("OCR_WEIGHT_INTERACTIVE", "4")),
+    BATCH: float(os.getenv("OCR_WEIGHT_BATCH", "2")),
+    BULK: float(os.getenv("OCR_WEIGHT_BULK", "1")),
+}
+UNIT_SECONDS = float(os.getenv("OCR_PRIORITY_UNIT_SECONDS", "2"))
+GSTBILL_COST = float(os.getenv("OCR_GSTBILL_COST", "2"))
+
+
+def job_class(retry=False, batch=False):
+    if retry:
+        return RETRY
+    return BATCH if batch else INTERACTIVE
+
+
+def job_cost(category, images=1):
+    """OCR work of a request, in receipts"""
+    per_image = GSTBILL_COST if str(category).startswith("gstbill") else 1
+    return max(1, images) * per_image
+
+
+def class_step(job_class_name, cost=1):
+    """Virtual OCR seconds one request of ``cost`` receipts takes from its class"""
+    return cost * UNIT_SECONDS / CLASS_WEIGHTS[job_class_name]
+
+
+class VirtualClock:
+    """Assign ordering keys to requests; lower keys run first."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._finish = {}
+
+    def key(self, job_class_name, cost=1):
+        now = self._clock()
+        # An idle class starts again from now instead of using up old credit
+        start = max(now, self._finish.get(job_class_name, now))
+        finish = start + class_step(job_class_name, cost)
+        self._finish[job_class_name] = finish
+        return finish
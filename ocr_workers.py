@@ -0,0 +1,257 @@
+# ocr_workers.py
+"""
+Supervised OCR worker processes.
+
+PaddleOCR and OpenCV keep growing their resident memory over long runs, so in
+OCR_EXECUTION=process mode the models live in child processes that are
+recycled regularly instead of in the bot process itself:
+
+* each worker loads the engine once, then OCRs one image per request;
+* after OCR_WORKER_MAX_TASKS images, or once its RSS passes
+  OCR_WORKER_MAX_RSS_MB, a replacement is started and warmed up while the old
+  worker keeps serving; only when the replacement is ready is the old one
+  retired, so capacity never drops during recycling;
+* a worker that crashes or exceeds OCR_TASK_TIMEOUT is killed and replaced.
+
+Workers are started with "spawn" so they never inherit the bot's threads,
+sockets or event loop.
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+
+import health
+import thread_budget
+
+OCR_WORKER_MAX_TASKS = int(os.getenv("OCR_WORKER_MAX_TASKS", "500"))
+OCR_WORKER_MAX_RSS_MB = int(os.getenv("OCR_WORKER_MAX_RSS_MB", "1500"))
+OCR_TASK_TIMEOUT = float(os.getenv("OCR_TASK_TIMEOUT", "120"))
+OCR_WORKER_START_TIMEOUT = float(os.getenv("OCR_WORKER_START_TIMEOUT", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # Peak rather than current RSS, but still a safe recycling signal
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def worker_main(conn, processes, inherited_limits):
+    """
+    Child process: load the OCR engine, then answer image requests until told to stop.
+
+    Only receipt_ocr is imported here, never the bot. When the parent was
+    started as ``python main.py``, spawn has already run main.py in this child
+    as ``__mp_main__`` with the parent's settings, so the budget is recomputed
+    and the in-process OCR functions are called directly rather than trusting
+    settings read at import.
+    """
+    os.environ["OCR_EXECUTION"] = "inline"
+    os.environ["OCR_CONCURRENCY"] = "1"
+    # The parent's value describes the parent; this child has a share of it
+    os.environ["THREAD_BUDGET_PROCESSES"] = str(processes)
+    # BLAS limits the parent derived from its own budget are recomputed for this child
+    for name in inherited_limits:
+        os.environ.pop(name, None)
+    thread_budget.configure()
+    import receipt_ocr
+
+    receipt_ocr.warm_up_engine()
+    conn.send(("ready", None, rss_bytes()))
+    while True:
+        try:
+            image_bytes = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if image_bytes is None:
+            break
+        def on_stage(stage, detail=None):
+            conn.send(("stage", stage, None))
+
+        try:
+            conn.send(("ok", receipt_ocr.extract_text_from_image(image_bytes, on_stage), rss_bytes()))
+        except Exception as e:
+            conn.send(("error", str(e), rss_bytes()))
+
+
+class OcrWorker:
+    def __init__(self, ctx, processes):
+        self.conn, child_conn = ctx.Pipe()
+        args = (child_conn, processes, list(thread_budget.exported))
+        self.process = ctx.Process(target=worker_main, args=args, name="ocr-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.rss = 0
+        self.retiring = False
+        self.retired = False
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"OCR worker {self.process.pid} did not start within {timeout:.0f}s")
+        status, _, self.rss = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"OCR worker {self.process.pid} failed to start")
+
+    def run(self, image_bytes, timeout, on_stage=None):
+        self.conn.send(bytes(image_bytes))
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.conn.poll(max(0, deadline - time.monotonic())):
+                raise TimeoutError(f"OCR worker {self.process.pid} timed out after {timeout:.0f}s")
+            status, payload, rss = self.conn.recv()
+            if status != "stage":
+                break
+            try:
+                if on_stage:
+                    on_stage(payload)
+            except Exception as e:
+                # Progress reporting must not desynchronize the pipe
+                logger.warning(f"OCR stage callback failed: {e}")
+        self.rss = rss
+        self.tasks += 1
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def worn_out(self):
+        return self.tasks >= OCR_WORKER_MAX_TASKS or self.rss >= OCR_WORKER_MAX_RSS_MB * 1024 * 1024
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class OcrWorkerPool:
+    """Fixed number of supervised OCR processes shared by all callers."""
+
+    def __init__(self, size):
+        self.size = size
+        # Every worker gets its share of this process's cores
+        self.processes = thread_budget.current()["processes"] * size
+        self.ready = threading.Event()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def start(self):
+        """Start every worker in the background; ``ready`` is set once the first one can serve."""
+        for _ in range(self.size):
+            self._spawn()
+
+    def _spawn(self, replaces=None):
+        def warm():
+            worker = None
+            try:
+                worker = OcrWorker(self._ctx, self.processes)
+                worker.wait_ready(OCR_WORKER_START_TIMEOUT)
+            except Exception as e:
+                logger.error(f"❌ OCR worker failed to start: {e}")
+                health.incr("ocr_worker_start_failures")
+                if worker is not None:
+                    worker.stop()
+                if not self._closed:
+                    # Retry later; a worn-out worker being replaced keeps serving meanwhile
+                    time.sleep(5)
+                    self._spawn(replaces)
+                return
+            logger.info(f"✅ OCR worker {worker.process.pid} ready ({worker.rss // (1024 * 1024)} MB)")
+            self._add(worker)
+            if replaces is not None:
+                self._retire(replaces)
+
+        threading.Thread(target=warm, name="ocr-worker-start", daemon=True).start()
+
+    def _add(self, worker):
+        with self._cond:
+            if self._closed:
+                worker.stop()
+                return
+            self._idle.append(worker)
+            self._cond.notify()
+        self.ready.set()
+
+    def _retire(self, worker):
+        with self._cond:
+            worker.retired = True
+            idle = worker in self._idle
+            if idle:
+                self._idle.remove(worker)
+        if idle:
+            worker.stop()
+        health.incr("ocr_workers_recycled")
+        logger.info(f"♻️ OCR worker {worker.process.pid} retired after {worker.tasks} tasks ({worker.rss // (1024 * 1024)} MB)")
+
+    def _take(self):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._idle, OCR_TASK_TIMEOUT):
+                raise TimeoutError("no OCR worker available")
+            return self._idle.pop()
+
+    def _give_back(self, worker):
+        if worker.retired:
+            worker.stop()
+            return
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def extract_text(self, image_bytes, on_stage=None):
+        worker = self._take()
+        try:
+            text = worker.run(image_bytes, OCR_TASK_TIMEOUT, on_stage)
+        except RuntimeError:
+            # OCR raised inside a healthy worker
+            self._give_back(worker)
+            raise
+        except Exception:
+            health.incr("ocr_workers_crashed")
+            logger.error(f"❌ OCR worker {worker.process.pid} crashed or hung; replacing it")
+            worker.retired = True
+            worker.stop()
+            self._spawn()
+            raise
+
+        if worker.worn_out() and not worker.retiring:
+            worker.retiring = True
+            self._spawn(replaces=worker)
+        self._give_back(worker)
+        return text
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+worker_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(size):
+    """The process-wide worker pool, started on first use"""
+    global worker_pool
+    with _pool_lock:
+        if worker_pool is None:
+            worker_pool = OcrWorkerPool(size)
+            worker_pool.start()
+        return worker_pool
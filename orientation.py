@@ -0,0 +1,126 @@
+# orientation.py
+"""
+Once-per-image text orientation for PaddleOCR.
+
+``engine.ocr(image, cls=True)`` runs the angle classifier on every detected
+line. Receipts are printed in one direction, so ``ocr_upright`` decides the
+orientation once and then recognizes all lines without the classifier:
+
+1. EXIF rotation is already applied when the image is decoded (image_pipeline).
+2. Text detection runs once. If most boxes are much taller than wide, the image
+   is lying on its side: it is turned 90 degrees and detected again.
+3. The classifier runs on a sample of the widest lines only. When the sample
+   agrees, the image is rotated 180 degrees or left alone, once, and every line
+   goes to the recognizer as-is.
+4. When the sample disagrees (mixed orientations, low confidence) every line is
+   classified individually, which is what ``cls=True`` would have done.
+
+The result has the same shape as ``PaddleOCR.ocr``: ``[[[box, (text, score)], ...]]``.
+"""
+
+import os
+import logging
+
+import numpy as np
+
+ORIENTATION_MODE = os.getenv("OCR_ORIENTATION", "once")  # once | per-line
+ORIENTATION_SAMPLE = int(os.getenv("OCR_ORIENTATION_SAMPLE", "6"))
+ORIENTATION_AGREEMENT = 0.8
+ORIENTATION_MIN_SCORE = 0.9
+VERTICAL_RATIO = 1.5
+
+logger = logging.getLogger(__name__)
+
+
+def box_size(box):
+    box = np.asarray(box, dtype=np.float32)
+    width = max(np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[2] - box[3]))
+    height = max(np.linalg.norm(box[0] - box[3]), np.linalg.norm(box[1] - box[2]))
+    return width, height
+
+
+def crop_box(image, box):
+    """Perspective crop of one text box, laid horizontally (as PaddleOCR's get_rotate_crop_image)"""
+    import cv2
+    points = np.asarray(box, dtype=np.float32)
+    width, height = (max(1, int(side)) for side in box_size(points))
+    target = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if height / width >= VERTICAL_RATIO:
+        crop = np.rot90(crop)
+    return crop
+
+
+def sort_boxes(boxes):
+    """Top-to-bottom, then left-to-right"""
+    return sorted(boxes, key=lambda box: (round(box[0][1] / 10), box[0][0]))
+
+
+def detect(engine, image):
+    boxes, _ = engine.text_detector(image)
+    if boxes is None:
+        return []
+    return sort_boxes([np.asarray(box, dtype=np.float32) for box in boxes])
+
+
+def is_sideways(boxes):
+    vertical = sum(1 for box in boxes if box_size(box)[1] >= VERTICAL_RATIO * box_size(box)[0])
+    return vertical > len(boxes) / 2
+
+
+def rotate_boxes_180(boxes, height, width):
+    """Boxes of the same text after the image is turned 180 degrees, top-left point first"""
+    rotated = []
+    for box in boxes:
+        flipped = np.stack([width - 1 - box[:, 0], height - 1 - box[:, 1]], axis=1)
+        rotated.append(np.roll(flipped, -2, axis=0))
+    return sort_boxes(rotated)
+
+
+def sample_is_flipped(engine, image, boxes):
+    """True/False when the sampled lines agree on 180/0 degrees, None when they disagree"""
+    widest = sorted(boxes, key=lambda box: box_size(box)[0], reverse=True)[:ORIENTATION_SAMPLE]
+    _, angles, _ = engine.text_classifier([crop_box(image, box) for box in widest])
+    flipped = sum(1 for label, score in angles if label == '180' and score >= ORIENTATION_MIN_SCORE)
+    share = flipped / len(angles)
+    if share >= ORIENTATION_AGREEMENT:
+        return True
+    if share <= 1 - ORIENTATION_AGREEMENT:
+        return False
+    return None
+
+
+def ocr_upright(engine, image):
+    """OCR ``image`` (BGR) with a single orientation decision instead of per-line classification"""
+    import cv2
+    if ORIENTATION_MODE != "once" or not getattr(engine, "use_angle_cls", False):
+        return engine.ocr(image, cls=True)
+
+    boxes = detect(engine, image)
+    if boxes and is_sideways(boxes):
+        image = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+        boxes = detect(engine, image)
+        logger.info("🔄 Text lines were vertical; rotated image 90°")
+    if not boxes:
+        return [[]]
+
+    flipped = sample_is_flipped(engine, image, boxes)
+    if flipped:
+        height, width = image.shape[:2]
+        image = cv2.rotate(image, cv2.ROTATE_180)
+        boxes = rotate_boxes_180(boxes, height, width)
+        logger.info("🔄 Image was upside down; rotated 180°")
+
+    crops = [crop_box(image, box) for box in boxes]
+    if flipped is None:
+        logger.info("↕️ Mixed line orientations; classifying every line")
+        crops, _, _ = engine.text_classifier(crops)
+
+    texts, _ = engine.text_recognizer(crops)
+    drop_score = getattr(engine, "drop_score", 0.5)
+    return [[
+        [box.tolist(), (text, score)]
+        for box, (text, score) in zip(boxes, texts)
+        if score >= drop_score
+    ]]
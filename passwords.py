@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Password hashing service for the voucher web app.
+
+bcrypt runs in a small dedicated process pool instead of the request thread,
+so a burst of logins cannot starve voucher rendering. Every gunicorn worker has
+its own pool, sized to its share of the cores (cores / WEB_WORKERS, at least
+one process). At most PASSWORD_HASH_MAX_CONCURRENT hashes (default: one per
+core) are in flight across all web processes on the host; the slots are lock
+files in PASSWORD_HASH_SLOT_DIR, which the kernel frees when a killed worker
+held one. Further requests wait up to PASSWORD_HASH_WAIT_SECONDS and then get
+PasswordServiceBusy.
+
+The cost factor comes from BCRYPT_ROUNDS. Hashes created with another cost are
+upgraded after the next successful login. Calibrate the cost on the target
+hardware with:
+
+    python passwords.py --benchmark --target-ms 250
+"""
+
+import os
+import re
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from file_slots import FileSlots
+from thread_budget import available_cores
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# WEB_WORKERS is exported by gunicorn.conf.py; the embedded dev server is one process
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", "1")))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, available_cores() // WEB_WORKERS))))
+PASSWORD_HASH_MAX_CONCURRENT = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENT", str(available_cores())))
+PASSWORD_HASH_WAIT_SECONDS = float(os.getenv("PASSWORD_HASH_WAIT_SECONDS", "5"))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "15"))
+PASSWORD_HASH_SLOT_DIR = os.getenv("PASSWORD_HASH_SLOT_DIR", os.path.join(tempfile.gettempdir(), "voucher-password-slots"))
+
+_COST_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = FileSlots(PASSWORD_HASH_SLOT_DIR, PASSWORD_HASH_MAX_CONCURRENT)
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many password hashes are already running."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _get_pool():
+    """Process pool of this process; a forked gunicorn worker builds its own."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: forking a threaded web worker is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(fn, *args):
+    slot = _slots.acquire(timeout=PASSWORD_HASH_WAIT_SECONDS)
+    if slot is None:
+        raise PasswordServiceBusy("password hashing capacity exhausted")
+    try:
+        return _get_pool().submit(fn, *args).result(timeout=PASSWORD_HASH_TIMEOUT)
+    finally:
+        _slots.release(slot)
+
+
+def hash_password(password, rounds=None):
+    """Return the bcrypt hash of ``password`` as text"""
+    return _run(_hash, password.encode('utf-8'), rounds or BCRYPT_ROUNDS).decode('utf-8')
+
+
+def verify_password(password, hashed):
+    """Check ``password`` against a stored bcrypt hash"""
+    if not hashed:
+        return False
+    return _run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_cost(hashed):
+    match = _COST_PATTERN.match(hashed or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed):
+    return hash_cost(hashed) != BCRYPT_ROUNDS
+
+
+def rehash_in_background(user_id, password):
+    """Store a hash with the current cost for a user who just logged in; never blocks the request."""
+    from database import update_user_password
+
+    def store(future):
+        try:
+            update_user_password(user_id, future.result().decode('utf-8'))
+        except Exception as e:
+            logging.error(f"❌ Failed to upgrade password hash for user {user_id}: {e}")
+
+    slot = _slots.try_acquire()
+    if slot is None:
+        return False
+    try:
+        future = _get_pool().submit(_hash, password.encode('utf-8'), BCRYPT_ROUNDS)
+    except Exception as e:
+        _slots.release(slot)
+        logging.error(f"❌ Failed to schedule password rehash for user {user_id}: {e}")
+        return False
+    future.add_done_callback(lambda _: _slots.release(slot))
+    future.add_done_callback(store)
+    return True
+
+
+def benchmark(min_rounds=10, max_rounds=15, samples=3, target_ms=250):
+    """Time bcrypt for each cost factor and return the highest one within ``target_ms``"""
+    password = b"benchmark-password"
+    recommended = min_rounds
+    print(f"{'rounds':>6}  {'ms/hash':>8}")
+    for rounds in range(min_rounds, max_rounds + 1):
+        started = time.perf_counter()
+        for _ in range(samples):
+            _hash(password, rounds)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / samples
+        print(f"{rounds:>6}  {elapsed_ms:>8.1f}")
+        if elapsed_ms <= target_ms:
+            recommended = rounds
+        else:
+            break
+    print(f"\nRecommended BCRYPT_ROUNDS={recommended} (target {target_ms} ms per hash)")
+    return recommended
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password hashing utilities")
+    parser.add_argument("--benchmark", action="store_true", help="time bcrypt cost factors on this machine")
+    parser.add_argument("--target-ms", type=float, default=250, help="acceptable time per hash")
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.min_rounds, args.max_rounds, target_ms=args.target_ms)
+    else:
+        parser.print_help()
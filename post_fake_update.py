@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Post synthetic Telegram updates to a locally running bot in webhook mode.
+
+    BOT_MODE=webhook WEBHOOK_URL=https://bot.example.com WEBHOOK_SECRET=s3cret python main.py
+    python post_fake_update.py --secret s3cret start
+    python post_fake_update.py --secret s3cret photo --file-id AgACAgUAAxkBAAIB
+    python post_fake_update.py --secret s3cret callback --data upi --message-id 42
+    python post_fake_update.py --secret s3cret burst --users 20 --count 5
+
+The bot replies through TELEGRAM_API_URL, so point it at fake_bot_api.py when
+the fake chat/file IDs should not reach Telegram. For polling-mode load tests
+use loadtest.py, which drives the bot through the fake Bot API end to end.
+"""
+
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"}
+
+
+def _chat(user_id):
+    return {"id": user_id, "type": "private", "first_name": f"Load{user_id}"}
+
+
+def message_update(user_id, text=None, photo_file_id=None):
+    message = {
+        "message_id": random.randint(1, 2 ** 31),
+        "date": int(time.time()),
+        "chat": _chat(user_id),
+        "from": _user(user_id),
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if photo_file_id:
+        message["photo"] = [{
+            "file_id": photo_file_id,
+            "file_unique_id": photo_file_id[-16:],
+            "width": 1080,
+            "height": 2340,
+            "file_size": 250000,
+        }]
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id, data, message_id):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(random.randint(1, 2 ** 62)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": _chat(user_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": "🔘 Choose the receipt type:",
+            },
+        },
+    }
+
+
+def post(url, update, secret=None):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    started = time.perf_counter()
+    response = requests.post(url, json=update, headers=headers, timeout=30)
+    return response.status_code, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post fake Telegram updates to the bot webhook")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram", help="Local webhook URL")
+    parser.add_argument("--secret", help="WEBHOOK_SECRET configured on the bot")
+    parser.add_argument("--user-id", type=int, default=100000001)
+    sub = parser.add_subparsers(dest="kind", required=True)
+    sub.add_parser("start")
+    photo = sub.add_parser("photo")
+    photo.add_argument("--file-id", required=True)
+    callback = sub.add_parser("callback")
+    callback.add_argument("--data", required=True, help="e.g. upi, PhonePe, retry_image_upload")
+    callback.add_argument("--message-id", type=int, required=True)
+    burst = sub.add_parser("burst", help="Many users sending /start concurrently")
+    burst.add_argument("--users", type=int, default=10)
+    burst.add_argument("--count", type=int, default=1, help="Updates per user")
+    args = parser.parse_args()
+
+    if args.kind == "start":
+        updates = [message_update(args.user_id, text="/start")]
+    elif args.kind == "photo":
+        updates = [message_update(args.user_id, photo_file_id=args.file_id)]
+    elif args.kind == "callback":
+        updates = [callback_update(args.user_id, args.data, args.message_id)]
+    else:
+        updates = [message_update(args.user_id + u, text="/start") for u in range(args.users) for _ in range(args.count)]
+
+    with ThreadPoolExecutor(max_workers=min(32, len(updates))) as pool:
+        results = list(pool.map(lambda update: post(args.url, update, args.secret), updates))
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(elapsed for _, elapsed in results)
+    print(f"Posted {len(results)} updates: {statuses}")
+    print(f"Latency p50={latencies[len(latencies) // 2] * 1000:.1f} ms max={latencies[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
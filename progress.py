@@ -0,0 +1,89 @@
+# progress.py
+"""
+Throttled progress edits of one Telegram message.
+
+A receipt goes through several stages (downloaded, preprocessed, text found,
+fields parsed, saved) and the user should see each one as it completes.
+Telegram limits how fast one message can be edited (about once per second per
+chat), so ``ProgressReporter`` coalesces updates: at most one edit every
+PROGRESS_EDIT_INTERVAL seconds. Stages that are replaced before their turn are
+never sent, and the final result is always the last edit.
+
+``update`` may be called from any thread (OCR runs in worker threads), the
+other methods from the event loop that created the reporter.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import suppress
+
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "1.0"))
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    def __init__(self, edit, interval=PROGRESS_EDIT_INTERVAL, clock=time.monotonic):
+        self._edit = edit
+        self._interval = interval
+        self._clock = clock
+        self._loop = asyncio.get_running_loop()
+        self._pending = None
+        self._shown = None
+        self._last_edit = float("-inf")
+        self._task = None
+        self._closed = False
+
+    def update(self, text):
+        """Show ``text`` as soon as the edit rate allows; safe to call from any thread"""
+        self._loop.call_soon_threadsafe(self._set, text)
+
+    async def show(self, text):
+        """Same as ``update`` for callers on the event loop that expect a coroutine"""
+        self._set(text)
+
+    def _set(self, text):
+        if self._closed:
+            return
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._flush())
+
+    async def _wait_turn(self):
+        wait = self._last_edit + self._interval - self._clock()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _flush(self):
+        while self._pending is not None:
+            await self._wait_turn()
+            text, self._pending = self._pending, None
+            if text is None or text == self._shown:
+                continue
+            self._last_edit = self._clock()
+            try:
+                await self._edit(text)
+                self._shown = text
+            except Exception as e:
+                # A lost progress edit is harmless; the final result is sent by finish()
+                logger.warning(f"Progress edit failed: {e}")
+
+    async def finish(self, text, **kwargs):
+        """Stop progress updates and show the final ``text``; returns False if the edit failed"""
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        await self._wait_turn()
+        self._last_edit = self._clock()
+        try:
+            await self._edit(text, **kwargs)
+        except Exception as e:
+            # Raising here would send the caller's error path into a second finish()
+            logger.error(f"❌ Final progress edit failed: {e}")
+            return False
+        self._shown = text
+        return True
@@ -0,0 +1,486 @@
+# receipt_ocr.py
+"""
+OCR and receipt parsing, without the Telegram bot.
+
+The bot (main.py), the OCR worker processes (ocr_workers.py), the ocr-worker
+role (services.py), bulk_ingest.py and ocr_benchmark.py all read receipts
+through this module. Importing it builds no bot, handlers or Telegram client,
+so a child process that only needs OCR does not pay for (or duplicate) the
+bot's start-up.
+"""
+
+import os
+import re
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from dotenv import load_dotenv
+
+# Thread limits for BLAS/OpenMP are read once by the native runtimes, so they
+# are set from the environment (.env included) before numpy is imported
+load_dotenv()
+import thread_budget
+thread_budget.current()
+import numpy as np
+
+from word2number import w2n
+
+# paddleocr and cv2 are imported lazily, see ocr_engine_slot and image_pipeline
+import health
+from dispatch import OCR_CONCURRENCY
+from orientation import ocr_upright
+from database import ReceiptWriteBuffer
+from dedup import image_hash, find_duplicate_transaction, remember_receipt
+
+logger = logging.getLogger(__name__)
+
+VOUCHER_BASE_URL = os.getenv("VOUCHER_BASE_URL", "http://192.168.1.41:5000")
+
+# "process" runs OCR in supervised, recycled child processes (ocr_workers.py);
+# "inline" runs it inside this process; "queue" hands it to OCR worker roles (see services.py)
+OCR_EXECUTION = os.getenv("OCR_EXECUTION", "process")
+
+# Receipts from concurrent chats are written together by a write-behind buffer
+receipt_writer = ReceiptWriteBuffer(
+    flush_interval=float(os.getenv("RECEIPT_FLUSH_INTERVAL", "0.25")),
+    max_batch=int(os.getenv("RECEIPT_FLUSH_BATCH", "100"))
+)
+
+# PaddleOCR with optimized settings. The engine is built lazily and warmed up
+# in the background so the bot starts accepting updates immediately.
+OCR_SETTINGS = dict(
+    use_angle_cls=True,
+    lang='en',
+    show_log=False,
+    use_gpu=False,
+    det_db_thresh=0.2,
+    det_db_box_thresh=0.3,
+    rec_batch_num=8,
+    drop_score=0.3
+)
+# A PaddleOCR engine must not run two inferences at once, so concurrent OCR
+# uses a pool of up to OCR_CONCURRENCY engines (see dispatch.py)
+ocr_engine_pool = queue.LifoQueue()
+ocr_engines_created = 0
+ocr_engine_lock = threading.Lock()
+ocr_ready = threading.Event()
+
+
+def build_ocr_engine():
+    import ocr_backends
+    thread_budget.configure_opencv()
+    with health.phase("ocr_model_load"):
+        engine = ocr_backends.build_engine(OCR_SETTINGS)
+    logger.info(f"✅ PaddleOCR initialized successfully ({engine.backend_name} backend)")
+    return engine
+
+
+@contextmanager
+def ocr_engine_slot():
+    """Borrow an idle engine, building one if the pool is below OCR_CONCURRENCY."""
+    global ocr_engines_created
+    try:
+        engine = ocr_engine_pool.get_nowait()
+    except queue.Empty:
+        with ocr_engine_lock:
+            build = ocr_engines_created < OCR_CONCURRENCY
+            if build:
+                ocr_engines_created += 1
+        if build:
+            try:
+                engine = build_ocr_engine()
+            except Exception:
+                with ocr_engine_lock:
+                    ocr_engines_created -= 1
+                raise
+        else:
+            engine = ocr_engine_pool.get()
+    try:
+        yield engine
+    finally:
+        ocr_engine_pool.put(engine)
+
+
+def warm_up_ocr():
+    """Load the models and run one inference on a dummy image so the first receipt is fast."""
+    health.set_component_state("ocr", "warming_up")
+    if OCR_EXECUTION == "process":
+        warm_up_ocr_workers()
+    else:
+        warm_up_engine()
+
+
+def warm_up_engine():
+    """Warm up an engine in this process, whatever OCR_EXECUTION says (OCR worker processes call this)."""
+    try:
+        with ocr_engine_slot() as engine:
+            with health.phase("ocr_warmup_inference"):
+                import cv2
+                dummy = np.full((160, 640, 3), 255, dtype=np.uint8)
+                cv2.putText(dummy, "Paid Rs 1234", (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+                ocr_upright(engine, dummy)
+        ocr_ready.set()
+        health.set_component_state("ocr", "ready", engine.backend_name)
+        logger.info("✅ OCR engine warmed up")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize PaddleOCR: {e}", exc_info=True)
+        health.set_component_state("ocr", "failed", str(e))
+
+
+def warm_up_ocr_workers():
+    """Process mode: start the supervised OCR workers; ready once the first one has warmed up."""
+    import ocr_workers
+    pool = ocr_workers.get_pool(OCR_CONCURRENCY)
+    if pool.ready.wait(ocr_workers.OCR_WORKER_START_TIMEOUT):
+        ocr_ready.set()
+        health.set_component_state("ocr", "ready", f"{pool.size} worker processes")
+        logger.info("✅ OCR worker processes warmed up")
+    else:
+        health.set_component_state("ocr", "failed", "no OCR worker process started")
+
+
+def ocr_text(image_bytes, on_stage=None):
+    """OCR one image in this process or, in process mode, in a supervised worker."""
+    if OCR_EXECUTION != "process":
+        return extract_text_from_image(BytesIO(image_bytes), on_stage)
+    import ocr_workers
+    try:
+        return ocr_workers.get_pool(OCR_CONCURRENCY).extract_text(image_bytes, on_stage)
+    except Exception as e:
+        logger.error(f"❌ OCR Error: {e}")
+        return ""
+
+
+def stop_ocr_workers():
+    import ocr_workers
+    if ocr_workers.worker_pool is not None:
+        ocr_workers.worker_pool.close()
+
+
+def start_ocr_warmup():
+    health.set_component_state("ocr", "starting")
+    threading.Thread(target=warm_up_ocr, name="ocr-warmup", daemon=True).start()
+
+
+# ---------- OCR & Parsing ----------
+def preprocess_image_advanced(image_bytes):
+    """Multi-stage preprocessing for better OCR; returns a BGR array (see image_pipeline)."""
+    import image_pipeline
+    try:
+        return image_pipeline.prepare_for_ocr(image_bytes)
+    except Exception as e:
+        logger.error(f"Preprocessing error: {e}")
+        return image_pipeline.decode_bgr(image_bytes)
+
+
+def extract_text_from_image(image_stream, on_stage=None):
+    """Extract text using PaddleOCR; ``on_stage("preprocessed")`` is called before recognition."""
+    try:
+        image_bytes = image_stream.getbuffer() if isinstance(image_stream, BytesIO) else image_stream
+        img_array = preprocess_image_advanced(image_bytes)
+        if on_stage:
+            on_stage("preprocessed")
+        
+        logger.info(f"Processing image shape: {img_array.shape}")
+        
+        with ocr_engine_slot() as engine:
+            result = ocr_upright(engine, img_array)
+        
+        if not result or not result[0]:
+            logger.warning("PaddleOCR returned no results")
+            return ""
+        
+        full_text = ocr_result_to_text(result)
+        
+        logger.info(f"✅ Extracted {len(result[0])} blocks, {len(full_text)} chars")
+        
+        return full_text
+    
+    except Exception as e:
+        logger.error(f"❌ OCR Error: {e}", exc_info=True)
+        return ""
+
+
+def read_album_image(image_bytes):
+    """
+    OCR one album image. In-process, the image is OCRed right after its
+    preprocessing, so the preprocessing buffer is consumed before the thread
+    reuses it for the next image; the engine pool serializes the OCR calls.
+    """
+    if OCR_EXECUTION == "process":
+        return ocr_text(image_bytes)
+    try:
+        image = preprocess_image_advanced(image_bytes)
+    except Exception as e:
+        logger.error(f"❌ Could not decode batch image: {e}")
+        return ""
+    try:
+        with ocr_engine_slot() as engine:
+            result = ocr_upright(engine, image)
+        return ocr_result_to_text(result)
+    except Exception as e:
+        logger.error(f"❌ OCR Error: {e}", exc_info=True)
+        return ""
+
+
+def ocr_result_to_text(result):
+    if not result or not result[0]:
+        return ""
+
+    text_blocks = []
+    for line in result[0]:
+        if line and len(line) >= 2 and line[1][1] > 0.3:
+            text_blocks.append((line[0][0][1], line[1][0]))
+
+    text_blocks.sort(key=lambda x: x[0])
+    return "\n".join(block[1] for block in text_blocks)
+
+
+def extract_fields(text, category):
+    """Parse the extracted text into the field dict stored in extracted_receipts."""
+    formatted = extract_limited_fields(text, category)
+    fields = {}
+    for line in formatted.splitlines():
+        if line.startswith("• "):
+            try:
+                key, val = line[2:].split(":", 1)
+                fields[key.strip()] = val.strip()
+            except ValueError:
+                continue
+    return fields
+
+
+def build_voucher_link(transaction_id, category):
+    type_param = category if not category.startswith("gstbill") else "gstbill"
+    return f"{VOUCHER_BASE_URL}/voucher?transaction_id={transaction_id}&type={type_param}"
+
+
+def duplicate_message(receipt):
+    link = build_voucher_link(receipt.get('transaction_id') or 'unknown', receipt.get('category') or '')
+    return f"♻️ This receipt was already submitted.\n\n fill voucher:🌐 {link}"
+
+
+def extract_limited_fields(text, category):
+    """Extract key fields."""
+    amount = extract_amount(text)
+    datetime = extract_datetime(text)
+    transaction_id = extract_transaction_id(text)
+    person_name = extract_person_name(text)
+    upi_id = extract_upi_id(text)
+
+    logger.info(f"Amount: {amount} | DateTime: {datetime} | TxnID: {transaction_id}")
+
+    return "\n".join([
+        f"• Amount: {amount}",
+        f"• Date & Time: {datetime}",
+        f"• Transaction ID: {transaction_id}",
+        f"• Person Name: {person_name}",
+        f"• UPI ID: {upi_id}"
+    ])
+
+
+def is_valid_amount(amount_str):
+    try:
+        clean = amount_str.replace(',', '').replace(' ', '').strip()
+        value = float(clean)
+        return 10 <= value <= 100000000
+    except:
+        return False
+
+def extract_amount(text):
+    """Enhanced amount extraction."""
+    text = text or ""
+    
+    # 1. ₹ symbol
+    matches = re.findall(r'₹\s*([0-9,]+(?:\.[0-9]{1,2})?)', text)
+    for match in matches:
+        val = match.replace(',', '').replace(' ', '')
+        if is_valid_amount(val):
+            try:
+                fv = float(val)
+                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}".rstrip('0').rstrip('.')
+            except:
+                continue
+    
+    # 2. Worded amount
+    m = re.search(r'Rupees\s+([A-Za-z\s\-]+?)\s+Only', text, re.IGNORECASE)
+    if m:
+        try:
+            num = w2n.word_to_num(m.group(1).strip().lower())
+            return f"₹{int(num)}" if float(num).is_integer() else f"₹{float(num):.2f}"
+        except:
+            pass
+    
+    # 3. Comma-formatted
+    matches = re.findall(r'\b(\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?)\b', text)
+    for match in matches:
+        val = match.replace(',', '')
+        if is_valid_amount(val):
+            try:
+                fv = float(val)
+                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}".rstrip('0').rstrip('.')
+            except:
+                continue
+    
+    # 4. After keywords
+    m = re.search(r'(?:Amount|Total|INR|Rs\.?|Value|Paid|Payment)\s*[:\-]?\s*([0-9,]+(?:\.[0-9]{1,2})?)', text, re.IGNORECASE)
+    if m:
+        val = m.group(1).replace(',', '')
+        if is_valid_amount(val):
+            try:
+                fv = float(val)
+                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}".rstrip('0').rstrip('.')
+            except:
+                pass
+    
+    # 5. Standalone numbers
+    matches = re.findall(r'\b([0-9]{3,7}(?:\.[0-9]{1,2})?)\b', text)
+    for val in matches:
+        if not re.match(r'^(19|20)\d{2}$', val) and is_valid_amount(val):
+            try:
+                fv = float(val)
+                return f"₹{int(fv)}" if fv.is_integer() else f"₹{fv:.2f}"
+            except:
+                continue
+    
+    return "Not Found"
+
+def extract_transaction_id(text):
+    """Enhanced transaction ID extraction."""
+    text = text or ""
+    
+    # PhonePe T-ID
+    m = re.search(r'\b(T\d{18,25})\b', text)
+    if m:
+        return m.group(1)
+    
+    # Paytm UPI Ref with space
+    m = re.search(r'UPI\s*Ref\.?\s*No[:\s\-]*(\d{6,8}\s+\d{5,6})', text, re.IGNORECASE)
+    if m:
+        return m.group(1).replace(' ', '')
+    
+    # Paytm UPI Ref no space
+    m = re.search(r'UPI\s*Ref\.?\s*No[:\s\-]*(\d{12,13})', text, re.IGNORECASE)
+    if m:
+        return m.group(1)
+    
+    # Generic Transaction ID
+    m = re.search(r'Transaction\s*ID\s*[:\-\s]*([A-Z0-9\-]{6,60})', text, re.IGNORECASE)
+    if m:
+        return m.group(1).strip()
+    
+    # UTR
+    m = re.search(r'UTR[:\s]+(\d{10,15})', text, re.IGNORECASE)
+    if m:
+        return m.group(1)
+    
+    # T-prefix fallback
+    m = re.search(r'\b(T\d{15,30})\b', text)
+    if m:
+        return m.group(1)
+    
+    # Long number
+    matches = re.findall(r'\b(\d{12,15})\b', text)
+    for match in matches:
+        if not match.startswith(('91', '90', '80', '70', '60')):
+            return match
+    
+    return "Not Found"
+
+
+def clean_name(name):
+    if not name:
+        return ""
+    name = re.sub(r'\s+', ' ', name).strip()
+    name = name.strip(':.')
+    name = re.sub(r'[^A-Za-z0-9 &\.\-]', '', name)
+    return name.strip()
+
+
+def extract_person_name(text):
+    text = text or ""
+    
+    m = re.search(r'Paid\s+to\s*[:\-\s]*([A-Z][A-Za-z\s\.\-&]{2,50})', text, re.IGNORECASE)
+    if m:
+        name = clean_name(m.group(1))
+        if name and len(name) > 2:
+            return name
+    
+    m = re.search(r'\bTo\s*[:\-\s]*([A-Z][A-Za-z\s\.\-&]{2,50})', text, re.IGNORECASE)
+    if m:
+        name = clean_name(m.group(1))
+        if name and len(name) > 2 and name.lower() not in ['transaction', 'payment', 'successful']:
+            return name
+    
+    m = re.search(r'(?:Verified|Banking)\s+Name\s*[:\-\s]*([A-Za-z][A-Za-z\s\.\-&]{2,50})', text, re.IGNORECASE)
+    if m:
+        name = clean_name(m.group(1))
+        if name and len(name) > 2:
+            return name
+    
+    return "Not Found"
+
+
+def extract_upi_id(text):
+    m = re.search(r'\b([A-Za-z0-9._\-]+@[A-Za-z0-9._\-]+)\b', text)
+    if m:
+        return m.group(1).lower()
+    return "Not Found"
+
+
+def extract_datetime(text):
+    m = re.search(r'(\d{1,2}:\d{2})\s*(?:am|pm)?\s+on\s+(\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4})', text, re.IGNORECASE)
+    if m:
+        return f"{m.group(1)} on {m.group(2)}"
+    
+    m = re.search(r'(\d{1,2}\s+[A-Za-z]{3,9}\s+\d{4})\s*,?\s+(\d{1,2}:\d{2}\s*[APap][Mm])', text)
+    if m:
+        return f"{m.group(2)} on {m.group(1)}"
+    
+    m = re.search(r'\d{1,2}/\d{1,2}/\d{4}[ \t]+\d{1,2}:\d{2}', text)
+    if m:
+        return m.group(0).strip()
+    
+    return "Not Found"
+
+
+def read_and_store_receipt(user_id, category, image_bytes, on_stage=None):
+    """
+    OCR, parse, de-duplicate and store one receipt.
+
+    Shared by the in-process path and the OCR worker role. Returns the message
+    text for the user and the retry callback to offer (None when done).
+    ``on_stage(stage, detail)`` is called as "preprocessed", "text_found" and
+    "parsed" (with the fields, before they are written) complete.
+    """
+    report = on_stage or (lambda stage, detail=None: None)
+    text = ocr_text(image_bytes, report)
+
+    if not text or len(text.strip()) < 10:
+        logger.warning(f"Insufficient text: {len(text)} chars")
+        return "⚠️ Could not extract text. Tap Retry:", f"retry_process_{category}"
+    report("text_found", len(text))
+
+    fields = extract_fields(text, category)
+    report("parsed", fields)
+
+    duplicate = find_duplicate_transaction(fields.get('Transaction ID'))
+    if duplicate:
+        return duplicate_message(duplicate), None
+
+    fields["image_hash"] = image_hash(image_bytes)
+    record_id = receipt_writer.submit(user_id, category, fields).result()
+    if not record_id:
+        return "❌ Database error. Tap Retry:", f"retry_process_{category}"
+
+    transaction_id = fields.get('Transaction ID', 'unknown')
+    remember_receipt({'id': record_id, 'transaction_id': transaction_id, 'category': category, 'image_hash': fields["image_hash"]})
+    link = build_voucher_link(transaction_id, category)
+
+    success_msg = "✅ Data Saved!"
+    # for key, value in fields.items():
+        # success_msg += f"• {key}: {value}\n"
+    success_msg += f"\n\n fill voucher:🌐 {link}"
+    return success_msg, None
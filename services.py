@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Multi-process deployment roles.
+
+Each role runs in its own process and scales independently; they share state
+only through Postgres (receipts, users and the ocr_jobs queue):
+
+    python services.py bot          # Telegram ingest, enqueues OCR jobs
+    python services.py ocr-worker   # claims jobs, runs OCR, stores receipts, replies in Telegram
+    python services.py web          # voucher web app under gunicorn (wsgi.py)
+    python services.py scheduler    # daily status message, stale-job recovery, session GC
+
+Run exactly one bot and one scheduler; start as many ocr-worker and web
+processes as the hardware allows. `python main.py` keeps the all-in-one mode.
+"""
+
+import os
+import sys
+import socket
+import logging
+import argparse
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+IDLE_WAIT_SECONDS = 5
+STALE_JOB_SECONDS = int(os.getenv("STALE_JOB_SECONDS", "300"))
+
+
+def run_bot_role():
+    os.environ["OCR_EXECUTION"] = "queue"
+    import main
+    from job_queue import init_job_queue
+
+    init_job_queue()
+    main.run_bot(embedded_web=False, with_scheduler=False)
+
+
+def run_ocr_worker_role():
+    import main
+    import receipt_ocr
+    import health
+    from database import init_db
+    from job_queue import init_job_queue, claim_ocr_jobs, complete_ocr_job, fail_ocr_job, JobNotifier
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    health.start_status_server(port=int(os.getenv("STATUS_PORT", "8082")))
+    init_db()
+    init_job_queue()
+    receipt_ocr.warm_up_ocr()
+
+    notifier = JobNotifier()
+    logger.info(f"✅ OCR worker {worker} ready")
+    try:
+        while True:
+            jobs = claim_ocr_jobs(worker)
+            if not jobs:
+                notifier.wait(IDLE_WAIT_SECONDS)
+                continue
+            for job in jobs:
+                process_job(main, receipt_ocr, job, complete_ocr_job, fail_ocr_job)
+                health.incr("ocr_jobs_processed")
+    except KeyboardInterrupt:
+        logger.info(f"OCR worker {worker} stopped")
+    finally:
+        receipt_ocr.receipt_writer.close()
+        receipt_ocr.stop_ocr_workers()
+
+
+def process_job(main, receipt_ocr, job, complete_ocr_job, fail_ocr_job):
+    try:
+        message, retry = receipt_ocr.read_and_store_receipt(job['user_id'], job['category'], job['image'])
+    except Exception as e:
+        logger.error(f"❌ OCR job {job['id']} failed: {e}", exc_info=True)
+        if fail_ocr_job(job['id'], e) == 'queued':
+            return
+        message, retry = "❌ Failed. Tap Retry:", f"retry_process_{job['category']}"
+
+    # Bulk backfill jobs (bulk_ingest.py --enqueue) have no chat to answer
+    if job['chat_id'] is None:
+        complete_ocr_job(job['id'], {"message": message, "retry": retry})
+        return
+    payload = {"chat_id": job['chat_id'], "text": message}
+    if retry:
+        payload["reply_markup"] = main.retry_markup_json(retry)
+    if job['message_id']:
+        payload["message_id"] = job['message_id']
+        main.telegram_api("editMessageText", payload)
+    else:
+        main.telegram_api("sendMessage", payload)
+    complete_ocr_job(job['id'], {"message": message, "retry": retry})
+
+
+def run_web_role():
+    """Replace this process with gunicorn serving wsgi:application."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)
+    os.execvp("gunicorn", ["gunicorn", "-c", os.path.join(here, "gunicorn.conf.py"), "wsgi:application"])
+
+
+def run_scheduler_role():
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    import main
+    from job_queue import init_job_queue, requeue_stale_jobs
+    from sessions import purge_expired_sessions
+
+    init_job_queue()
+    scheduler = BlockingScheduler(timezone="Asia/Kolkata")
+    scheduler.add_job(main.send_daily_status, "cron", hour=0, minute=0)
+    scheduler.add_job(requeue_stale_jobs, "interval", minutes=1, kwargs={"timeout_seconds": STALE_JOB_SECONDS})
+    scheduler.add_job(purge_expired_sessions, "interval", minutes=15)
+    logger.info("✅ Scheduler role started")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Scheduler stopped")
+
+
+ROLES = {
+    "bot": run_bot_role,
+    "ocr-worker": run_ocr_worker_role,
+    "web": run_web_role,
+    "scheduler": run_scheduler_role,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one role of the OCR receipt system")
+    parser.add_argument("role", choices=sorted(ROLES))
+    args = parser.parse_args()
+    sys.exit(ROLES[args.role]())
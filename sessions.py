@@ -0,0 +1,326 @@
+# sessions.py
+"""
+Session layer for the voucher web app.
+
+Small sessions (the usual login state: a few IDs and names) live entirely in a
+signed cookie, so reading them costs no I/O and works on any worker or host.
+Sessions that outgrow SESSION_COOKIE_MAX_BYTES move to a server-side store
+(Postgres by default, SQLite for single-host setups); the cookie then only
+carries the signed session ID.
+
+    SESSION_BACKEND            postgres | sqlite
+    SESSION_SQLITE_PATH        database file for the sqlite backend
+    SESSION_COOKIE_MAX_BYTES   largest payload kept in the cookie
+    SESSION_CACHE_SECONDS      how long a stored session is served from memory
+    SESSION_GC_INTERVAL        seconds between bulk deletes of expired rows
+
+Server-side reads go through a small in-process LRU cache; writes go through it
+too, so a worker always sees its own changes immediately and other workers
+within SESSION_CACHE_SECONDS.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import psycopg2
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
+
+from database import DATABASE_CONFIG
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "postgres")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite3")
+SESSION_COOKIE_MAX_BYTES = int(os.getenv("SESSION_COOKIE_MAX_BYTES", "1024"))
+SESSION_CACHE_SECONDS = float(os.getenv("SESSION_CACHE_SECONDS", "30"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_GC_INTERVAL = float(os.getenv("SESSION_GC_INTERVAL", "600"))
+
+COOKIE_PREFIX = "c."
+STORED_PREFIX = "s."
+
+
+class HybridSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.modified = False
+
+
+class PostgresSessionStore:
+    def __init__(self):
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        if not self._schema_ready:
+            cur = conn.cursor()
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS web_sessions (
+                    sid VARCHAR(64) PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at TIMESTAMP NOT NULL
+                );
+            ''')
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_web_sessions_expires
+                ON web_sessions (expires_at);
+            ''')
+            conn.commit()
+            cur.close()
+            self._schema_ready = True
+        return conn
+
+    def load(self, sid):
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT data, expires_at FROM web_sessions
+                WHERE sid = %s AND expires_at > %s;
+            ''', (sid, datetime.utcnow()))
+            return cur.fetchone()
+        finally:
+            conn.close()
+
+    def save(self, sid, data, expires_at):
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO web_sessions (sid, data, expires_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (sid) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at;
+            ''', (sid, data, expires_at))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM web_sessions WHERE sid = %s;", (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_expired(self):
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM web_sessions WHERE expires_at <= %s;", (datetime.utcnow(),))
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, detect_types=sqlite3.PARSE_DECLTYPES)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS web_sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at TIMESTAMP NOT NULL
+                );
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_web_sessions_expires ON web_sessions (expires_at);")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        return self._connect().execute(
+            "SELECT data, expires_at FROM web_sessions WHERE sid = ? AND expires_at > ?;",
+            (sid, datetime.utcnow()),
+        ).fetchone()
+
+    def save(self, sid, data, expires_at):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO web_sessions (sid, data, expires_at) VALUES (?, ?, ?);",
+            (sid, data, expires_at),
+        )
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._connect()
+        conn.execute("DELETE FROM web_sessions WHERE sid = ?;", (sid,))
+        conn.commit()
+
+    def delete_expired(self):
+        conn = self._connect()
+        count = conn.execute("DELETE FROM web_sessions WHERE expires_at <= ?;", (datetime.utcnow(),)).rowcount
+        conn.commit()
+        return count
+
+
+def build_store(backend=None):
+    backend = backend or SESSION_BACKEND
+    if backend == "sqlite":
+        return SQLiteSessionStore(SESSION_SQLITE_PATH)
+    if backend == "postgres":
+        return PostgresSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+
+class HybridSessionInterface(SessionInterface):
+    """Signed-cookie sessions with a server-side store for large payloads."""
+
+    serializer = session_json_serializer
+
+    def __init__(self, store=None):
+        self.store = store or build_store()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._last_gc = time.monotonic()
+
+    def _signer(self, app):
+        return URLSafeTimedSerializer(app.secret_key, salt="voucher-session", serializer=self.serializer)
+
+    # --- in-memory hot cache -------------------------------------------------
+
+    def _cache_get(self, sid):
+        with self._cache_lock:
+            entry = self._cache.get(sid)
+            if entry is None:
+                return None
+            data, cached_at, expires_at = entry
+            if time.monotonic() - cached_at > SESSION_CACHE_SECONDS or expires_at <= datetime.utcnow():
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+            return data, expires_at
+
+    def _cache_put(self, sid, data, expires_at):
+        with self._cache_lock:
+            self._cache[sid] = (data, time.monotonic(), expires_at)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > SESSION_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, sid):
+        with self._cache_lock:
+            self._cache.pop(sid, None)
+
+    # --- SessionInterface ----------------------------------------------------
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return HybridSession()
+
+        max_age = int(app.permanent_session_lifetime.total_seconds())
+        try:
+            if value.startswith(COOKIE_PREFIX):
+                return HybridSession(self._signer(app).loads(value[len(COOKIE_PREFIX):], max_age=max_age))
+            if value.startswith(STORED_PREFIX):
+                sid = self._signer(app).loads(value[len(STORED_PREFIX):], max_age=max_age)
+                return HybridSession(self._load_stored(sid), sid=sid)
+        except BadSignature:
+            pass
+        except Exception as e:
+            logging.error(f"❌ Failed to load session: {e}")
+        return HybridSession()
+
+    def _load_stored(self, sid):
+        cached = self._cache_get(sid)
+        if cached is not None:
+            return self.serializer.loads(cached[0])
+        row = self.store.load(sid)
+        if row is None:
+            return {}
+        self._cache_put(sid, row[0], row[1])
+        return self.serializer.loads(row[0])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self._delete_stored(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        try:
+            data = self.serializer.dumps(dict(session))
+            if len(data) <= SESSION_COOKIE_MAX_BYTES:
+                value = COOKIE_PREFIX + self._signer(app).dumps(dict(session))
+                if session.sid:
+                    self._delete_stored(session.sid)
+            else:
+                sid = session.sid or uuid.uuid4().hex
+                expires_at = datetime.utcnow() + app.permanent_session_lifetime
+                self.store.save(sid, data, expires_at)
+                self._cache_put(sid, data, expires_at)
+                value = STORED_PREFIX + self._signer(app).dumps(sid)
+            self._maybe_collect_garbage()
+        except Exception as e:
+            logging.error(f"❌ Failed to save session: {e}")
+            return
+
+        response.set_cookie(
+            name,
+            value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _delete_stored(self, sid):
+        self._cache_drop(sid)
+        try:
+            self.store.delete(sid)
+        except Exception as e:
+            logging.error(f"❌ Failed to delete session {sid}: {e}")
+
+    # --- expiry --------------------------------------------------------------
+
+    def _maybe_collect_garbage(self):
+        now = time.monotonic()
+        if now - self._last_gc < SESSION_GC_INTERVAL:
+            return
+        self._last_gc = now
+        threading.Thread(target=self.purge_expired, name="session-gc", daemon=True).start()
+
+    def purge_expired(self):
+        """Delete every expired server-side session in one statement"""
+        try:
+            count = self.store.delete_expired()
+            if count:
+                logging.info(f"🧹 Removed {count} expired sessions")
+            return count
+        except Exception as e:
+            logging.error(f"❌ Failed to purge expired sessions: {e}")
+            return 0
+
+
+def purge_expired_sessions():
+    """Bulk-delete expired sessions of the configured backend (scheduler entry point)"""
+    return HybridSessionInterface().purge_expired()
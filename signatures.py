@@ -0,0 +1,70 @@
+# signatures.py
+"""
+Signature image normalization.
+
+Drawn signatures arrive from the signup canvas as full-size RGBA PNGs. They are
+normalized once, at signup: the transparent/white margin is trimmed, the ink is
+scaled down to at most SIGNATURE_MAX_WIDTH x SIGNATURE_MAX_HEIGHT and the result
+is stored as a small grey-palette PNG. The SHA-256 of that PNG names the asset,
+so /signature/<hash>.png can be cached by the browser indefinitely.
+"""
+
+import os
+import hashlib
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+SIGNATURE_MAX_WIDTH = int(os.getenv("SIGNATURE_MAX_WIDTH", "400"))
+SIGNATURE_MAX_HEIGHT = int(os.getenv("SIGNATURE_MAX_HEIGHT", "150"))
+SIGNATURE_COLORS = int(os.getenv("SIGNATURE_COLORS", "8"))
+SIGNATURE_PADDING = 4
+INK_THRESHOLD = 245
+
+
+def normalize_signature(image_bytes):
+    """Return the trimmed, downscaled palette PNG of a signature image"""
+    image = Image.open(BytesIO(image_bytes))
+    image.load()
+
+    # Flatten transparency onto white; canvas signatures are black ink on alpha
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    gray = image.convert("L")
+
+    # Trim to the bounding box of the ink
+    ink = gray.point(lambda value: 255 if value < INK_THRESHOLD else 0)
+    bbox = ink.getbbox()
+    if bbox:
+        left, top, right, bottom = bbox
+        gray = gray.crop((
+            max(0, left - SIGNATURE_PADDING),
+            max(0, top - SIGNATURE_PADDING),
+            min(gray.width, right + SIGNATURE_PADDING),
+            min(gray.height, bottom + SIGNATURE_PADDING),
+        ))
+
+    gray.thumbnail((SIGNATURE_MAX_WIDTH, SIGNATURE_MAX_HEIGHT), Image.LANCZOS)
+    gray = ImageOps.autocontrast(gray)
+
+    palette_image = gray.quantize(colors=SIGNATURE_COLORS)
+    buffer = BytesIO()
+    palette_image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def signature_hash(png_bytes):
+    return hashlib.sha256(png_bytes).hexdigest()
+
+
+def prepare_signature(image_bytes):
+    """Normalize a signature and return (png_bytes, hash); the original is kept if it cannot be decoded"""
+    try:
+        png = normalize_signature(image_bytes)
+    except Exception as e:
+        logging.warning(f"⚠️ Could not normalize signature image, storing it as uploaded: {e}")
+        png = image_bytes
+    return png, signature_hash(png)
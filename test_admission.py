@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Test script for admission control of incoming receipts
+"""
+
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import admission
+import health
+import ocr_priority
+from admission import OcrQueue, Overloaded, RateLimiter
+from dispatch import ordered_per_user
+
+def test_rate_limiter():
+    """Test that the token bucket allows bursts and then the configured rate"""
+    print("Testing upload rate limiter...")
+    now = [0.0]
+    limiter = RateLimiter(rate=2, burst=3, clock=lambda: now[0])
+
+    assert [limiter.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert abs(limiter.retry_after() - 0.5) < 1e-9, "one token every 0.5s at 2/s"
+    now[0] = 0.5
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    print("✅ Rate limiter allows bursts, then the steady rate")
+    return True
+
+def test_queue_positions_fifo():
+    """Test that waiting receipts learn their position and run in arrival order"""
+    print("Testing OCR queue positions...")
+    queue = OcrQueue(capacity=1, limit=5)
+    positions = []
+    order = []
+
+    async def receipt(name):
+        async def on_queued(position):
+            positions.append((name, position))
+        async with queue.slot(on_queued=on_queued):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        tasks = []
+        for name in "abcd":
+            tasks.append(asyncio.create_task(receipt(name)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == list("abcd"), f"expected FIFO order, got {order}"
+    assert positions == [("b", 1), ("c", 2), ("d", 3)], positions
+    assert queue.waiting == 0 and queue._running == 0, "slots should all be released"
+    print("✅ Queue positions reported and order kept")
+    return True
+
+def test_full_queue_sheds():
+    """Test that a full queue reports busy, retries, then sheds"""
+    print("Testing load shedding...")
+    saved = admission.ADMISSION_RETRY_SECONDS, admission.ADMISSION_MAX_RETRIES
+    admission.ADMISSION_RETRY_SECONDS, admission.ADMISSION_MAX_RETRIES = 0.01, 2
+    queue = OcrQueue(capacity=1, limit=1)
+    busy = []
+    before = health.snapshot()["counters"].get("admission_shed", 0)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert queue.full()
+
+        async def on_busy():
+            busy.append(True)
+        try:
+            async with queue.slot(on_busy=on_busy):
+                raise AssertionError("a full queue must not admit")
+        except Overloaded:
+            pass
+        release.set()
+        await asyncio.gather(*holders)
+
+    try:
+        asyncio.run(run())
+    finally:
+        admission.ADMISSION_RETRY_SECONDS, admission.ADMISSION_MAX_RETRIES = saved
+    assert busy == [True], "user should be told once that it is retrying"
+    assert health.snapshot()["counters"]["admission_shed"] == before + 1
+    print("✅ Full queue sheds after automatic retries")
+    return True
+
+def test_cancelled_waiter_leaves_line():
+    """Test that a waiter that gives up does not keep its place"""
+    print("Testing cancelled waiters...")
+    queue = OcrQueue(capacity=1, limit=5)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert queue.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert queue.waiting == 0
+        release.set()
+        await holder
+
+    asyncio.run(run())
+    assert queue._running == 0
+    print("✅ Cancelled waiters leave the line")
+    return True
+
+def test_user_pending_limit():
+    """Test that a user with too many waiting updates is told to send later"""
+    print("Testing per-user limit...")
+    replies = []
+    handled = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=42),
+        effective_message=SimpleNamespace(media_group_id=None, reply_text=reply_text),
+    )
+
+    @admission.admit_upload
+    async def handler(update, context):
+        handled.append(update)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def busy_user():
+            async with admission.user_locks.hold(42):
+                await release.wait()
+
+        holders = [asyncio.create_task(busy_user()) for _ in range(admission.USER_PENDING_LIMIT)]
+        await asyncio.sleep(0)
+        await handler(update, None)
+        release.set()
+        await asyncio.gather(*holders)
+        await handler(update, None)
+
+    asyncio.run(run())
+    assert len(replies) == 1 and len(handled) == 1, (replies, handled)
+    print("✅ Per-user limit enforced")
+    return True
+
+def test_priority_order():
+    """Test that retries and single receipts overtake a waiting album"""
+    print("Testing OCR priority order...")
+    queue = OcrQueue(capacity=1, limit=10)
+    order = []
+
+    async def request(name, job_class, cost=1):
+        async with queue.slot(job_class, cost):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        tasks = []
+        for name, job_class, cost in [
+            ("first", ocr_priority.INTERACTIVE, 1),
+            ("album", ocr_priority.BATCH, 5),
+            ("single", ocr_priority.INTERACTIVE, 1),
+            ("retry", ocr_priority.RETRY, 1),
+        ]:
+            tasks.append(asyncio.create_task(request(name, job_class, cost)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["first", "retry", "single", "album"], order
+    print("✅ Retries and single receipts go first")
+    return True
+
+def test_backlog_ages_without_blocking_interactive():
+    """Test that a bulk backlog is spread out and still ages to the front"""
+    print("Testing aging of a bulk backlog...")
+    now = [0.0]
+    clock = ocr_priority.VirtualClock(clock=lambda: now[0])
+
+    backlog = [clock.key(ocr_priority.BULK) for _ in range(100)]
+    now[0] = 10
+    interactive = clock.key(ocr_priority.INTERACTIVE)
+    ahead = sum(1 for key in backlog if key < interactive)
+    assert 0 < ahead < 10, f"only the oldest backlog items should go first, got {ahead}"
+
+    now[0] = backlog[-1]
+    late = clock.key(ocr_priority.INTERACTIVE)
+    assert all(key < late for key in backlog), "waiting backlog must eventually beat new work"
+    assert ocr_priority.job_cost("gstbill_PhonePe") == ocr_priority.GSTBILL_COST
+    print("✅ Backlog interleaves with and ages ahead of interactive work")
+    return True
+
+def test_deferred_upload_keeps_user_order():
+    """Test that a deferred upload runs before the user's later updates and reports failures"""
+    print("Testing deferred upload ordering...")
+    saved = admission.ADMISSION_RETRY_SECONDS, admission.upload_limiter
+    admission.ADMISSION_RETRY_SECONDS = 0.01
+    # Empty bucket: the first upload is deferred, the retry gets a token
+    admission.upload_limiter = RateLimiter(rate=50, burst=1)
+    admission.upload_limiter.try_acquire()
+    order = []
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    def make_update(user_id):
+        return SimpleNamespace(
+            effective_user=SimpleNamespace(id=user_id),
+            effective_message=SimpleNamespace(media_group_id=None, reply_text=reply_text),
+        )
+
+    @admission.admit_upload
+    async def photo(update, context):
+        order.append("photo")
+        if context == "fail":
+            raise RuntimeError("download failed")
+
+    @ordered_per_user
+    async def category_tap(update, context):
+        order.append("tap")
+
+    async def run():
+        await photo(make_update(7), None)
+        await category_tap(make_update(7), None)
+        await asyncio.gather(*admission._deferred_uploads)
+        await photo(make_update(8), "fail")
+        await asyncio.gather(*admission._deferred_uploads)
+
+    try:
+        asyncio.run(run())
+    finally:
+        admission.ADMISSION_RETRY_SECONDS, admission.upload_limiter = saved
+    assert order == ["photo", "tap", "photo"], order
+    assert replies[-1].startswith("❌"), replies
+    print("✅ Deferred uploads keep their place and report failures")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running Admission Control Tests")
+    print("=" * 40)
+
+    tests = [
+        test_rate_limiter,
+        test_queue_positions_fifo,
+        test_full_queue_sheds,
+        test_cancelled_waiter_leaves_line,
+        test_user_pending_limit,
+        test_priority_order,
+        test_backlog_ages_without_blocking_interactive,
+        test_deferred_upload_keeps_user_order
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
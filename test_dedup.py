@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for duplicate receipt detection
+"""
+
+import sys
+import os
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dedup import normalize_transaction_id, image_hash, RecentIndex
+
+def test_normalize_transaction_id():
+    """Test transaction ID normalization"""
+    print("Testing transaction ID normalization...")
+    assert normalize_transaction_id("T2401011234567890123") == "T2401011234567890123"
+    assert normalize_transaction_id(" t2401-0112 3456 ") == "T240101123456"
+    assert normalize_transaction_id("4123 45678901") == "412345678901"
+    assert normalize_transaction_id("Not Found") is None
+    assert normalize_transaction_id("unknown") is None
+    assert normalize_transaction_id("") is None
+    assert normalize_transaction_id(None) is None
+    print("✅ Transaction IDs normalized correctly")
+    return True
+
+def test_image_hash():
+    """Test image hashing of bytes and bytearrays"""
+    print("\nTesting image hash...")
+    assert image_hash(b"receipt") == image_hash(bytearray(b"receipt"))
+    assert image_hash(b"receipt") != image_hash(b"receipt2")
+    assert len(image_hash(b"")) == 64
+    print("✅ Image hashes are stable")
+    return True
+
+def test_recent_index_eviction():
+    """Test LRU eviction of recent receipts"""
+    print("\nTesting recent receipt index...")
+    index = RecentIndex(maxsize=2)
+    index.add("A", {"id": 1})
+    index.add("B", {"id": 2})
+    assert index.get("A") == {"id": 1}  # A becomes most recent
+    index.add("C", {"id": 3})
+    assert index.get("B") is None
+    assert index.get("A") == {"id": 1}
+    assert index.get("C") == {"id": 3}
+    index.add(None, {"id": 4})
+    assert len(index) == 2
+    print("✅ Least recently used receipt evicted")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running Duplicate Detection Tests")
+    print("=" * 40)
+
+    tests = [
+        test_normalize_transaction_id,
+        test_image_hash,
+        test_recent_index_eviction
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for concurrent per-user update dispatching
+"""
+
+import sys
+import os
+import random
+import asyncio
+from types import SimpleNamespace
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dispatch import KeyedLocks, PendingUploads, ordered_per_user, user_locks
+
+def fake_update(user_id, seq):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), seq=seq)
+
+def test_per_user_ordering():
+    """Test that one user's updates run in arrival order"""
+    print("Testing per-user ordering...")
+    handled = []
+
+    @ordered_per_user
+    async def handler(update, context):
+        await asyncio.sleep(random.random() / 200)
+        handled.append((update.effective_user.id, update.seq))
+
+    async def run():
+        await asyncio.gather(*(
+            asyncio.create_task(handler(fake_update(seq % 4, seq), None)) for seq in range(80)
+        ))
+
+    asyncio.run(run())
+    for user_id in range(4):
+        seqs = [seq for uid, seq in handled if uid == user_id]
+        assert seqs == sorted(seqs), f"user {user_id} out of order: {seqs}"
+    assert len(user_locks) == 0, "locks should be released after use"
+    print("✅ Updates ordered per user")
+    return True
+
+def test_users_run_concurrently():
+    """Test that different users do not wait on each other"""
+    print("\nTesting cross-user concurrency...")
+    locks = KeyedLocks()
+    running = []
+    peak = []
+
+    async def work(user_id):
+        async with locks.hold(user_id):
+            running.append(user_id)
+            peak.append(len(running))
+            await asyncio.sleep(0.02)
+            running.remove(user_id)
+
+    async def run():
+        await asyncio.gather(*(work(user_id) for user_id in range(5)))
+
+    asyncio.run(run())
+    assert max(peak) == 5, f"expected 5 concurrent users, saw {max(peak)}"
+    print("✅ Different users processed concurrently")
+    return True
+
+def test_pending_uploads_bounded():
+    """Test that abandoned uploads expire and the oldest are evicted"""
+    print("Testing pending upload bounds...")
+    now = [0.0]
+    uploads = PendingUploads(ttl=60, maxsize=3, clock=lambda: now[0])
+
+    for user_id in range(4):
+        uploads[user_id] = b"image"
+    assert 0 not in uploads, "oldest upload should be evicted beyond maxsize"
+    assert len(uploads) == 3
+
+    now[0] = 30
+    uploads[1] = b"again"
+    now[0] = 70
+    assert uploads.get(2) is None, "upload older than ttl should expire"
+    assert uploads[1] == b"again", "re-stored upload should be kept"
+    assert uploads.pop(1) == b"again" and len(uploads) == 0
+    print("✅ Pending uploads bounded by age and count")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running Dispatcher Tests")
+    print("=" * 40)
+
+    tests = [
+        test_per_user_ordering,
+        test_users_run_concurrently,
+        test_pending_uploads_bounded
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
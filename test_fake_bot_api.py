@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test script for the local fake Telegram Bot API
+"""
+
+import sys
+import os
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotApi, callback_data
+
+KEYBOARD = {"inline_keyboard": [[{"text": "💳 UPI", "callback_data": "upi"}]]}
+
+def call(api, method, **params):
+    """POST form-encoded parameters like python-telegram-bot does"""
+    data = {key: json.dumps(value) if isinstance(value, dict) else value for key, value in params.items()}
+    request = urllib.request.Request(f"{api.url}/bot123:TOKEN/{method}", data=urllib.parse.urlencode(data).encode())
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+def test_updates_long_poll():
+    """Test that getUpdates waits for injected updates and honours the offset"""
+    print("Testing getUpdates...")
+    api = FakeBotApi().start()
+    try:
+        threading.Timer(0.1, api.push_update, args=({"message": {"text": "/start"}},)).start()
+        _, body = call(api, "getUpdates", offset=0, timeout=5)
+        assert [update["update_id"] for update in body["result"]] == [1], body
+        _, body = call(api, "getUpdates", offset=2, timeout=0)
+        assert body["result"] == [], "confirmed updates must not be delivered again"
+    finally:
+        api.stop()
+    print("✅ Long polling works")
+    return True
+
+def test_files_and_messages():
+    """Test file download, sent messages and Telegram-like edit errors"""
+    print("Testing files and messages...")
+    api = FakeBotApi().start()
+    try:
+        api.add_file("photo1", b"jpeg bytes")
+        _, body = call(api, "getFile", file_id="photo1")
+        with urllib.request.urlopen(f"{api.url}/file/bot123:TOKEN/{body['result']['file_path']}") as response:
+            assert response.read() == b"jpeg bytes"
+
+        _, body = call(api, "sendMessage", chat_id=42, text="🔘 Choose the receipt type:", reply_markup=KEYBOARD)
+        message_id = body["result"]["message_id"]
+        index, event = api.wait_for(42, lambda e: "upi" in callback_data(e["reply_markup"]), timeout=1)
+        assert index == 0 and event["message_id"] == message_id
+
+        status, _ = call(api, "editMessageText", chat_id=42, message_id=message_id, text="🔘 Choose the receipt type:", reply_markup=KEYBOARD)
+        assert status == 400, "an unchanged edit is rejected like Telegram does"
+        status, _ = call(api, "editMessageText", chat_id=42, message_id=message_id, text="✅ Data Saved!")
+        assert status == 200
+        status, _ = call(api, "editMessageText", chat_id=42, message_id=999999, text="x")
+        assert status == 400
+        assert api.wait_for(42, lambda e: e["text"] == "never", timeout=0.05) == (None, None)
+    finally:
+        api.stop()
+    print("✅ Files and messages behave like the Bot API")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running Fake Bot API Tests")
+    print("=" * 40)
+
+    tests = [
+        test_updates_long_poll,
+        test_files_and_messages
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
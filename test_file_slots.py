@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for the lock-file semaphore shared by web workers
+"""
+
+import sys
+import os
+import signal
+import tempfile
+import subprocess
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from file_slots import FileSlots
+
+HOLD_SLOT = """
+import sys, time
+sys.path.insert(0, {here!r})
+from file_slots import FileSlots
+FileSlots({directory!r}, 1).try_acquire()
+print("held", flush=True)
+time.sleep(60)
+"""
+
+def test_slots_limit_holders():
+    """Test that no more than ``count`` tokens are handed out"""
+    print("Testing slot limit...")
+    with tempfile.TemporaryDirectory() as directory:
+        slots = FileSlots(directory, 2)
+        first, second = slots.try_acquire(), slots.try_acquire()
+        assert first is not None and second is not None
+        assert slots.try_acquire() is None, "a third holder must be refused"
+        assert slots.acquire(timeout=0.05) is None
+        slots.release(first)
+        third = slots.try_acquire()
+        assert third is not None, "a released slot must be reusable"
+        slots.release(second)
+        slots.release(third)
+    print("✅ Slots limit concurrent holders")
+    return True
+
+def test_killed_holder_frees_slot():
+    """Test that a slot held by a SIGKILLed process is free again"""
+    print("\nTesting killed holder...")
+    with tempfile.TemporaryDirectory() as directory:
+        script = HOLD_SLOT.format(here=os.path.dirname(os.path.abspath(__file__)), directory=directory)
+        holder = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+        try:
+            assert holder.stdout.readline().strip() == "held"
+            slots = FileSlots(directory, 1)
+            assert slots.try_acquire() is None, "slot should be held by the child"
+        finally:
+            holder.send_signal(signal.SIGKILL)
+            holder.wait()
+            holder.stdout.close()
+        token = slots.acquire(timeout=1)
+        assert token is not None, "the kernel must release a dead holder's slot"
+        slots.release(token)
+    print("✅ Killed holder does not leak its slot")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running File Slot Tests")
+    print("=" * 40)
+
+    tests = [
+        test_slots_limit_holders,
+        test_killed_holder_frees_slot
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
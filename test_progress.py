@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script for throttled Telegram progress edits
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from progress import ProgressReporter
+
+def test_updates_coalesced_and_throttled():
+    """Test that rapid stage updates become few, spaced edits"""
+    print("Testing progress throttling...")
+    edits = []
+
+    async def edit(text, **kwargs):
+        edits.append((time.monotonic(), text, kwargs))
+
+    async def run():
+        progress = ProgressReporter(edit, interval=0.05)
+        for stage in ("downloaded", "preprocessed", "text found"):
+            progress.update(stage)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        progress.update("parsed")
+        await progress.finish("saved", reply_markup="keyboard")
+        progress.update("late")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    texts = [text for _, text, _ in edits]
+    assert texts[0] == "downloaded", texts
+    assert "preprocessed" not in texts, f"superseded stage should be dropped: {texts}"
+    assert texts[-1] == "saved" and edits[-1][2] == {"reply_markup": "keyboard"}, texts
+    assert "late" not in texts, "updates after finish are ignored"
+    gaps = [later[0] - earlier[0] for earlier, later in zip(edits, edits[1:])]
+    assert all(gap >= 0.045 for gap in gaps), f"edits closer than the interval: {gaps}"
+    print("✅ Progress edits coalesced and throttled")
+    return True
+
+def test_update_from_thread():
+    """Test that OCR threads can report stages"""
+    print("Testing updates from worker threads...")
+    edits = []
+
+    async def edit(text, **kwargs):
+        edits.append(text)
+
+    async def run():
+        progress = ProgressReporter(edit, interval=0)
+        worker = threading.Thread(target=progress.update, args=("text found",))
+        worker.start()
+        await asyncio.to_thread(worker.join)
+        await asyncio.sleep(0.01)
+        await progress.finish("done")
+
+    asyncio.run(run())
+    assert edits == ["text found", "done"], edits
+    print("✅ Stages reported from threads")
+    return True
+
+def test_failed_final_edit_reported():
+    """Test that a failed final edit is logged and returned, not raised"""
+    print("Testing failed final edit...")
+
+    async def edit(text, **kwargs):
+        raise RuntimeError("Bad Request: message is not modified")
+
+    async def run():
+        progress = ProgressReporter(edit, interval=0)
+        return await progress.finish("done")
+
+    assert asyncio.run(run()) is False
+    print("✅ Final edit failure does not escape")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running Progress Tests")
+    print("=" * 40)
+
+    tests = [
+        test_updates_coalesced_and_throttled,
+        test_update_from_thread,
+        test_failed_final_edit_reported
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
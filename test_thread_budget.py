@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test script for the native thread budget
+"""
+
+import sys
+import os
+from unittest import mock
+
+# Add the project directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import thread_budget
+
+BUDGET_VARS = ("THREAD_BUDGET_PROCESSES", "THREAD_BUDGET_RESERVE", "OCR_CONCURRENCY",
+               "PREPROCESS_WORKERS", "OCR_CPU_THREADS", "BLAS_THREADS", "OPENCV_THREADS")
+
+def budget_for(cores, **env):
+    clean = {name: value for name, value in os.environ.items() if name not in BUDGET_VARS}
+    clean.update({name: str(value) for name, value in env.items()})
+    with mock.patch.dict(os.environ, clean, clear=True), \
+         mock.patch.object(thread_budget, "available_cores", return_value=cores):
+        return thread_budget.compute_budget()
+
+def test_cores_split_between_engines():
+    """Test that OCR engines share the usable cores instead of each taking all of them"""
+    print("Testing engine split...")
+    budget = budget_for(16, OCR_CONCURRENCY=3, PREPROCESS_WORKERS=3)
+    assert budget["usable_cores"] == 15, budget
+    assert budget["paddle_cpu_threads"] == 5, budget
+    assert budget["paddle_cpu_threads"] * budget["ocr_engines"] <= budget["cores"]
+    assert budget["opencv_threads"] == 5, budget
+    assert budget["blas_threads"] == budget["paddle_cpu_threads"]
+    print("✅ Cores split between engines")
+    return True
+
+def test_processes_share_machine():
+    """Test that several OCR processes divide the machine between them"""
+    print("\nTesting process split...")
+    budget = budget_for(8, THREAD_BUDGET_PROCESSES=4, OCR_CONCURRENCY=1, PREPROCESS_WORKERS=1)
+    assert budget["usable_cores"] == 2, budget
+    assert budget["paddle_cpu_threads"] == 2, budget
+    tiny = budget_for(1, OCR_CONCURRENCY=4)
+    assert min(tiny["paddle_cpu_threads"], tiny["opencv_threads"], tiny["blas_threads"]) == 1, tiny
+    print("✅ Processes share the machine, never below one thread")
+    return True
+
+def test_explicit_overrides():
+    """Test that explicit thread counts win over the computed budget"""
+    print("\nTesting overrides...")
+    budget = budget_for(32, OCR_CPU_THREADS=6, OPENCV_THREADS=2, BLAS_THREADS=1)
+    assert (budget["paddle_cpu_threads"], budget["opencv_threads"], budget["blas_threads"]) == (6, 2, 1), budget
+    print("✅ Overrides respected")
+    return True
+
+def test_derived_limits_recorded():
+    """Test that configure() records the BLAS limits it derived, not the operator's"""
+    print("\nTesting exported BLAS limits...")
+    clean = {name: value for name, value in os.environ.items()
+             if name not in BUDGET_VARS + thread_budget.BLAS_ENV_VARS}
+    clean["MKL_NUM_THREADS"] = "3"
+    with mock.patch.dict(os.environ, clean, clear=True), \
+         mock.patch.object(thread_budget, "available_cores", return_value=4), \
+         mock.patch.object(thread_budget, "exported", []), \
+         mock.patch.dict(thread_budget.budget, clear=True):
+        thread_budget.configure()
+        assert "MKL_NUM_THREADS" not in thread_budget.exported, thread_budget.exported
+        assert os.environ["MKL_NUM_THREADS"] == "3", "explicit setting must win"
+        assert "OMP_NUM_THREADS" in thread_budget.exported
+        assert os.environ["OMP_NUM_THREADS"] == str(thread_budget.budget["blas_threads"])
+    print("✅ Derived limits recorded for child processes")
+    return True
+
+def main():
+    """Main test function"""
+    print("Running Thread Budget Tests")
+    print("=" * 40)
+
+    tests = [
+        test_cores_split_between_engines,
+        test_processes_share_machine,
+        test_explicit_overrides,
+        test_derived_limits_recorded
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except AssertionError as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print("\n" + "=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return 0
+    else:
+        print("💥 Some tests failed!")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# thread_budget.py
+"""
+Explicit thread counts for the native libraries used by OCR.
+
+Paddle (intra-op / MKL), OpenCV's parallel_for pool and BLAS each default to
+"one thread per core". With several OCR engines, preprocessing threads and
+worker processes running at once that multiplies into many times more busy
+threads than cores, and throughput collapses under load. This module splits the
+cores of the machine between them instead:
+
+    usable cores      = available cores / THREAD_BUDGET_PROCESSES - THREAD_BUDGET_RESERVE
+    paddle threads    = usable / OCR engines in this process           (OCR_CPU_THREADS overrides)
+    BLAS / OMP        = paddle threads                                  (BLAS_THREADS overrides)
+    OpenCV threads    = usable / concurrent preprocessing threads       (OPENCV_THREADS overrides)
+
+THREAD_BUDGET_PROCESSES is the number of OCR processes sharing the machine; set
+it when running several ocr-worker roles. bulk_ingest and the OCR worker pool
+give their child processes this value times the pool size.
+``configure()`` must run before numpy/paddle are imported because the BLAS and
+OpenMP runtimes read their environment variables only once.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLAS_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+budget = {}
+# BLAS/OpenMP variables set by configure() rather than by the operator
+exported = []
+_opencv_configured = False
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def compute_budget():
+    cores = available_cores()
+    processes = max(1, env_int("THREAD_BUDGET_PROCESSES", 1))
+    per_process = max(1, cores // processes)
+    # Keep a core for the event loop, web threads and database I/O once there are enough
+    reserve = env_int("THREAD_BUDGET_RESERVE", 1 if per_process > 2 else 0)
+    usable = max(1, per_process - reserve)
+
+    ocr_engines = max(1, env_int("OCR_CONCURRENCY", 1))
+    preprocess_threads = max(ocr_engines, env_int("PREPROCESS_WORKERS", 4))
+
+    paddle_threads = env_int("OCR_CPU_THREADS", max(1, usable // ocr_engines))
+    return {
+        "cores": cores,
+        "processes": processes,
+        "usable_cores": usable,
+        "ocr_engines": ocr_engines,
+        "preprocess_threads": preprocess_threads,
+        "paddle_cpu_threads": paddle_threads,
+        "blas_threads": env_int("BLAS_THREADS", paddle_threads),
+        "opencv_threads": env_int("OPENCV_THREADS", max(1, usable // preprocess_threads)),
+    }
+
+
+def configure():
+    """Compute the budget and export the BLAS/OpenMP limits; call before importing numpy."""
+    budget.clear()
+    budget.update(compute_budget())
+    for name in BLAS_ENV_VARS:
+        # An explicit setting in the environment always wins
+        if name not in os.environ or name in exported:
+            os.environ[name] = str(budget["blas_threads"])
+            if name not in exported:
+                exported.append(name)
+    logger.info(
+        f"🧮 Thread budget: {budget['usable_cores']}/{budget['cores']} cores, "
+        f"paddle {budget['paddle_cpu_threads']} x {budget['ocr_engines']} engines, "
+        f"opencv {budget['opencv_threads']}, blas {budget['blas_threads']}"
+    )
+    return budget
+
+
+def current():
+    if not budget:
+        configure()
+    return budget
+
+
+def configure_opencv():
+    """Size OpenCV's thread pool once per process; cheap to call on every image."""
+    global _opencv_configured
+    if _opencv_configured:
+        return
+    import cv2
+    cv2.setNumThreads(current()["opencv_threads"])
+    _opencv_configured = True
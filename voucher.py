@@ -3,14 +3,12 @@ import json
 import requests
 from apscheduler.schedulers.background import BackgroundScheduler
 import pytz
-import bcrypt
 import logging  # Standard library logging
 import psycopg2
 import base64
 import uuid
 from flask import Flask, request, jsonify, render_template, redirect, url_for, session, send_file, get_flashed_messages
 from flask import flash as flask_flash  # Import flash with alias to avoid conflicts
-from flask_session import Session
 from datetime import datetime, timedelta
 from io import BytesIO
 from email.message import EmailMessage
@@ -21,13 +19,19 @@ from PyPDF2 import PdfReader, PdfWriter
 voucher_data = {}
 
 # Import user management functions
-from database import init_db, register_user, get_user_by_email, get_user_by_username, get_pending_users, update_user_status, get_user_by_id, get_accepted_users, get_rejected_users, register_admin, get_admin_by_email, add_email, get_all_emails, update_email, delete_email, email_exists_in_list
+from sessions import HybridSessionInterface
+from signatures import prepare_signature
+from passwords import hash_password, verify_password, needs_rehash, rehash_in_background, PasswordServiceBusy
+from database import init_db, register_user, get_user_by_email, get_user_by_username, update_user_status, get_user_by_id, get_signature_image, update_user_signature, get_user_status_counts, get_user_sections, USER_STATUSES, register_admin, get_admin_by_email, add_email, get_all_emails, update_email, delete_email, email_exists_in_list, get_status_counts, get_pending_receipts
 
 # Flask app
 voucher_app = Flask(__name__)
-voucher_app.secret_key = 'your-secret-key-here'  # Change this to a secure secret key in production
-voucher_app.config['SESSION_TYPE'] = 'filesystem'
-Session(voucher_app)
+# Signs the session cookies, which carry admin_id; a guessable default would let anyone forge an admin session
+FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY")
+if not FLASK_SECRET_KEY:
+    raise RuntimeError("FLASK_SECRET_KEY must be set; it signs the session cookies")
+voucher_app.secret_key = FLASK_SECRET_KEY
+voucher_app.session_interface = HybridSessionInterface()
 
 # Path to your logo file (place logo.png in a folder called 'static')
 LOGO_PATH = "static/logo.png"
@@ -190,55 +194,36 @@ def send_gst_bill_notification(transaction_id, account_name, amount):
     except Exception as e:
         logging.error(f"❌ Error sending GST Bill notification: {e}")
 
-def get_last_24h_status():
-    """Return pending and completed counts from last 24 hours as text, including pending transaction IDs."""
-    try:
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        cur = conn.cursor()
-
-        yesterday = datetime.now(pytz.timezone("Asia/Kolkata")) - timedelta(hours=24)
+def get_last_24h_status(hours=24):
+    """Return pending and completed counts from the last 24 hours as text, including pending transaction IDs.
 
-        # Get counts
-        cur.execute("""
-            SELECT status, COUNT(*)
-            FROM extracted_receipts
-            WHERE created_at >= %s
-            GROUP BY status;
-        """, (yesterday,))
-        results = cur.fetchall()
-
-        pending_count = 0
-        completed_count = 0
-        for status, count in results:
-            if status and status.lower() == "pending":
-                pending_count = count
-            elif status and status.lower() == "completed":
-                completed_count = count
-
-        # Get transaction IDs for pending tasks
-        cur.execute("""
-            SELECT transaction_id, person_name
-            FROM extracted_receipts
-            WHERE created_at >= %s AND LOWER(status) = 'pending'
-            ORDER BY created_at DESC;
-        """, (yesterday,))
-        pending_records = cur.fetchall()
+    Counts come from the hourly rollup (receipt_status_hourly), so the cost
+    does not grow with receipt volume; only the 10 newest pending rows are read.
+    Both count from the start of the hour ``hours`` ago, so the window is up to
+    an hour longer than ``hours``.
+    """
+    try:
+        since = datetime.now(pytz.timezone("Asia/Kolkata")) - timedelta(hours=hours)
 
-        cur.close()
-        conn.close()
+        counts = get_status_counts(since)
+        if counts is None:
+            return "Error fetching status."
+        pending_count = counts.get("pending", 0)
+        completed_count = counts.get("completed", 0)
 
-        # Format pending IDs (limit to avoid huge messages)
+        # Get transaction IDs for pending tasks (limit to avoid huge messages)
+        pending_records = get_pending_receipts(since, limit=10)
         if pending_records:
-            pending_list = "\n".join([f"🔹 {txn} — {name}" for txn, name in pending_records[:10]])
-            if len(pending_records) > 10:
-                pending_list += f"\n... and {len(pending_records) - 10} more"
+            pending_list = "\n".join([f"🔹 {txn} — {name}" for txn, name in pending_records])
+            if pending_count > len(pending_records):
+                pending_list += f"\n... and {pending_count - len(pending_records)} more"
         else:
-            pending_list = "✅ No pending tasks in last 24h"
+            pending_list = f"✅ No pending tasks in last {hours}h"
 
         return (
-            "📢 **Daily Work Summary (Last 24h)**\n"
+            f"📢 **Daily Work Summary (Last {hours}h)**\n"
             "━━━━━━━━━━━━━━━━━━\n"
-            f"🕒 Period: {yesterday.strftime('%d-%b %H:%M')} → Now\n"
+            f"🕒 Period: from the hour of {since.strftime('%d-%b %H:%M')} → Now\n"
             f"📌 Pending: {pending_count}\n"
             f"✅ Completed: {completed_count}\n"
             "━━━━━━━━━━━━━━━━━━\n"
@@ -272,12 +257,13 @@ def signup():
             
             # Handle signature data - could be base64 image or plain text
             signature_image_data = None
+            signature_digest = None
             if esignature and esignature.startswith('data:image/') and ';base64,' in esignature:
                 # It's a base64 image, extract the image data
                 try:
-                    # Extract base64 data from data URL
+                    # Extract base64 data from data URL, then trim/downscale it once for every later voucher view
                     header, encoded = esignature.split(',', 1)
-                    signature_image_data = base64.b64decode(encoded)
+                    signature_image_data, signature_digest = prepare_signature(base64.b64decode(encoded))
                     # Use placeholder text for display
                     processed_signature = "[Drawn Signature]"
                 except Exception as e:
@@ -303,7 +289,7 @@ def signup():
                 return render_template("signup.html", transaction_id=transaction_id, voucher_type=voucher_type)
             
             # Hash the password
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            hashed_password = hash_password(password)
             
             # Check if email exists in email list
             if email_exists_in_list(email):
@@ -318,7 +304,7 @@ def signup():
                 flash_category = "error"
             
             # Register the user with the determined status
-            user_id = register_user(username, email, hashed_password, processed_signature, signature_image_data, status)
+            user_id = register_user(username, email, hashed_password, processed_signature, signature_image_data, status, signature_digest)
             
             if user_id:
                 flask_flash(flash_message, flash_category)
@@ -348,7 +334,14 @@ def login():
         password = request.form["password"]
         
         user = get_user_by_email(email)
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+        try:
+            password_ok = bool(user) and verify_password(password, user['password'])
+        except PasswordServiceBusy:
+            flask_flash("The server is busy. Please try again in a moment.", "warning")
+            return render_template("login.html")
+        if password_ok and needs_rehash(user['password']):
+            rehash_in_background(user['id'], password)
+        if password_ok:
             # Check user status
             if user['status'] == 'accepted':
                 session['user_id'] = user['id']
@@ -535,14 +528,25 @@ def admin_dashboard():
         return redirect(url_for('admin_login'))
     
     # Get user statistics
-    pending_users = get_pending_users()
-    accepted_users = get_accepted_users()
-    rejected_users = get_rejected_users()
+    user_counts = get_user_status_counts()
     
-    return render_template('admin_dashboard.html', 
-                         pending_users=pending_users,
-                         accepted_users=accepted_users,
-                         rejected_users=rejected_users)
+    return render_template('admin_dashboard.html', user_counts=user_counts)
+
+USERS_PAGE_SIZE = int(os.getenv("ADMIN_USERS_PAGE_SIZE", "50"))
+
+def encode_page_cursor(key):
+    """Turn a (created_at, id) keyset position into a URL parameter"""
+    if not key:
+        return None
+    created_at, user_id = key
+    return f"{created_at.isoformat()}_{user_id}"
+
+def decode_page_cursor(value):
+    try:
+        created_at, user_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (AttributeError, ValueError):
+        return None
 
 @voucher_app.route("/admin/users")
 def admin_user_management():
@@ -550,15 +554,35 @@ def admin_user_management():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
     
-    # Get all users
-    pending_users = get_pending_users()
-    accepted_users = get_accepted_users()
-    rejected_users = get_rejected_users()
+    # One page per status section; each section pages independently via <status>_after
+    search = request.args.get('q', '').strip() or None
+    cursors = {status: request.args.get(f'{status}_after') for status in USER_STATUSES}
+    pages = get_user_sections(
+        {status: decode_page_cursor(cursor) for status, cursor in cursors.items()},
+        limit=USERS_PAGE_SIZE,
+        search=search
+    )
+
+    def page_url(status, cursor):
+        # Paging one section keeps the other sections where they are
+        args = {f'{name}_after': value for name, value in cursors.items() if value and name != status}
+        if cursor:
+            args[f'{status}_after'] = cursor
+        return url_for('admin_user_management', q=search, **args) + f'#{status}'
+
+    sections = {}
+    for status, page in pages.items():
+        next_cursor = encode_page_cursor(page['next'])
+        sections[status] = {
+            'users': page['users'],
+            'count': page['count'],
+            'first_url': page_url(status, None) if cursors[status] else None,
+            'next_url': page_url(status, next_cursor) if next_cursor else None
+        }
     
-    return render_template('admin_users.html', 
-                         pending_users=pending_users,
-                         accepted_users=accepted_users,
-                         rejected_users=rejected_users)
+    return render_template('admin_users.html',
+                         sections=sections,
+                         search=search or '')
 
 @voucher_app.route("/display_voucher", methods=["GET"])
 def display_voucher():
@@ -622,21 +646,26 @@ def display_voucher():
             ''')
             row = cur.fetchone()
 
-        # Get user's e-signature and signature image from the users table
+        # Get user's e-signature and the URL of their signature image
         user_esignature = ''
-        user_signature_image_base64 = ''
+        user_signature_url = ''
         if 'user_id' in session:
+            # The image itself is only read for signatures stored before normalization existed
             cur.execute('''
-                SELECT esignature, signature_image
+                SELECT esignature, signature_hash,
+                       CASE WHEN signature_hash IS NULL THEN signature_image END
                 FROM users
                 WHERE id = %s
             ''', (session['user_id'],))
             user_row = cur.fetchone()
             if user_row:
                 user_esignature = user_row[0] or ''
-                # Convert signature image to base64 if it exists
-                if user_row[1]:
-                    user_signature_image_base64 = 'data:image/png;base64,' + base64.b64encode(user_row[1]).decode('utf-8')
+                signature_digest = user_row[1]
+                if not signature_digest and user_row[2]:
+                    signature_png, signature_digest = prepare_signature(bytes(user_row[2]))
+                    update_user_signature(session['user_id'], signature_png, signature_digest)
+                if signature_digest:
+                    user_signature_url = url_for('signature_asset', signature_digest=signature_digest)
 
         cur.close()
         conn.close()
@@ -648,7 +677,7 @@ def display_voucher():
             "transaction_id": row[0] if row else '',
             "amount": row[1] if row else '',
             "user_esignature": user_esignature,
-            "user_signature_image": user_signature_image_base64
+            "user_signature_image": user_signature_url
         }
 
         # ⭐ CHANGED: Use render_template instead of render_template_string
@@ -659,6 +688,31 @@ def display_voucher():
         # ⭐ CHANGED: Use render_template instead of render_template_string
         return render_template('voucher.html', data={"Sl No": "BCPL1"}, voucher_type='')
 
+SIGNATURE_CACHE_SIZE = int(os.getenv("SIGNATURE_CACHE_SIZE", "256"))
+signature_cache = {}
+
+@voucher_app.route("/signature/<signature_digest>.png")
+def signature_asset(signature_digest):
+    """Serve a normalized signature; the URL is its content hash, so it never changes"""
+    if 'user_id' not in session and 'admin_id' not in session:
+        return "", 403
+    if request.if_none_match.contains(signature_digest):
+        return "", 304
+
+    png = signature_cache.get(signature_digest)
+    if png is None:
+        png = get_signature_image(signature_digest)
+        if png is None:
+            return "", 404
+        if len(signature_cache) >= SIGNATURE_CACHE_SIZE:
+            signature_cache.clear()
+        signature_cache[signature_digest] = png
+
+    response = voucher_app.response_class(png, mimetype="image/png")
+    response.set_etag(signature_digest)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
 @voucher_app.route("/logout")
 def logout():
     session.clear()
@@ -692,25 +746,6 @@ def save_voucher():
         lat = float(location_lat) if location_lat else None
         lng = float(location_lng) if location_lng else None
 
-        # ⭐ NEW: Get user's signature image from database if available
-        signature_image_data = None
-        if 'user_id' in session:
-            try:
-                conn_users = psycopg2.connect(**DATABASE_CONFIG)
-                cur_users = conn_users.cursor()
-                cur_users.execute('''
-                    SELECT signature_image
-                    FROM users
-                    WHERE id = %s
-                ''', (session['user_id'],))
-                user_row = cur_users.fetchone()
-                if user_row and user_row[0]:
-                    signature_image_data = user_row[0]
-                cur_users.close()
-                conn_users.close()
-            except Exception as e:
-                logging.error(f"Error fetching user signature image: {e}")
-
         conn = psycopg2.connect(**DATABASE_CONFIG)
         cur = conn.cursor()
         
@@ -750,7 +785,8 @@ def save_voucher():
                 slno, date, account_name, debit, credit, amount, time,
                 reason, procured_from, location, location_lat, location_lng,
                 additional_receipt, additional_receipt2, receiver_signature, signature_image, image
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                      (SELECT signature_image FROM users WHERE id = %s), %s)
             RETURNING id;
         ''', (
             data['slno'],
@@ -768,7 +804,7 @@ def save_voucher():
             additional_receipt.read() if additional_receipt else None,
             last_page_pdf_bytes,  # Store the last page of the PDF for GST bills
             data['receiver_signature'],
-            signature_image_data,  # Add signature image data
+            session.get('user_id'),  # Signature image is copied from users inside the INSERT
             psycopg2.Binary(image_bytes)
         ))
         print("444444444")
@@ -1098,7 +1134,25 @@ def modify_pdf_with_voucher():
         logging.error(f"❌ Error modifying PDF with voucher image: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# Run
+# Liveness / readiness probes for the web tier
+@voucher_app.route('/healthz')
+def healthz():
+    return jsonify({"status": "alive"})
+
+@voucher_app.route('/readyz')
+def readyz():
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **DATABASE_CONFIG)
+        cur = conn.cursor()
+        cur.execute("SELECT 1;")
+        cur.close()
+        conn.close()
+        return jsonify({"ready": True})
+    except Exception as e:
+        logging.error(f"❌ Readiness check failed: {e}")
+        return jsonify({"ready": False, "error": str(e)}), 503
+
+# Run (development server; use wsgi.py with gunicorn in production)
 def run_voucher_app(host='0.0.0.0', port=5000, use_reloader=False):
     init_db()
     voucher_app.run(host=host, port=port, use_reloader=use_reloader)
\ No newline at end of file
@@ -0,0 +1,15 @@
+"""
+WSGI entry point for the voucher web app.
+
+Serves voucher_app under gunicorn, separate from the Telegram bot and its OCR
+engine, so web requests get their own processes and GIL:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Graceful reload (new code, zero dropped requests): kill -HUP <gunicorn master pid>
+When the web tier runs this way, start the bot with VOUCHER_SERVER_MODE=external.
+"""
+
+from voucher import voucher_app as application
+
+__all__ = ["application"]